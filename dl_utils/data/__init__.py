@@ -12,7 +12,10 @@ if TYPE_CHECKING:
     from .array import *
     from .download import *
     from .image import *
+    from .json_codec import *
+    from .jsonl_columns import *
     from .lmdb import *
+    from .lmdb_dataset import *
     from .normalize import *
     from .sample import *
     from .save_and_load import *
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+# @Time    : 10/18/26
+# @Author  : Yaojie Shen
+# @Project : Deep-Learning-Utils
+# @File    : json_codec.py
+
+import json
+from functools import lru_cache
+from typing import Any, Dict, Optional, Union
+
+from ..import_utils import is_msgspec_available, is_orjson_available, is_ujson_available
+
+__all__ = [
+    "JsonCodec",
+    "available_json_backends",
+    "get_json_backend",
+    "set_json_backend",
+    "get_json_codec",
+]
+
+# Preference order used by the ``"auto"`` backend
+_AUTO_BACKENDS = ("orjson", "msgspec", "ujson", "json")
+
+_json_backend = "auto"
+
+
+class _JsonBytesEncoder(json.JSONEncoder):
+    """Object of type bytes is not JSON serializable, convert it to string before saving"""
+
+    def default(self, obj):
+        """Convert ``bytes`` values to UTF-8 strings before JSON encoding.
+
+        Args:
+            obj: Object to encode.
+
+        Returns:
+            A JSON-serializable representation of ``obj``.
+        """
+
+        if isinstance(obj, bytes):  # bytes->str
+            return str(obj, encoding="utf-8")
+        return json.JSONEncoder.default(self, obj)
+
+
+def _bytes_default(obj):
+    """``default`` hook of the fast encoders, same semantics as :class:`_JsonBytesEncoder`."""
+
+    if isinstance(obj, bytes):
+        return str(obj, encoding="utf-8")
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class JsonCodec:
+    """JSON encoder/decoder backed by the standard library.
+
+    Subclasses swap in a faster third-party library. They all share the
+    semantics of the stdlib codec used by :mod:`dl_utils.data.save_and_load`:
+
+    - ``bytes`` values are encoded as UTF-8 strings.
+    - Calls with extra :func:`json.dumps` keyword arguments (``indent``,
+      ``sort_keys``, ``cls``...) always use the standard library, since the fast
+      libraries do not support the same options.
+    - Objects a fast encoder rejects (e.g. integers wider than 64 bits) and
+      documents a fast decoder rejects (e.g. ``NaN`` literals) are retried with
+      the standard library.
+
+    Output of the fast encoders is compact and not ASCII-escaped, which is still
+    valid JSON. Note that ``orjson`` writes ``NaN`` and infinity as ``null``.
+    The default ``"auto"`` backend therefore only decodes with a fast library and
+    keeps encoding with the standard library; name a backend explicitly to
+    encode with it as well.
+    """
+
+    name = "json"
+
+    def dumps(self, obj, **kwargs) -> str:
+        """Serialize ``obj`` to a JSON string.
+
+        Args:
+            obj: Object to serialize.
+            **kwargs: Extra keyword arguments forwarded to :func:`json.dumps`.
+
+        Returns:
+            The JSON document as ``str``.
+        """
+
+        return self._stdlib_dumps(obj, **kwargs)
+
+    def dumps_bytes(self, obj, **kwargs) -> bytes:
+        """Serialize ``obj`` to UTF-8 encoded JSON bytes."""
+
+        return self.dumps(obj, **kwargs).encode("utf-8")
+
+    def loads(self, data: Union[str, bytes, bytearray, memoryview]) -> Any:
+        """Deserialize a JSON document from ``str`` or UTF-8 bytes."""
+
+        return self._stdlib_loads(data)
+
+    @staticmethod
+    def _stdlib_dumps(obj, **kwargs) -> str:
+        _kwargs = {"cls": _JsonBytesEncoder}
+        _kwargs.update(kwargs)
+        return json.dumps(obj, **_kwargs)
+
+    @staticmethod
+    def _stdlib_loads(data) -> Any:
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return json.loads(data)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(name={self.name!r})"
+
+
+class _OrjsonCodec(JsonCodec):
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+
+        self._orjson = orjson
+        # Stringify int/float/bool/None keys like the standard library does
+        self._option = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, **kwargs) -> str:
+        return self.dumps_bytes(obj, **kwargs).decode("utf-8")
+
+    def dumps_bytes(self, obj, **kwargs) -> bytes:
+        if kwargs:
+            return self._stdlib_dumps(obj, **kwargs).encode("utf-8")
+        try:
+            return self._orjson.dumps(obj, default=_bytes_default, option=self._option)
+        except TypeError:
+            return self._stdlib_dumps(obj).encode("utf-8")
+
+    def loads(self, data) -> Any:
+        try:
+            return self._orjson.loads(data)
+        except ValueError:
+            return self._stdlib_loads(data)
+
+
+class _UjsonCodec(JsonCodec):
+    name = "ujson"
+
+    def __init__(self):
+        import ujson
+
+        self._ujson = ujson
+
+    def dumps(self, obj, **kwargs) -> str:
+        if kwargs:
+            return self._stdlib_dumps(obj, **kwargs)
+        try:
+            return self._ujson.dumps(
+                obj,
+                ensure_ascii=False,
+                escape_forward_slashes=False,
+                default=_bytes_default,
+            )
+        except (TypeError, OverflowError):
+            return self._stdlib_dumps(obj)
+
+    def loads(self, data) -> Any:
+        try:
+            if isinstance(data, memoryview):
+                data = data.tobytes()
+            return self._ujson.loads(data)
+        except ValueError:
+            return self._stdlib_loads(data)
+
+
+class _MsgspecCodec(JsonCodec):
+    """Decode with ``msgspec``.
+
+    ``msgspec`` encodes ``bytes`` as base64 without calling ``enc_hook``, which
+    would silently change the written data, so encoding uses the standard
+    library.
+    """
+
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec.json
+
+        self._decoder = msgspec.json.Decoder()
+
+    def loads(self, data) -> Any:
+        try:
+            return self._decoder.decode(data)
+        except Exception:  # msgspec.DecodeError does not derive from ValueError
+            return self._stdlib_loads(data)
+
+
+class _AutoCodec(JsonCodec):
+    """Codec of the ``"auto"`` backend.
+
+    Decodes with the fastest installed library and encodes with the standard
+    library, so written files keep their format and non-finite floats.
+    """
+
+    name = "auto"
+
+    def __init__(self, decoder: JsonCodec):
+        self._decoder = decoder
+
+    def loads(self, data) -> Any:
+        return self._decoder.loads(data)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(decoder={self._decoder.name!r})"
+
+
+_CODEC_CLASSES = {
+    "json": JsonCodec,
+    "orjson": _OrjsonCodec,
+    "ujson": _UjsonCodec,
+    "msgspec": _MsgspecCodec,
+}
+
+_AVAILABILITY = {
+    "json": lambda: True,
+    "orjson": is_orjson_available,
+    "ujson": is_ujson_available,
+    "msgspec": is_msgspec_available,
+}
+
+_codecs: Dict[str, JsonCodec] = {}
+
+
+def available_json_backends() -> list:
+    """Return the names of the JSON backends installed in this environment."""
+
+    return [name for name in _AUTO_BACKENDS if _AVAILABILITY[name]()]
+
+
+@lru_cache(maxsize=None)
+def _auto_backend() -> str:
+    return available_json_backends()[0]
+
+
+def _resolve_backend(name: Optional[str]) -> str:
+    name = _json_backend if name is None else name
+    if name == "auto":
+        return _auto_backend()
+    if name not in _CODEC_CLASSES:
+        raise ValueError(
+            f"Unknown JSON backend {name!r}. "
+            f"Expected 'auto' or one of {sorted(_CODEC_CLASSES)}."
+        )
+    if not _AVAILABILITY[name]():
+        raise ImportError(f"JSON backend {name!r} requires `pip install {name}`.")
+    return name
+
+
+def set_json_backend(name: str):
+    """Set the global JSON backend.
+
+    The global backend is used by :func:`save_json`, :func:`load_json`,
+    :func:`save_jsonl`, :func:`iter_jsonl` and :class:`JsonLmdb` whenever no
+    backend is given per call.
+
+    Args:
+        name: ``"auto"`` (default) to decode with the fastest installed library
+            and encode with the standard library, or one of ``"orjson"``,
+            ``"msgspec"``, ``"ujson"`` and ``"json"`` to use that library for
+            both. Encoding with ``"orjson"`` writes ``NaN`` and infinity as
+            ``null``.
+    """
+
+    global _json_backend
+    _resolve_backend(name)  # Validate eagerly
+    _json_backend = name
+
+
+def get_json_backend() -> str:
+    """Return the name of the library currently used for decoding by default."""
+
+    return _resolve_backend(None)
+
+
+def get_json_codec(name: Optional[str] = None) -> JsonCodec:
+    """Return the codec of a JSON backend.
+
+    Args:
+        name: Backend name, see :func:`set_json_backend`. ``None`` uses the
+            global backend.
+
+    Returns:
+        A shared :class:`JsonCodec` instance.
+    """
+
+    if (_json_backend if name is None else name) == "auto":
+        codec = _codecs.get("auto")
+        if codec is None:
+            codec = _codecs["auto"] = _AutoCodec(get_json_codec(_auto_backend()))
+        return codec
+
+    name = _resolve_backend(name)
+    codec = _codecs.get(name)
+    if codec is None:
+        codec = _codecs[name] = _CODEC_CLASSES[name]()
+    return codec
@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+# @Time    : 10/18/26
+# @Author  : Yaojie Shen
+# @Project : Deep-Learning-Utils
+# @File    : jsonl_columns.py
+
+import json
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Union
+
+import numpy as np
+from filelock import FileLock
+
+from .save_and_load import PathLike, iter_jsonl
+
+__all__ = [
+    "StringColumn",
+    "build_jsonl_columns",
+    "load_jsonl_columns",
+]
+
+_COLUMNS_SUFFIX = ".columns"
+_COLUMNS_VERSION = 1
+# Records converted to numpy at once while building, bounds the Python objects alive
+_BUILD_CHUNK_SIZE = 1 << 20
+# Widening order of numeric column kinds
+_NUMERIC_KINDS = ("bool", "int", "float")
+_NUMERIC_DTYPES = {"bool": np.bool_, "int": np.int64, "float": np.float64}
+
+
+class StringColumn:
+    """Offset-encoded string column loaded by :func:`load_jsonl_columns`.
+
+    The UTF-8 bytes of all values are stored back to back in ``data`` and value
+    ``i`` spans ``data[offsets[i]:offsets[i + 1]]``. Both arrays are memory-mapped,
+    so loading is instant and values are only decoded when accessed.
+
+    Args:
+        data: ``uint8`` array holding the concatenated UTF-8 bytes.
+        offsets: ``uint64`` array of ``len(column) + 1`` boundaries into ``data``.
+    """
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _get(self, index: int) -> str:
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        return self.data[start:end].tobytes().decode("utf-8")
+
+    def __getitem__(self, index):
+        """Get one string by integer index, or a list of strings by slice or index array."""
+
+        if isinstance(index, (int, np.integer)) and not isinstance(index, bool):
+            index = int(index)
+            if index < 0:
+                index += len(self)
+            if not 0 <= index < len(self):
+                raise IndexError("index out of range")
+            return self._get(index)
+        if isinstance(index, slice):
+            return [self._get(i) for i in range(*index.indices(len(self)))]
+        indices = np.asarray(index)
+        if indices.dtype.kind not in "iu":
+            raise TypeError("index must be int, slice, or a sequence of ints")
+        return [self[int(i)] for i in indices.ravel()]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._get(i)
+
+    def lengths(self) -> np.ndarray:
+        """Return the length in bytes of every value."""
+
+        return np.diff(self.offsets.astype(np.int64))
+
+    def to_numpy(self) -> np.ndarray:
+        """Return the column as a fixed-width numpy unicode array."""
+
+        return np.array(list(self), dtype=str)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(len={len(self)})"
+
+
+def _columns_path(file) -> Path:
+    return Path(str(file) + _COLUMNS_SUFFIX)
+
+
+def _source_stat(file) -> Dict[str, int]:
+    stat = os.stat(file)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _load_meta(file, cache_dir: Path) -> Optional[Dict[str, Any]]:
+    """Return the metadata of a cache that matches the current ``file``, or ``None``."""
+
+    try:
+        with open(cache_dir / "meta.json", "r", encoding="utf-8") as fp:
+            meta = json.load(fp)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != _COLUMNS_VERSION:
+        return None
+    if meta.get("source") != _source_stat(file):
+        return None
+    return meta
+
+
+def _value_kind(value) -> str:
+    if value is None:
+        return "none"
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, str):
+        return "str"
+    raise TypeError(
+        f"Only str, int, float, bool and null values can be cached as columns, "
+        f"got {type(value).__name__}"
+    )
+
+
+def _merge_kinds(a: str, b: str) -> str:
+    if a == "none":
+        return b
+    if b == "none" or a == b:
+        return a
+    if a in _NUMERIC_KINDS and b in _NUMERIC_KINDS:
+        return max(a, b, key=_NUMERIC_KINDS.index)
+    raise TypeError(f"Cannot store both {a} and {b} values in one column")
+
+
+class _ColumnBuilder:
+    """Accumulates the values of one field chunk by chunk."""
+
+    def __init__(self, field: str):
+        self.field = field
+        self.kind = "none"
+        self.has_none = False
+        self.values = []
+        self.chunks = []  # numpy arrays, or (bytes, lengths) for strings
+
+    def add(self, value):
+        self.values.append(value)
+
+    def flush(self):
+        if not self.values:
+            return
+        kind = "none"
+        for value in self.values:
+            try:
+                kind = _merge_kinds(kind, _value_kind(value))
+            except TypeError as exc:
+                raise TypeError(f"Field {self.field!r}: {exc}") from None
+        try:
+            previous, self.kind = self.kind, _merge_kinds(self.kind, kind)
+        except TypeError as exc:
+            raise TypeError(f"Field {self.field!r}: {exc}") from None
+
+        if self.kind == "str":
+            if previous == "none":
+                # Earlier chunks only held missing values
+                self.chunks = [(b"", np.zeros(len(c), np.uint64)) for c in self.chunks]
+                self.has_none = False
+            encoded = [b"" if v is None else v.encode("utf-8") for v in self.values]
+            lengths = np.fromiter(
+                map(len, encoded), dtype=np.uint64, count=len(encoded)
+            )
+            self.chunks.append((b"".join(encoded), lengths))
+        elif kind == "none" or None in self.values:
+            # Missing values become NaN, which requires a float column
+            self.has_none = True
+            self.chunks.append(
+                np.array(
+                    [np.nan if v is None else v for v in self.values], dtype=np.float64
+                )
+            )
+        else:
+            self.chunks.append(np.array(self.values, dtype=_NUMERIC_DTYPES[kind]))
+        self.values = []
+
+    def save(self, directory: Path, stem: str) -> Dict[str, Any]:
+        self.flush()
+        if self.kind == "str":
+            data = np.frombuffer(b"".join(c[0] for c in self.chunks), dtype=np.uint8)
+            lengths = np.concatenate([c[1] for c in self.chunks] or [[]])
+            offsets = np.zeros(len(lengths) + 1, dtype=np.uint64)
+            np.cumsum(lengths, out=offsets[1:])
+            np.save(directory / f"{stem}.data.npy", data)
+            np.save(directory / f"{stem}.offsets.npy", offsets)
+        else:
+            dtype = _NUMERIC_DTYPES.get(self.kind, np.float64)
+            if self.has_none:
+                dtype = np.float64
+            array = np.concatenate(self.chunks or [np.empty(0)]).astype(dtype)
+            np.save(directory / f"{stem}.npy", array)
+        return {"stem": stem, "kind": self.kind}
+
+
+def build_jsonl_columns(
+    file,
+    fields: Sequence[str],
+    cache_dir: Optional[PathLike] = None,
+    force: bool = False,
+    json_backend: Optional[str] = None,
+) -> Path:
+    """Extract top-level fields of a JSONL file into a columnar cache.
+
+    Every field becomes a typed numpy array saved as ``.npy`` in a cache
+    directory, next to the file by default (``file + ".columns"``). Integer,
+    float and boolean fields become ``int64``, ``float64`` and ``bool`` arrays;
+    a numeric field with missing or ``null`` values becomes ``float64`` with
+    ``NaN``. Strings are offset-encoded, see :class:`StringColumn`, and missing
+    strings are stored as ``""``.
+
+    The cache records the size and modification time of ``file`` and is rebuilt
+    when they change. Requesting fields that are not cached yet rebuilds it with
+    the union of the old and new fields. Building is guarded by a file lock and
+    the new directory is moved into place once complete.
+
+    Args:
+        file: Source JSONL file path, compressed files are supported.
+        fields: Names of the top-level fields to extract.
+        cache_dir: Cache directory. Defaults to ``file + ".columns"``.
+        force: Rebuild the cache even if an up-to-date one exists.
+        json_backend: JSON library used for decoding, see
+            :func:`~dl_utils.data.json_codec.set_json_backend`.
+
+    Returns:
+        Path to the cache directory.
+
+    Raises:
+        TypeError: If a field holds objects, lists or mixed strings and numbers.
+    """
+
+    cache_dir = Path(cache_dir) if cache_dir is not None else _columns_path(file)
+    fields = list(dict.fromkeys(fields))
+    with FileLock(str(cache_dir) + ".lock"):
+        meta = _load_meta(file, cache_dir)
+        if not force and meta is not None:
+            if all(field in meta["columns"] for field in fields):
+                return cache_dir
+            fields = list(dict.fromkeys(list(meta["columns"]) + fields))
+
+        source = _source_stat(file)
+        builders = [_ColumnBuilder(field) for field in fields]
+        num_records = 0
+        for record in iter_jsonl(file, json_backend=json_backend):
+            if not isinstance(record, dict):
+                raise TypeError(f"Record {num_records} of {file} is not a JSON object")
+            for builder in builders:
+                builder.add(record.get(builder.field))
+            num_records += 1
+            if num_records % _BUILD_CHUNK_SIZE == 0:
+                for builder in builders:
+                    builder.flush()
+
+        tmp_dir = cache_dir.with_name(f".{cache_dir.name}.{uuid.uuid4().hex[:12]}.tmp")
+        tmp_dir.mkdir(parents=True)
+        try:
+            columns = {
+                builder.field: builder.save(tmp_dir, f"column-{i}")
+                for i, builder in enumerate(builders)
+            }
+            meta = {
+                "version": _COLUMNS_VERSION,
+                "source": source,
+                "num_records": num_records,
+                "columns": columns,
+            }
+            with open(tmp_dir / "meta.json", "w", encoding="utf-8") as fp:
+                json.dump(meta, fp)
+            if cache_dir.exists():
+                shutil.rmtree(cache_dir)
+            os.replace(tmp_dir, cache_dir)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+    return cache_dir
+
+
+def load_jsonl_columns(
+    file,
+    fields: Sequence[str],
+    cache_dir: Optional[PathLike] = None,
+    json_backend: Optional[str] = None,
+) -> Dict[str, Union[np.ndarray, StringColumn]]:
+    """Load fields of a JSONL file from its columnar cache.
+
+    The cache is built or refreshed with :func:`build_jsonl_columns` when it is
+    missing, stale or lacks some of ``fields``. Columns are memory-mapped, so
+    loading a few columns of millions of records takes milliseconds instead of
+    decoding every line.
+
+    Args:
+        file: Source JSONL file path.
+        fields: Names of the top-level fields to load.
+        cache_dir: Cache directory. Defaults to ``file + ".columns"``.
+        json_backend: JSON library used if the cache has to be built.
+
+    Returns:
+        A dict mapping each field to a read-only numpy array, or to a
+        :class:`StringColumn` for string fields.
+
+    Examples:
+        ::
+
+            columns = load_jsonl_columns("manifest.jsonl", ["id", "path", "duration"])
+            long_clips = np.flatnonzero(columns["duration"] > 10)
+            paths = columns["path"][long_clips]
+    """
+
+    cache_dir = build_jsonl_columns(
+        file, fields, cache_dir=cache_dir, json_backend=json_backend
+    )
+    with open(cache_dir / "meta.json", "r", encoding="utf-8") as fp:
+        meta = json.load(fp)
+
+    columns: Dict[str, Union[np.ndarray, StringColumn]] = {}
+    for field in fields:
+        column = meta["columns"][field]
+        stem = column["stem"]
+        if column["kind"] == "str":
+            columns[field] = StringColumn(
+                np.load(cache_dir / f"{stem}.data.npy", mmap_mode="r"),
+                np.load(cache_dir / f"{stem}.offsets.npy", mmap_mode="r"),
+            )
+        else:
+            columns[field] = np.load(cache_dir / f"{stem}.npy", mmap_mode="r")
+    return columns
@@ -4,26 +4,1017 @@
 # @Project : Deep-Learning-Utils
 # @File    : lmdb.py
 
-__all__ = ["JsonLmdb"]
+__all__ = [
+    "JsonLmdb",
+    "PickleLmdb",
+    "MsgpackLmdb",
+    "NdarrayLmdb",
+    "build_lmdb",
+    "build_lmdb_from_files",
+    "build_lmdb_from_jsonl",
+    "ShardedLmdb",
+]
 
-import json
+import logging
+import pickle
+import queue
+import shutil
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict, defaultdict
+from collections.abc import Mapping, MutableMapping
+from contextlib import contextmanager
+from itertools import islice
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
 
+import lmdb
+import numpy as np
+from filelock import FileLock
 from lmdbm import Lmdb
+from tqdm import tqdm
 
+from ..import_utils import is_msgpack_available
+from .json_codec import get_json_codec
+from .save_and_load import (
+    PathLike,
+    _resolve_files,
+    iter_files,
+    iter_jsonl,
+    load_bytes,
+    load_json,
+    save_json,
+)
 
-class JsonLmdb(Lmdb):
-    """
-    https://pypi.org/project/lmdbm/
+logger = logging.getLogger(__name__)
+
+# dtype string, ndim; followed by the shape as ``ndim`` uint64 values
+_NDARRAY_HEADER = struct.Struct("<12sI")
+_NDARRAY_DIM = struct.Struct("<Q")
+# Array data starts at a multiple of this offset, LMDB stores large values
+# page-aligned so the views returned by NdarrayLmdb.view() are aligned as well
+_NDARRAY_ALIGNMENT = 16
+# Layout of ShardedLmdb directories
+_SHARDS_META = "shards.json"
+_SHARD_NAME = "shard-{:05d}"
+# Attempts of a write transaction, doubling the map size after each MapFullError
+_AUTOGROW_ATTEMPTS = 12
+
+
+class _Utf8KeyLmdb(Lmdb):
+    """:class:`Lmdb` with ``str`` keys encoded as UTF-8.
+
+    Decoded values can be kept in an LRU cache of ``cache_size`` entries, which
+    is disabled by default. Pass ``cache_size`` to :meth:`open`, or set it on a
+    subclass or an opened instance to enable it. Writes through the same
+    instance invalidate the cached values of their keys; writes by other
+    instances or processes are not seen while a key stays cached. Cached values
+    are returned as is, so do not modify them in place.
     """
 
+    cache_size: int = 0
+
+    def __init__(self, env, autogrow: bool):
+        super().__init__(env, autogrow)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # Bumped by every invalidation, so that a value read concurrently with
+        # a write is not cached after the write invalidated its key
+        self._cache_generation = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Held while growing the map, which is not allowed while another
+        # transaction of this process is open
+        self._map_lock = threading.Lock()
+
+    @classmethod
+    def open(
+        cls,
+        file: str,
+        flag: str = "r",
+        mode: int = 0o755,
+        map_size: int = 2**20,
+        autogrow: bool = True,
+        cache_size: Optional[int] = None,
+        **kwargs,
+    ) -> "_Utf8KeyLmdb":
+        """Open the database ``file``, see :meth:`lmdbm.Lmdb.open`.
+
+        Args:
+            cache_size: Number of decoded values kept in the LRU cache. Defaults
+                to the class attribute, which disables the cache.
+            **kwargs: Arguments of :meth:`lmdbm.Lmdb.open`.
+        """
+
+        db = super().open(file, flag, mode, map_size, autogrow, **kwargs)
+        if cache_size is not None:
+            db.cache_size = cache_size
+        return db
+
     def _pre_key(self, value):
         return value.encode("utf-8")
 
     def _post_key(self, value):
         return value.decode("utf-8")
 
+    def cache_info(self) -> Dict[str, int]:
+        """Return the ``hits``, ``misses``, ``maxsize`` and ``size`` of the value cache."""
+
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "maxsize": self.cache_size,
+            "size": len(self._cache),
+        }
+
+    def cache_clear(self):
+        """Empty the value cache and reset its counters."""
+
+        self._invalidate()
+        self.cache_hits = self.cache_misses = 0
+
+    def _cache_lookup(self, key) -> Tuple[bool, Any, int]:
+        """Return ``(found, value, generation)`` and count the hit or miss."""
+
+        with self._cache_lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return True, self._cache[key], self._cache_generation
+            self.cache_misses += 1
+            return False, None, self._cache_generation
+
+    def _cache_put(self, key, value, generation: int):
+        with self._cache_lock:
+            if generation != self._cache_generation:
+                return
+            self._cache[key] = value
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _invalidate(self, keys: Optional[Iterable] = None):
+        """Drop ``keys``, or all keys if ``None``, from the value cache."""
+
+        with self._cache_lock:
+            self._cache_generation += 1
+            if keys is None:
+                self._cache.clear()
+            else:
+                for key in keys:
+                    self._cache.pop(key, None)
+
+    def _get(self, key):
+        return Lmdb.__getitem__(self, key)
+
+    def __getitem__(self, key):
+        if self.cache_size <= 0:
+            return self._get(key)
+        found, value, generation = self._cache_lookup(key)
+        if not found:
+            value = self._get(key)
+            self._cache_put(key, value, generation)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._invalidate([key])
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._invalidate([key])
+
+    def pop(self, key, *args):
+        try:
+            return super().pop(key, *args)
+        finally:
+            self._invalidate([key])
+
+    def update(self, *args, **kwargs):
+        try:
+            super().update(*args, **kwargs)
+        finally:
+            self._invalidate()
+
+    def get_many(self, keys: Iterable[str], default: Any = None) -> List[Any]:
+        """Get the values of many keys in one read transaction.
+
+        Keys are looked up in sorted order, which walks the B-tree sequentially,
+        and values are decoded straight from the memory map.
+
+        Args:
+            keys: Keys to look up.
+            default: Value returned for missing keys.
+
+        Returns:
+            The values in the order of ``keys``.
+        """
+
+        keys = list(keys)
+        values = [default] * len(keys)
+        todo = range(len(keys))
+        if self.cache_size > 0:
+            todo = []
+            for i, key in enumerate(keys):
+                found, values[i], generation = self._cache_lookup(key)
+                if not found:
+                    values[i] = default
+                    todo.append(i)
+
+        encoded = {i: self._pre_key(keys[i]) for i in todo}
+        with self.env.begin(buffers=True) as txn:
+            for i in sorted(todo, key=encoded.__getitem__):
+                value = txn.get(encoded[i])
+                if value is not None:
+                    values[i] = self._post_value(value)
+                    if self.cache_size > 0:
+                        self._cache_put(keys[i], values[i], generation)
+        return values
+
+    def put_many(
+        self,
+        items: Union[Mapping, Iterable[Tuple[str, Any]]],
+        batch_size: int = 10000,
+        overwrite: bool = True,
+    ) -> int:
+        """Write many items with one write transaction per batch.
+
+        Every batch is encoded, sorted by key and written with a single cursor
+        call. When all keys of a batch sort after the last key in the database,
+        as with sequential ids, they are appended without B-tree searches. The
+        map size is doubled and the batch retried if the database is full and
+        ``autogrow`` is enabled.
+
+        Each batch is committed separately, so an interrupted call leaves the
+        preceding batches written.
+
+        Args:
+            items: A mapping, or an iterable of ``(key, value)`` pairs. Consumed
+                lazily, so generators of any length are fine.
+            batch_size: Number of items per write transaction.
+            overwrite: Replace the values of existing keys. If ``False``,
+                existing keys keep their values.
+
+        Returns:
+            The number of items written.
+        """
+
+        if isinstance(items, Mapping):
+            items = items.items()
+        items = iter(items)
+        written = 0
+        while True:
+            batch = list(islice(items, batch_size))
+            if not batch:
+                return written
+            pairs = [
+                (self._pre_key(key), self._pre_value(value)) for key, value in batch
+            ]
+            try:
+                written += self._write_batch(pairs, overwrite)
+            finally:
+                self._invalidate(key for key, _ in batch)
+
+    def _write_batch(self, pairs: List[Tuple[bytes, bytes]], overwrite: bool) -> int:
+        """Sort and write encoded pairs, keeping the last value of duplicated keys."""
+
+        pairs = sorted(dict(pairs).items())
+        return self._write_with_autogrow(self._put_sorted, pairs, overwrite)
+
+    def _put_sorted(self, txn, pairs: List[Tuple[bytes, bytes]], overwrite: bool):
+        with txn.cursor() as cursor:
+            append = not cursor.last() or pairs[0][0] > cursor.key()
+            _, added = cursor.putmulti(pairs, overwrite=overwrite, append=append)
+        return added
+
+    def _write_with_autogrow(self, fn, *args):
+        """Run ``fn(txn, *args)`` in a write transaction, growing the map when full."""
+
+        for attempt in range(_AUTOGROW_ATTEMPTS):
+            try:
+                with self.env.begin(write=True) as txn:
+                    return fn(txn, *args)
+            except lmdb.MapFullError:
+                if not self.autogrow or attempt == _AUTOGROW_ATTEMPTS - 1:
+                    raise
+                new_map_size = self.map_size * 2
+                with self._map_lock:
+                    self.map_size = new_map_size
+                logger.info(self.autogrow_msg, self.env.path(), new_map_size)
+
+
+class JsonLmdb(_Utf8KeyLmdb):
+    """
+    https://pypi.org/project/lmdbm/
+
+    Values are encoded with the JSON backend named by ``json_backend`` (see
+    :func:`~dl_utils.data.json_codec.set_json_backend`), or the global backend if
+    it is ``None``. Set it on a subclass or an opened instance to override it.
+    """
+
+    json_backend: Optional[str] = None
+
+    def _pre_value(self, value):
+        return get_json_codec(self.json_backend).dumps_bytes(value)
+
+    def _post_value(self, value):
+        return get_json_codec(self.json_backend).loads(value)
+
+
+class PickleLmdb(_Utf8KeyLmdb):
+    """:class:`JsonLmdb` counterpart storing arbitrary Python objects with :mod:`pickle`.
+
+    Only open databases from trusted sources, unpickling can run arbitrary code.
+    """
+
+    protocol: int = pickle.HIGHEST_PROTOCOL
+
+    def _pre_value(self, value):
+        return pickle.dumps(value, protocol=self.protocol)
+
+    def _post_value(self, value):
+        return pickle.loads(value)
+
+
+class MsgpackLmdb(_Utf8KeyLmdb):
+    """:class:`JsonLmdb` counterpart storing values with ``msgpack``.
+
+    MessagePack is a compact binary format for the same types as JSON, and also
+    stores ``bytes`` values as is. Requires ``pip install msgpack``.
+    """
+
+    def __init__(self, *args, **kwargs):
+        if not is_msgpack_available():
+            raise ImportError("MsgpackLmdb requires `pip install msgpack`.")
+        import msgpack
+
+        self._msgpack = msgpack
+        super().__init__(*args, **kwargs)
+
     def _pre_value(self, value):
-        return json.dumps(value).encode("utf-8")
+        return self._msgpack.packb(value, use_bin_type=True)
 
     def _post_value(self, value):
-        return json.loads(value.decode("utf-8"))
+        return self._msgpack.unpackb(value, raw=False, strict_map_key=False)
+
+
+def _encode_ndarray(value) -> bytes:
+    array = np.asarray(value)
+    if array.dtype.hasobject or array.dtype.fields is not None:
+        raise TypeError(f"Cannot store arrays of dtype {array.dtype} in NdarrayLmdb")
+    dtype = array.dtype.str.encode("ascii")
+    if len(dtype) > 12:
+        raise TypeError(f"Cannot store arrays of dtype {array.dtype} in NdarrayLmdb")
+    header = _NDARRAY_HEADER.pack(dtype, array.ndim) + b"".join(
+        _NDARRAY_DIM.pack(dim) for dim in array.shape
+    )
+    header += b"\0" * (-len(header) % _NDARRAY_ALIGNMENT)
+    return header + array.tobytes()
+
+
+def _decode_ndarray(value) -> np.ndarray:
+    """Return an array over the buffer ``value`` without copying it."""
+
+    dtype, ndim = _NDARRAY_HEADER.unpack_from(value)
+    shape = tuple(
+        _NDARRAY_DIM.unpack_from(value, _NDARRAY_HEADER.size + i * _NDARRAY_DIM.size)[0]
+        for i in range(ndim)
+    )
+    offset = _NDARRAY_HEADER.size + ndim * _NDARRAY_DIM.size
+    offset += -offset % _NDARRAY_ALIGNMENT
+    dtype = np.dtype(dtype.rstrip(b"\0").decode("ascii"))
+    return np.frombuffer(value, dtype=dtype, offset=offset).reshape(shape)
+
+
+class _NdarrayView:
+    """Read-only mapping of :class:`NdarrayLmdb` returning arrays over the memory map."""
+
+    def __init__(self, db: "NdarrayLmdb", txn):
+        self._db = db
+        self._txn = txn
+
+    def get(self, key, default=None):
+        value = self._txn.get(self._db._pre_key(key))
+        if value is None:
+            return default
+        return _decode_ndarray(value)
+
+    def __getitem__(self, key) -> np.ndarray:
+        value = self._txn.get(self._db._pre_key(key))
+        if value is None:
+            raise KeyError(key)
+        return _decode_ndarray(value)
+
+    def __contains__(self, key) -> bool:
+        return self._txn.get(self._db._pre_key(key)) is not None
+
+
+class NdarrayLmdb(_Utf8KeyLmdb):
+    """:class:`JsonLmdb` counterpart storing numpy arrays as raw buffers.
+
+    Every value is stored as a small dtype and shape header followed by the
+    array data, so no conversion to text is needed and reading back is a single
+    copy. Arrays of any numeric, boolean, string or datetime dtype are supported;
+    object and structured dtypes are not.
+
+    Use :meth:`view` to read arrays without copying them at all.
+
+    Examples:
+        ::
+
+            with NdarrayLmdb.open("features.lmdb", "c", map_size=2**30) as db:
+                db["clip-0"] = np.random.rand(256, 768).astype(np.float32)
+
+            with NdarrayLmdb.open("features.lmdb") as db:
+                with db.view() as arrays:
+                    mean = arrays["clip-0"].mean(0)
+    """
+
+    def _pre_value(self, value):
+        return _encode_ndarray(value)
+
+    def _post_value(self, value):
+        return _decode_ndarray(value).copy()
+
+    def _get(self, key) -> np.ndarray:
+        with self.view() as arrays:
+            return arrays[key].copy()
+
+    @contextmanager
+    def view(self) -> Iterator[_NdarrayView]:
+        """Open a read transaction returning arrays over the LMDB memory map.
+
+        The yielded mapping supports ``[]``, ``get`` and ``in``. Its arrays are
+        read-only views of the database file, not copies, and are only valid until
+        the ``with`` block exits; copy them (``np.array(x)``) to keep them longer.
+        """
+
+        with self.env.begin(buffers=True) as txn:
+            yield _NdarrayView(self, txn)
+
+
+class _LmdbBuilder:
+    """Writes encoded batches into a database from a single background thread.
+
+    Reading and encoding the next batches overlaps with the commits. Batches are
+    written like :meth:`JsonLmdb.put_many`: the last value of a key duplicated
+    within a batch is kept, and existing keys are replaced only with
+    ``overwrite=True``. Callers use :meth:`contains` to skip existing keys
+    before loading or encoding their values.
+    """
+
+    def __init__(
+        self,
+        output: PathLike,
+        lmdb_cls: Type[Lmdb],
+        map_size: int,
+        resume: bool,
+        progress: bool,
+        overwrite: bool = False,
+    ):
+        self.db = lmdb_cls.open(str(output), "c" if resume else "n", map_size=map_size)
+        self.overwrite = overwrite
+        self.written = 0
+        self.skipped = 0
+        self.num_bytes = 0
+        self._start = time.perf_counter()
+        self._error: Optional[BaseException] = None
+        self._queue = queue.Queue(maxsize=2)
+        self._pbar = tqdm(unit="item", disable=not progress, desc=f"Build {output}")
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def skip(self, count: int):
+        self.skipped += count
+
+    def contains(self, keys: List[bytes]) -> List[bool]:
+        """Check which encoded keys are already in the database."""
+
+        # The writer thread may grow the map, which needs all transactions closed
+        with self.db._map_lock, self.db.env.begin() as txn:
+            with txn.cursor() as cursor:
+                return [cursor.set_key(key) for key in keys]
+
+    def write(self, pairs: List[Tuple[bytes, bytes]]):
+        """Queue encoded ``(key, value)`` pairs, blocking while the writer is busy."""
+
+        if self._error is not None:
+            raise self._error
+        if pairs:
+            self._queue.put(pairs)
+
+    def _run(self):
+        while True:
+            pairs = self._queue.get()
+            if pairs is None:
+                return
+            if self._error is not None:
+                continue  # Drain the queue so that write() never blocks
+            try:
+                self.written += self.db._write_batch(pairs, self.overwrite)
+                self.num_bytes += sum(len(k) + len(v) for k, v in pairs)
+                elapsed = time.perf_counter() - self._start
+                self._pbar.update(len(pairs))
+                self._pbar.set_postfix(MBps=f"{self.num_bytes / elapsed / 2**20:.1f}")
+            except BaseException as exc:
+                self._error = exc
+
+    def close(self):
+        """Commit the queued batches, log the throughput and close the database."""
+
+        self._queue.put(None)
+        self._thread.join()
+        self._pbar.close()
+        path = self.db.env.path()
+        self.db.close()
+        if self._error is not None:
+            raise self._error
+        elapsed = time.perf_counter() - self._start
+        logger.info(
+            "Wrote %d items (%.1f MB, %d existing skipped) to %s in %.1fs: "
+            "%.0f items/s, %.1f MB/s",
+            self.written,
+            self.num_bytes / 2**20,
+            self.skipped,
+            path,
+            elapsed,
+            self.written / elapsed,
+            self.num_bytes / elapsed / 2**20,
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def build_lmdb(
+    items: Iterable[Tuple[str, Any]],
+    output: PathLike,
+    lmdb_cls: Type[Lmdb] = JsonLmdb,
+    batch_size: int = 10000,
+    map_size: int = 2**30,
+    resume: bool = True,
+    overwrite: bool = False,
+    progress: bool = True,
+) -> int:
+    """Build an LMDB database from ``(key, value)`` pairs.
+
+    Values are encoded in the calling thread, one batch at a time, while a
+    single writer thread commits the previous batches, each in one write
+    transaction. Encoders such as :func:`json.dumps` and :func:`pickle.dumps`
+    hold the GIL, so more encoding threads would not help, and sending values to
+    worker processes costs about as much as encoding them. The map size starts
+    at ``map_size`` and doubles whenever the database is full. Progress and
+    throughput are reported with ``tqdm`` and logged when done.
+
+    With ``resume=True``, the keys already in the database are skipped without
+    encoding their values, so an interrupted build continues where it stopped.
+    They are looked up batch by batch rather than kept in memory. Duplicated
+    keys are handled as by :meth:`JsonLmdb.put_many`: within a batch the last
+    value is kept, and a key written by an earlier batch keeps its value unless
+    ``overwrite=True``.
+
+    Args:
+        items: Iterable of ``(key, value)`` pairs, consumed lazily.
+        output: Path of the database.
+        lmdb_cls: :class:`JsonLmdb` or one of its siblings, decides how values are
+            encoded.
+        batch_size: Number of items per write transaction.
+        map_size: Initial map size in bytes.
+        resume: Keep an existing database and skip its keys. If ``False``, an
+            existing database is overwritten.
+        overwrite: Replace the values of keys already in the database instead
+            of skipping them.
+        progress: Show a progress bar.
+
+    Returns:
+        The number of items written.
+    """
+
+    with _LmdbBuilder(
+        output, lmdb_cls, map_size, resume, progress, overwrite
+    ) as builder:
+        db = builder.db
+        items = iter(items)
+        while True:
+            batch = list(islice(items, batch_size))
+            if not batch:
+                break
+            keys = [db._pre_key(key) for key, _ in batch]
+            values = [value for _, value in batch]
+            if not overwrite:
+                found = builder.contains(keys)
+                keys = [k for k, f in zip(keys, found) if not f]
+                values = [v for v, f in zip(values, found) if not f]
+            builder.skip(len(batch) - len(keys))
+            builder.write(list(zip(keys, map(db._pre_value, values))))
+    return builder.written
+
+
+def _load_sample(file) -> Any:
+    """Load ``.json`` files with :func:`load_json` and other files as bytes."""
+
+    return load_json(file) if Path(file).suffix == ".json" else load_bytes(file)
+
+
+def _encoding_loader(file, loader: Callable, encode: Callable, load_kwargs):
+    return encode(loader(file, **load_kwargs))
+
+
+def build_lmdb_from_files(
+    files_or_dir: Union[PathLike, Iterable[PathLike]],
+    output: PathLike,
+    *,
+    pattern: Optional[str] = None,
+    key_fn: Optional[Callable[[Path], str]] = None,
+    loader: Optional[Callable[..., Any]] = None,
+    load_kwargs: Optional[Dict[str, Any]] = None,
+    lmdb_cls: Type[Lmdb] = JsonLmdb,
+    n_jobs: int = 16,
+    batch_size: int = 1000,
+    map_size: int = 2**30,
+    resume: bool = True,
+    overwrite: bool = False,
+    progress: bool = True,
+) -> int:
+    """Build an LMDB database with one item per file.
+
+    Files are read by :func:`iter_files` threads, which also encode each value
+    right after loading it, and committed by a single writer thread, see
+    :func:`build_lmdb`. The threads overlap the file I/O, which is what they
+    speed up; decoding and encoding hold the GIL. With
+    ``resume=True``, files whose key is already in the database are not read.
+
+    Args:
+        files_or_dir: A directory, a single file, or an iterable of files and/or
+            directories, see :func:`iter_files`.
+        output: Path of the database.
+        pattern: Glob pattern used when expanding directories.
+        key_fn: Function mapping a file path to its key. Defaults to the path
+            relative to ``files_or_dir`` without suffix when it is a directory,
+            and to the file name without suffix otherwise.
+        loader: Callable used to load one file path. Defaults to
+            :func:`load_json` for ``.json`` files and :func:`load_bytes` for
+            other files.
+        load_kwargs: Extra keyword arguments passed to ``loader``.
+        lmdb_cls: :class:`JsonLmdb` or one of its siblings, decides how values are
+            encoded. Use :class:`PickleLmdb` or :class:`MsgpackLmdb` to store
+            bytes.
+        n_jobs: Number of reader threads.
+        batch_size: Number of items per write transaction.
+        map_size: Initial map size in bytes.
+        resume: Keep an existing database and skip the files of its keys. If
+            ``False``, an existing database is overwritten.
+        overwrite: Reload the files of keys already in the database and replace
+            their values.
+        progress: Show a progress bar.
+
+    Returns:
+        The number of items written.
+
+    Examples:
+        ::
+
+            build_lmdb_from_files("captions/", "captions.lmdb", pattern="**/*.json")
+    """
+
+    files = _resolve_files(files_or_dir, pattern=pattern)
+    if key_fn is None:
+        root = None
+        if isinstance(files_or_dir, (str, Path)) and Path(files_or_dir).is_dir():
+            root = Path(files_or_dir)
+
+        def key_fn(file: Path) -> str:
+            if root is not None:
+                return file.relative_to(root).with_suffix("").as_posix()
+            return file.with_suffix("").name
+
+    with _LmdbBuilder(
+        output, lmdb_cls, map_size, resume, progress, overwrite
+    ) as builder:
+        db = builder.db
+        keys = [db._pre_key(key_fn(file)) for file in files]
+        todo = files
+        if not overwrite:
+            found = builder.contains(keys)
+            keys = [k for k, f in zip(keys, found) if not f]
+            todo = [file for file, f in zip(files, found) if not f]
+        builder.skip(len(files) - len(todo))
+
+        values = iter_files(
+            todo,
+            n_jobs=n_jobs,
+            loader=_encoding_loader,
+            load_kwargs={
+                "loader": loader or _load_sample,
+                "encode": db._pre_value,
+                "load_kwargs": load_kwargs or {},
+            },
+            max_inflight=max(batch_size, 2 * n_jobs),
+        )
+        keys = iter(keys)
+        while True:
+            values_batch = list(islice(values, batch_size))
+            if not values_batch:
+                break
+            builder.write(list(zip(islice(keys, len(values_batch)), values_batch)))
+    return builder.written
+
+
+def build_lmdb_from_jsonl(
+    file: PathLike,
+    output: PathLike,
+    key: Union[str, Callable[[Any], str]],
+    *,
+    json_backend: Optional[str] = None,
+    **kwargs,
+) -> int:
+    """Build an LMDB database with one item per JSONL record.
+
+    Args:
+        file: Source JSONL file, compressed files are supported.
+        output: Path of the database.
+        key: Name of the record field holding the key, or a function mapping a
+            record to its key.
+        json_backend: JSON library used to decode the records.
+        **kwargs: Keyword arguments of :func:`build_lmdb`, such as ``lmdb_cls``,
+            ``batch_size`` and ``resume``.
+
+    Returns:
+        The number of items written.
+
+    Examples:
+        ::
+
+            build_lmdb_from_jsonl("annotations.jsonl", "annotations.lmdb", key="id")
+    """
+
+    records = iter_jsonl(file, json_backend=json_backend)
+    if callable(key):
+        items = ((key(record), record) for record in records)
+    else:
+        items = ((record[key], record) for record in records)
+    return build_lmdb(items, output, **kwargs)
+
+
+class ShardedLmdb(MutableMapping):
+    """Mapping over several LMDB databases, with keys assigned by hash.
+
+    LMDB allows a single writer per database at a time. Splitting the items
+    over ``num_shards`` databases lets as many processes write at once, each to
+    its own shard: a process opens the store with ``shards=[i]`` and writes the
+    keys for which :meth:`shard_index` returns ``i``. Readers open all shards
+    and use the store as one mapping.
+
+    Keys are assigned with the CRC32 of their encoded bytes, which is stable
+    across processes and runs. The shards are stored as
+    ``path/shard-00000`` ... next to a ``shards.json`` holding the number of
+    shards.
+
+    Reading or writing a key whose shard is not open raises :class:`ValueError`,
+    while ``in`` reports such keys as missing.
+
+    Use :meth:`open` to create or open a store.
+
+    Args:
+        shards: The opened shards, by shard index.
+        num_shards: Total number of shards of the store.
+
+    Examples:
+        ::
+
+            # Process ``rank`` of ``world_size`` extracts and writes its shard
+            with ShardedLmdb.open("features", "c", num_shards=world_size,
+                                  shards=[rank], lmdb_cls=NdarrayLmdb) as store:
+                keys = [k for k in all_keys if store.shard_index(k) == rank]
+                store.put_many((k, extract(k)) for k in keys)
+
+            with ShardedLmdb.open("features", lmdb_cls=NdarrayLmdb) as store:
+                batch = store.get_many(keys)
+    """
+
+    def __init__(self, shards: Dict[int, Lmdb], num_shards: int):
+        if not shards:
+            raise ValueError("At least one shard must be opened")
+        self.shards = shards
+        self.num_shards = num_shards
+        self._pre_key = next(iter(shards.values()))._pre_key
+
+    @classmethod
+    def open(
+        cls,
+        path: PathLike,
+        flag: str = "r",
+        num_shards: Optional[int] = None,
+        lmdb_cls: Type[Lmdb] = JsonLmdb,
+        shards: Optional[Sequence[int]] = None,
+        **kwargs,
+    ) -> "ShardedLmdb":
+        """Open a sharded store.
+
+        Args:
+            path: Directory of the store.
+            flag: ``"r"``, ``"w"``, ``"c"`` or ``"n"``, applied to every opened
+                shard as in :meth:`JsonLmdb.open`. With ``"n"``, an existing store
+                is replaced, or only the opened shards if ``shards`` is given.
+            num_shards: Number of shards. Required to create a store, and checked
+                against the existing store otherwise.
+            lmdb_cls: :class:`JsonLmdb` or one of its siblings, decides how values
+                are encoded.
+            shards: Indices of the shards to open. Defaults to all shards.
+            **kwargs: Keyword arguments of :meth:`JsonLmdb.open` for every shard,
+                such as ``map_size`` and ``autogrow``.
+
+        Returns:
+            The opened store.
+        """
+
+        path = Path(path)
+        if flag in ("c", "n"):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with FileLock(str(path) + ".lock"):
+                meta = cls._create(path, flag, num_shards, shards)
+        else:
+            meta = load_json(path / _SHARDS_META)
+            if num_shards is not None and num_shards != meta["num_shards"]:
+                raise ValueError(
+                    f"{path} has {meta['num_shards']} shards, not {num_shards}"
+                )
+
+        num_shards = meta["num_shards"]
+        indices = range(num_shards) if shards is None else sorted(set(shards))
+        opened = {}
+        try:
+            for i in indices:
+                if not 0 <= i < num_shards:
+                    raise ValueError(f"Shard index {i} out of range [0, {num_shards})")
+                shard_path = str(path / _SHARD_NAME.format(i))
+                opened[i] = lmdb_cls.open(shard_path, flag, **kwargs)
+        except BaseException:
+            for shard in opened.values():
+                shard.close()
+            raise
+        return cls(opened, num_shards)
+
+    @staticmethod
+    def _create(path: Path, flag: str, num_shards: Optional[int], shards) -> dict:
+        """Return the metadata of the store at ``path``, creating it if needed."""
+
+        meta_path = path / _SHARDS_META
+        if flag == "n" and shards is None and path.exists():
+            shutil.rmtree(path)
+        if meta_path.exists():
+            meta = load_json(meta_path)
+            if num_shards is None or num_shards == meta["num_shards"]:
+                return meta
+            if flag != "n":
+                raise ValueError(
+                    f"{path} has {meta['num_shards']} shards, not {num_shards}"
+                )
+        if num_shards is None:
+            raise ValueError("num_shards is required to create a store")
+        meta = {"num_shards": num_shards, "hash": "crc32"}
+        save_json(meta, meta_path, atomic=True)
+        return meta
+
+    def shard_index(self, key) -> int:
+        """Return the index of the shard holding ``key``."""
+
+        return zlib.crc32(self._pre_key(key)) % self.num_shards
+
+    def _shard(self, key) -> Lmdb:
+        index = self.shard_index(key)
+        shard = self.shards.get(index)
+        if shard is None:
+            raise ValueError(f"Key {key!r} belongs to shard {index}, which is not open")
+        return shard
+
+    def __getitem__(self, key):
+        return self._shard(key)[key]
+
+    def __setitem__(self, key, value):
+        self._shard(key)[key] = value
+
+    def __delitem__(self, key):
+        del self._shard(key)[key]
+
+    def __contains__(self, key) -> bool:
+        try:
+            index = self.shard_index(key)
+        except (AttributeError, UnicodeEncodeError):
+            return False  # Not a string key
+        shard = self.shards.get(index)
+        # Keys of shards that are not open are reported as missing
+        return shard is not None and key in shard
+
+    def __iter__(self):
+        return self.keys()
+
+    def keys(self):
+        """Iterate over the keys of the opened shards, sorted within each shard."""
+
+        for shard in self.shards.values():
+            yield from shard.keys()
+
+    def items(self):
+        for shard in self.shards.values():
+            yield from shard.items()
+
+    def values(self):
+        for shard in self.shards.values():
+            yield from shard.values()
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self.shards.values())
+
+    def _group(self, keys: Iterable) -> Dict[int, List[int]]:
+        """Group the positions of ``keys`` by shard index."""
+
+        groups = defaultdict(list)
+        for i, key in enumerate(keys):
+            index = self.shard_index(key)
+            if index not in self.shards:
+                raise ValueError(
+                    f"Key {key!r} belongs to shard {index}, which is not open"
+                )
+            groups[index].append(i)
+        return groups
+
+    def get_many(self, keys: Iterable[str], default: Any = None) -> List[Any]:
+        """Get the values of many keys with one read transaction per shard.
+
+        Args:
+            keys: Keys to look up.
+            default: Value returned for missing keys.
+
+        Returns:
+            The values in the order of ``keys``.
+        """
+
+        keys = list(keys)
+        values = [default] * len(keys)
+        for index, indices in self._group(keys).items():
+            shard_values = self.shards[index].get_many(
+                [keys[i] for i in indices], default
+            )
+            for i, value in zip(indices, shard_values):
+                values[i] = value
+        return values
+
+    def put_many(
+        self,
+        items: Union[Mapping, Iterable[Tuple[str, Any]]],
+        batch_size: int = 10000,
+        overwrite: bool = True,
+    ) -> int:
+        """Write many items, grouped into one write transaction per shard and batch.
+
+        Args:
+            items: A mapping, or an iterable of ``(key, value)`` pairs.
+            batch_size: Number of items grouped at once, over all shards.
+            overwrite: Replace the values of existing keys.
+
+        Returns:
+            The number of items written.
+        """
+
+        if isinstance(items, Mapping):
+            items = items.items()
+        items = iter(items)
+        written = 0
+        while True:
+            batch = list(islice(items, batch_size))
+            if not batch:
+                return written
+            for index, indices in self._group(key for key, _ in batch).items():
+                group = [batch[i] for i in indices]
+                written += self.shards[index].put_many(group, len(group), overwrite)
+
+    def sync(self):
+        for shard in self.shards.values():
+            shard.sync()
+
+    def close(self):
+        for shard in self.shards.values():
+            shard.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
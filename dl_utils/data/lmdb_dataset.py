@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+# @Time    : 10/18/26
+# @Author  : Yaojie Shen
+# @Project : Deep-Learning-Utils
+# @File    : lmdb_dataset.py
+
+import os
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple, Type
+
+import lmdb
+import numpy as np
+from torch.utils.data import Dataset
+
+from .jsonl_columns import StringColumn
+from .lmdb import JsonLmdb
+from .save_and_load import PathLike
+
+__all__ = ["LmdbDataset"]
+
+# Read-only environments and transactions opened by LmdbDataset, by database
+# path. LMDB does not allow opening one environment twice in a process.
+_handles: Dict[str, Tuple[int, lmdb.Environment, lmdb.Transaction]] = {}
+
+
+def _open_read_txn(path: str, open_kwargs: Dict[str, Any]):
+    """Return the ``(pid, env, txn)`` of ``path`` for the current process."""
+
+    pid = os.getpid()
+    handle = _handles.get(path)
+    if handle is not None and handle[0] != pid:
+        # Inherited from the parent process through fork and unusable here.
+        # Without the lock file, closing only unmaps this process's copy.
+        handle[1].close()
+        handle = None
+    if handle is None:
+        kwargs = {"lock": False, "readahead": False, **open_kwargs}
+        env = lmdb.open(path, readonly=True, create=False, **kwargs)
+        handle = _handles[path] = (pid, env, env.begin(buffers=True))
+    return handle
+
+
+def _pack_keys(keys) -> StringColumn:
+    """Pack keys into two flat arrays.
+
+    DataLoader workers forked from the main process share a plain list of
+    strings, but touching its items updates their reference counts and copies
+    the pages of every worker. Flat numpy arrays stay shared.
+    """
+
+    encoded = [key.encode("utf-8") for key in keys]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum([len(key) for key in encoded], out=offsets[1:])
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return StringColumn(data, offsets)
+
+
+class LmdbDataset(Dataset):
+    """Map-style dataset reading the values of a :class:`JsonLmdb` database.
+
+    Each process opens its own read-only environment (with ``lock=False``) on
+    first access and detects forks by the change of process id, so the dataset
+    can be created in the main process and used by any number of DataLoader
+    workers. Samples are read through one long-lived read transaction per
+    process instead of reopening the database, shared by all datasets over the
+    same database. The transaction sees a snapshot of the database, so it must
+    not be written to while the dataset is in use.
+
+    Args:
+        path: Path of the LMDB database.
+        keys: Keys of the samples, in order. Defaults to all keys of the
+            database in sorted order, listed once in ``__init__``.
+        lmdb_cls: :class:`JsonLmdb` or one of its siblings such as
+            :class:`NdarrayLmdb`, decides how values are decoded.
+        transform: Optional function applied to every decoded value.
+        cache_size: Number of decoded values kept in an LRU cache by each
+            process, see :class:`JsonLmdb`. Disabled by default. Cached values
+            are passed to ``transform`` as is, so it must not modify them in
+            place.
+        **open_kwargs: Extra keyword arguments of :func:`lmdb.open`.
+
+    Examples:
+        ::
+
+            dataset = LmdbDataset("captions.lmdb")
+            loader = DataLoader(dataset, batch_size=64, num_workers=8)
+    """
+
+    def __init__(
+        self,
+        path: PathLike,
+        keys: Optional[Sequence[str]] = None,
+        lmdb_cls: Type[JsonLmdb] = JsonLmdb,
+        transform: Optional[Callable[[Any], Any]] = None,
+        cache_size: int = 0,
+        **open_kwargs,
+    ):
+        # Resolved once, it is the key of the per-process handles
+        self.path = os.path.realpath(path)
+        self.lmdb_cls = lmdb_cls
+        self.transform = transform
+        self.cache_size = cache_size
+        self.open_kwargs = open_kwargs
+        self._db = None
+        if keys is None:
+            txn = self._get_txn()
+            cursor = txn.cursor().iternext(keys=True, values=False)
+            keys = [self._db._post_key(bytes(key)) for key in cursor]
+        self.keys = _pack_keys(keys)
+
+    def _get_txn(self):
+        _, env, txn = _open_read_txn(self.path, self.open_kwargs)
+        if self._db is None or self._db.env is not env:
+            # Only used to encode keys, decode values and cache them
+            self._db = self.lmdb_cls(env, False)
+            self._db.cache_size = self.cache_size
+        return txn
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _read(self, txn, key: str):
+        value = txn.get(self._db._pre_key(key))
+        if value is None:
+            raise KeyError(key)
+        return self._db._post_value(value)
+
+    def __getitem__(self, index: int):
+        key = self.keys[index]
+        txn = self._get_txn()
+        db = self._db
+        if db.cache_size > 0:
+            found, value, generation = db._cache_lookup(key)
+            if not found:
+                value = self._read(txn, key)
+                db._cache_put(key, value, generation)
+        else:
+            value = self._read(txn, key)
+        if self.transform is not None:
+            value = self.transform(value)
+        return value
+
+    def close(self):
+        """Close the environment of this database opened by this process.
+
+        It is shared by all datasets over the same database in the process and
+        is reopened on their next access.
+        """
+
+        handle = _handles.pop(self.path, None)
+        if handle is not None and handle[0] == os.getpid():
+            handle[2].abort()
+            handle[1].close()
+        self._db = None
+
+    def __getstate__(self):
+        # Workers started with spawn open their own environment
+        state = self.__dict__.copy()
+        state["_db"] = None
+        return state
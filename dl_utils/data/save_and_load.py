@@ -4,18 +4,80 @@
 # @Project : Deep-Learning-Utils
 # @File    : save_and_load.py
 
+import asyncio
+import collections
+import functools
+import gzip
+import io
 import json
+import mmap
 import os
 import pickle
+import re
+import struct
+import sys
+import threading
+import uuid
+import warnings
+import zlib
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
 from pathlib import Path
-from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
-
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import numpy as np
+from filelock import FileLock
 from joblib import Parallel, delayed
+from joblib.externals.loky import get_reusable_executor
+
+from ..fs.list_files import glob_files
+from ..import_utils import is_zstandard_available
+from .json_codec import _JsonBytesEncoder, get_json_codec
 
 PathLike = Union[str, Path]
 
 
-def save_text(text: str, file):
+@contextmanager
+def _open_for_write(file, mode: str, atomic: bool = False):
+    """Open ``file`` for writing, creating parent directories.
+
+    With ``atomic=True`` the content is written to a hidden temporary file in the
+    same directory and renamed over ``file`` on success, so readers never see a
+    partially written file. The temporary file is removed on failure.
+    """
+
+    path = Path(file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if not atomic:
+        with open(path, mode) as fp:
+            yield fp
+        return
+
+    tmp_path = path.parent / f".{path.name}.{uuid.uuid4().hex[:12]}.tmp"
+    try:
+        with open(tmp_path, mode) as fp:
+            yield fp
+        os.replace(tmp_path, path)
+    except BaseException:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise
+
+
+def save_text(text: str, file, atomic: bool = False):
     """Save text content to a UTF-8 text file.
 
     Parent directories are created automatically before writing.
@@ -23,10 +85,11 @@ def save_text(text: str, file):
     Args:
         text: Text content to write.
         file: Destination file path.
+        atomic: Write to a temporary file and rename it over ``file``, so readers
+            never see a partially written file.
     """
 
-    Path(file).parent.mkdir(parents=True, exist_ok=True)
-    with open(file, "w") as fp:
+    with _open_for_write(file, "w", atomic=atomic) as fp:
         fp.write(text)
 
 
@@ -44,7 +107,7 @@ def load_text(file) -> str:
         return fp.read()
 
 
-def save_bytes(data: bytes, file):
+def save_bytes(data: bytes, file, atomic: bool = False):
     """Save raw bytes to a binary file.
 
     Parent directories are created automatically before writing.
@@ -52,10 +115,11 @@ def save_bytes(data: bytes, file):
     Args:
         data: Bytes content to write.
         file: Destination file path.
+        atomic: Write to a temporary file and rename it over ``file``, so readers
+            never see a partially written file.
     """
 
-    Path(file).parent.mkdir(parents=True, exist_ok=True)
-    with open(file, "wb") as fp:
+    with _open_for_write(file, "wb", atomic=atomic) as fp:
         fp.write(data)
 
 
@@ -73,60 +137,151 @@ def load_bytes(file) -> bytes:
         return fp.read()
 
 
-def save_pickle(obj, file):
+# magic, pickle stream length, number of out-of-band buffers
+_PICKLE_OOB_HEADER = struct.Struct("<8sQQ")
+_PICKLE_OOB_MAGIC = b"DLPKL5OB"
+_PICKLE_OOB_ALIGNMENT = 64
+
+
+def _tensor_from_numpy(array):
+    import torch
+
+    return torch.from_numpy(array)
+
+
+class _OutOfBandPickler(pickle.Pickler):
+    """Pickler that routes CPU tensors through numpy, so their data goes out-of-band."""
+
+    def reducer_override(self, obj):
+        torch = sys.modules.get("torch")
+        if (
+            torch is not None
+            and type(obj) is torch.Tensor
+            and obj.device.type == "cpu"
+            and obj.layout == torch.strided
+            and not obj.requires_grad
+            and obj.is_contiguous()
+            and obj.dtype != torch.bfloat16
+        ):
+            return _tensor_from_numpy, (obj.numpy(),)
+        return NotImplemented
+
+
+def _align(offset: int) -> int:
+    return -(-offset // _PICKLE_OOB_ALIGNMENT) * _PICKLE_OOB_ALIGNMENT
+
+
+def _dump_out_of_band(obj, fp):
+    buffers = []
+    stream = io.BytesIO()
+    _OutOfBandPickler(stream, protocol=5, buffer_callback=buffers.append).dump(obj)
+    data = stream.getbuffer()
+    raws = [buffer.raw() for buffer in buffers]
+
+    table_size = _PICKLE_OOB_HEADER.size + 16 * len(raws)
+    offset = _align(table_size + len(data))
+    table = []
+    for raw in raws:
+        table.append((offset, raw.nbytes))
+        offset = _align(offset + raw.nbytes)
+
+    fp.write(_PICKLE_OOB_HEADER.pack(_PICKLE_OOB_MAGIC, len(data), len(raws)))
+    for entry in table:
+        fp.write(struct.pack("<QQ", *entry))
+    fp.write(data)
+    position = table_size + len(data)
+    for (start, _), raw in zip(table, raws):
+        fp.write(b"\0" * (start - position))
+        fp.write(raw)
+        position = start + raw.nbytes
+
+
+def _load_out_of_band(fp, use_mmap: bool):
+    if use_mmap:
+        # Copy-on-write: pages are shared until written, and writes never reach
+        # the file
+        data = memoryview(mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_COPY))
+    else:
+        data = memoryview(bytearray(fp.read()))
+    _, pickle_size, num_buffers = _PICKLE_OOB_HEADER.unpack_from(data)
+    table = np.frombuffer(
+        data,
+        dtype="<u8",
+        count=2 * num_buffers,
+        offset=_PICKLE_OOB_HEADER.size,
+    ).reshape(-1, 2)
+    start = _PICKLE_OOB_HEADER.size + 16 * num_buffers
+    buffers = [data[int(o) : int(o) + int(n)] for o, n in table]
+    return pickle.loads(data[start : start + pickle_size], buffers=buffers)
+
+
+def save_pickle(obj, file, atomic: bool = False, out_of_band: bool = False):
     """Serialize an object to a pickle file.
 
     Warning:
         Pickle is not safe for untrusted data. Only load pickle files from
         trusted sources.
 
+    With ``out_of_band=True``, the object is pickled with protocol 5 and the raw
+    data of numpy arrays and CPU tensors is stored as out-of-band buffers in an
+    aligned region after the pickle stream instead of being copied into it.
+    :func:`load_pickle` then rebuilds those arrays as views over a copy-on-write
+    memory map of the file, without copying, and the pages are shared by every
+    process that loads the same file until they are modified.
+
     Args:
         obj: Python object to serialize.
         file: Destination pickle file path.
+        atomic: Write to a temporary file and rename it over ``file``, so readers
+            never see a partially written file.
+        out_of_band: Store large buffers out-of-band for zero-copy loading. The
+            file can only be read by :func:`load_pickle`.
     """
 
-    Path(file).parent.mkdir(parents=True, exist_ok=True)
-    with open(file, "wb") as fp:
-        pickle.dump(obj, fp)
+    with _open_for_write(file, "wb", atomic=atomic) as fp:
+        if out_of_band:
+            _dump_out_of_band(obj, fp)
+        else:
+            pickle.dump(obj, fp)
 
 
-def load_pickle(file):
+def load_pickle(file, mmap: bool = True):
     """Load an object from a pickle file.
 
     Warning:
         Pickle can execute arbitrary code while loading. Only load pickle files
         from trusted sources.
 
+    Files written with ``save_pickle(..., out_of_band=True)`` are detected
+    automatically. Their numpy arrays and tensors are views over a private
+    copy-on-write memory map of the file: loading copies nothing, and modifying
+    them in place copies only the touched pages and never changes the file.
+
     Args:
         file: Source pickle file path.
+        mmap: For out-of-band files, map the file instead of reading it. With
+            ``False`` the whole file is read into memory.
 
     Returns:
         The Python object deserialized from ``file``.
     """
 
     with open(file, "rb") as fp:
+        if fp.read(len(_PICKLE_OOB_MAGIC)) == _PICKLE_OOB_MAGIC:
+            fp.seek(0)
+            return _load_out_of_band(fp, use_mmap=mmap)
+        fp.seek(0)
         return pickle.load(fp)
 
 
-class _JsonBytesEncoder(json.JSONEncoder):
-    """Object of type bytes is not JSON serializable, convert it to string before saving"""
-
-    def default(self, obj):
-        """Convert ``bytes`` values to UTF-8 strings before JSON encoding.
-
-        Args:
-            obj: Object to encode.
-
-        Returns:
-            A JSON-serializable representation of ``obj``.
-        """
-
-        if isinstance(obj, bytes):  # bytes->str
-            return str(obj, encoding="utf-8")
-        return json.JSONEncoder.default(self, obj)
-
-
-def save_json(data, file, save_pretty=False, **kwargs):
+def save_json(
+    data,
+    file,
+    save_pretty=False,
+    json_backend: Optional[str] = None,
+    atomic: bool = False,
+    **kwargs,
+):
     """Save an object as JSON.
 
     ``bytes`` values are converted to UTF-8 strings by the default custom JSON
@@ -138,36 +293,164 @@ def save_json(data, file, save_pretty=False, **kwargs):
         file: Destination file path.
         save_pretty: If ``True``, write human-readable JSON with indentation and
             ``ensure_ascii=False``.
+        json_backend: JSON library used for encoding, see
+            :func:`~dl_utils.data.json_codec.set_json_backend`. Defaults to the
+            global backend. Pretty output and extra ``kwargs`` always use the
+            standard library.
+        atomic: Write to a temporary file and rename it over ``file``, so readers
+            never see a partially written file.
         **kwargs: Extra keyword arguments forwarded to :func:`json.dumps`.
     """
 
-    _kwargs = {"cls": _JsonBytesEncoder}
+    _kwargs = {}
     if save_pretty:
         _kwargs.update({"indent": 4, "ensure_ascii": False})
     _kwargs.update(kwargs)
 
     # Dump to string first to avoid writing if error occurs
-    s = json.dumps(data, **_kwargs)
-    Path(file).parent.mkdir(parents=True, exist_ok=True)
-    with open(file, "w") as fp:
+    s = get_json_codec(json_backend).dumps_bytes(data, **_kwargs)
+    with _open_for_write(file, "wb", atomic=atomic) as fp:
         fp.write(s)
 
 
-def load_json(file):
+def load_json(file, json_backend: Optional[str] = None):
     """Load a JSON file.
 
     Args:
         file: Source JSON file path.
+        json_backend: JSON library used for decoding, see
+            :func:`~dl_utils.data.json_codec.set_json_backend`. Defaults to the
+            global backend.
 
     Returns:
         The Python object decoded from the JSON file.
     """
 
-    with open(file, "r") as fp:
-        return json.load(fp)
+    with open(file, "rb") as fp:
+        return get_json_codec(json_backend).loads(fp.read())
+
+
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_JSON_VALUE_STARTS = frozenset('{["-0123456789tfnNI')
 
 
-def save_jsonl(data, file, **kwargs):
+def _open_text(file):
+    """Open a (possibly gzip or zstd compressed) text file for streaming reads."""
+
+    compression = _jsonl_compression(file)
+    if compression == "gzip":
+        return gzip.open(file, "rt", encoding="utf-8")
+    if compression == "zstd":
+        reader = _zstandard().ZstdDecompressor().stream_reader(open(file, "rb"))
+        return io.TextIOWrapper(reader, encoding="utf-8")
+    return open(file, "r", encoding="utf-8")
+
+
+def iter_json_array(
+    file, max_samples: Optional[int] = None, chunk_size: int = 1 << 20
+) -> Iterator[Any]:
+    """Stream the elements of a JSON file holding one top-level array.
+
+    Unlike :func:`load_json`, the document is never held in memory as a whole:
+    the file is read in chunks of ``chunk_size`` characters and elements are
+    decoded one at a time, so memory is bounded by the size of the largest
+    element. The ``.json`` files written by :func:`save_jsonl` can be streamed
+    back this way. ``.gz`` and ``.zst`` files are decompressed on the fly.
+
+    Args:
+        file: Source JSON file path.
+        max_samples: Optional maximum number of elements to yield.
+        chunk_size: Number of characters read at once. The buffer grows beyond
+            it as needed to hold one element.
+
+    Yields:
+        The decoded elements of the array, in order.
+
+    Raises:
+        ValueError: If the file is not a JSON array. Errors inside an element
+            are raised as :class:`json.JSONDecodeError`.
+    """
+
+    decoder = json.JSONDecoder()
+    with _open_text(file) as fp:
+        buf = ""
+        pos = 0
+        eof = False
+
+        def _fill(size: int = chunk_size):
+            nonlocal buf, pos, eof
+            data = fp.read(size)
+            eof = not data
+            buf = buf[pos:] + data
+            pos = 0
+
+        def _next_char() -> str:
+            # Skip whitespace and return the next character, "" at the end
+            nonlocal pos
+            while True:
+                pos = _JSON_WHITESPACE.match(buf, pos).end()
+                if pos < len(buf) or eof:
+                    return buf[pos : pos + 1]
+                _fill()
+
+        if _next_char() != "[":
+            raise ValueError(f"{file} does not contain a top-level JSON array")
+        pos += 1
+        if _next_char() == "]":
+            return
+
+        # The C scanner behind ``raw_decode``, without its per-call overhead
+        scan_once = decoder.scan_once
+        count = 0
+        while True:
+            if max_samples is not None and count >= max_samples:
+                return
+            try:
+                item, end = scan_once(buf, pos)
+            except (StopIteration, json.JSONDecodeError) as exc:
+                if eof:
+                    if isinstance(exc, StopIteration):
+                        raise json.JSONDecodeError("Expecting value", buf, pos)
+                    raise
+                # The element is cut by the end of the buffer: double the buffer
+                _fill(max(chunk_size, len(buf) - pos))
+                continue
+            if end >= len(buf) - 1 and not eof:
+                # A number at the end of the buffer may continue in the next
+                # chunk, and the separator must be in the buffer
+                _fill(max(chunk_size, len(buf) - pos))
+                continue
+            pos = end
+            count += 1
+            yield item
+
+            # Fast path for the compact ``,`` separator written by save_jsonl
+            char = buf[pos : pos + 1]
+            if not char or char not in ",]":
+                char = _next_char()
+            if char == ",":
+                pos += 1
+                if buf[pos : pos + 1] in _JSON_VALUE_STARTS:
+                    continue
+                _next_char()
+            elif char == "]":
+                return
+            else:
+                raise ValueError(
+                    f"Expected ',' or ']' after element {count - 1} of {file}, "
+                    f"got {char!r}"
+                )
+
+
+def save_jsonl(
+    data,
+    file,
+    json_backend: Optional[str] = None,
+    block_size: int = 1 << 18,
+    atomic: bool = False,
+    append: bool = False,
+    **kwargs,
+):
     """Save an iterable of objects as JSONL or a JSON array.
 
     The function writes one item at a time, so ``data`` can be any iterable,
@@ -175,6 +458,13 @@ def save_jsonl(data, file, **kwargs):
     is serialized as one JSON object per line. If ``file`` ends with ``.json``,
     the same stream of items is written as a valid JSON array instead.
 
+    If ``file`` ends with ``.gz`` or ``.zst`` (e.g. ``data.jsonl.gz``), the lines
+    are compressed in independent blocks of about ``block_size`` uncompressed
+    bytes. The result is a regular gzip/zstd file that any tool can decompress,
+    and a block index is written next to it (``file + ".idx"``) so that
+    :func:`iter_jsonl` supports ``len()`` and indexing without decompressing the
+    whole file. ``.zst`` requires the ``zstandard`` package.
+
     ``bytes`` values are converted to UTF-8 strings by the default custom JSON
     encoder.
 
@@ -182,6 +472,16 @@ def save_jsonl(data, file, **kwargs):
         data: Iterable of JSON-serializable objects to save.
         file: Destination file path. A ``.json`` suffix switches the output
             format from JSONL to a JSON array.
+        json_backend: JSON library used for encoding, see
+            :func:`~dl_utils.data.json_codec.set_json_backend`. Defaults to the
+            global backend. Extra ``kwargs`` always use the standard library.
+        block_size: Uncompressed size in bytes of one compressed block. Smaller
+            blocks make random access cheaper at the cost of compression ratio.
+        atomic: Write to a temporary file and rename it over ``file``, so readers
+            never see a partially written file.
+        append: Append to ``file`` instead of overwriting it, keeping its offset
+            index up to date. See :class:`JsonlWriter`, which also serves as a
+            long-lived writer.
         **kwargs: Extra keyword arguments forwarded to :func:`json.dumps`.
 
     Raises:
@@ -189,131 +489,1904 @@ def save_jsonl(data, file, **kwargs):
             example when passing pretty-print options such as ``indent=2``.
     """
 
-    _kwargs = {"cls": _JsonBytesEncoder}
-    _kwargs.update(kwargs)
+    if append:
+        if atomic:
+            raise ValueError("append=True cannot be combined with atomic=True.")
+        with JsonlWriter(
+            file,
+            append=True,
+            json_backend=json_backend,
+            block_size=block_size,
+            **kwargs,
+        ) as writer:
+            writer.write_many(data)
+        return
+
+    dumps = get_json_codec(json_backend).dumps_bytes
 
     path = Path(file)
-    path.parent.mkdir(parents=True, exist_ok=True)
+    compression = _jsonl_compression(path)
+    if compression is not None and path.with_suffix("").suffix.lower() == ".json":
+        raise ValueError(
+            "Compressed output is only supported for JSONL, e.g. 'data.jsonl.gz'."
+        )
+
+    def _lines():
+        for idx, item in enumerate(data):
+            line = dumps(item, **kwargs)
+            if b"\n" in line:
+                raise ValueError(
+                    "JSONL line contains newline. Avoid pretty JSON (e.g., indent=2). "
+                    f"Line index: {idx}."
+                )
+            yield line
 
-    with open(file, "w") as fp:
+    with _open_for_write(file, "wb", atomic=atomic) as fp:
         if path.suffix.lower() == ".json":
-            fp.write("[\n")
+            fp.write(b"[\n")
             for idx, item in enumerate(data):
                 if idx > 0:
-                    fp.write(",\n")
-                fp.write(json.dumps(item, **_kwargs))
-            fp.write("\n]")
+                    fp.write(b",\n")
+                fp.write(dumps(item, **kwargs))
+            fp.write(b"\n]")
+            return
+        elif compression is None:
+            for line in _lines():
+                fp.write(line)
+                fp.write(b"\n")
             return
         else:
-            for idx, item in enumerate(data):
-                line = json.dumps(item, **_kwargs)
-                if "\n" in line:
-                    raise ValueError(
-                        "JSONL line contains newline. Avoid pretty JSON (e.g., indent=2). "
-                        f"Line index: {idx}."
+            writer = _JsonlBlockWriter(fp, compression, block_size)
+            for line in _lines():
+                writer.write(line)
+            blocks = writer.close()
+    _write_jsonl_index(file, _jsonl_index_path(file), blocks)
+
+
+class _JsonlBlockWriter:
+    """Write JSONL lines into a file as independently compressed blocks.
+
+    Args:
+        fp: Binary file object positioned at ``offset``.
+        compression: ``"gzip"`` or ``"zstd"``.
+        block_size: Uncompressed bytes per block.
+        offset: File offset of the first written block.
+        first_record: Index of the first written record.
+    """
+
+    def __init__(
+        self,
+        fp,
+        compression: str,
+        block_size: int,
+        offset: int = 0,
+        first_record: int = 0,
+    ):
+        self.fp = fp
+        self.compression = compression
+        self.block_size = block_size
+        self.offset = offset
+        self.num_records = first_record
+        self.rows = []
+        self._buffer = []
+        self._buffer_size = 0
+        self._block_first_record = first_record
+
+    def write(self, line: bytes):
+        """Write one encoded line without its trailing newline."""
+
+        self._buffer.append(line)
+        self._buffer.append(b"\n")
+        self._buffer_size += len(line) + 1
+        self.num_records += 1
+        if self._buffer_size >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        """Compress and write the buffered lines as one block."""
+
+        if not self._buffer:
+            return
+        block = _compress_block(b"".join(self._buffer), self.compression)
+        self.fp.write(block)
+        self.rows.append((self.offset, self._block_first_record))
+        self.offset += len(block)
+        self._buffer, self._buffer_size = [], 0
+        self._block_first_record = self.num_records
+
+    def close(self) -> np.ndarray:
+        """Flush pending lines and return the block table of the written blocks.
+
+        See :func:`_scan_jsonl_blocks` for the layout of the table.
+        """
+
+        self.flush()
+        rows = self.rows + [(self.offset, self.num_records)]
+        return np.array(rows, dtype=np.uint64).reshape(-1, 2)
+
+
+_JSONL_INDEX_MAGIC = b"DLJSONL1"
+_JSONL_BLOCK_INDEX_MAGIC = b"DLJSONB1"
+# magic, source file size, source mtime in ns, number of entries
+_JSONL_INDEX_HEADER = struct.Struct("<8sQQQ")
+_JSONL_INDEX_SUFFIX = ".idx"
+_JSONL_COMPRESSIONS = {".gz": "gzip", ".zst": "zstd", ".zstd": "zstd"}
+# ASCII whitespace stripped by ``str.strip``; lines made only of these are skipped
+_JSONL_WHITESPACE = b" \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f"
+_JSONL_IS_WHITESPACE = np.zeros(256, dtype=bool)
+_JSONL_IS_WHITESPACE[list(_JSONL_WHITESPACE)] = True
+# Largest piece of gzip output produced by one decompression call
+_DECOMPRESS_MAX_LENGTH = 1 << 20
+# Compressed blocks up to this size are decompressed at once for random access
+_JSONL_CACHED_BLOCK_BYTES = 1 << 22
+
+
+def _scan_jsonl_offsets(
+    file, chunk_size: int = 1 << 24, start: int = 0, end: Optional[int] = None
+) -> np.ndarray:
+    """Scan a JSONL file and return the byte offsets of its non-empty lines.
+
+    The file is read in binary chunks and newlines are located with numpy, which
+    is much faster than a Python ``readline()`` loop on large files.
+
+    Args:
+        file: Source JSONL file path.
+        chunk_size: Number of bytes read per chunk.
+        start: Offset to start scanning at; must be the start of a line.
+        end: Offset to stop scanning at; must be the start of a line or the end
+            of the file. Defaults to the end of the file.
+
+    Returns:
+        A ``uint64`` array with the start offset of each non-empty line.
+    """
+
+    parts = []
+    base = start  # file offset of ``chunk[0]``
+    tail = b""  # unterminated line carried over from the previous chunk
+    remaining = float("inf") if end is None else end - start
+    with open(file, "rb") as fp:
+        fp.seek(start)
+        while True:
+            data = fp.read(int(min(chunk_size, remaining)))
+            remaining -= len(data)
+            eof = not data
+            chunk = tail + data
+            if not chunk:
+                break
+            buf = np.frombuffer(chunk, dtype=np.uint8)
+            ends = np.flatnonzero(buf == 10)
+            if eof:
+                ends = np.append(ends, len(buf))
+            if len(ends):
+                starts = np.concatenate([[0], ends[:-1] + 1])
+                nonempty = ends > starts
+                first_is_ws = _JSONL_IS_WHITESPACE[
+                    buf[np.minimum(starts, len(buf) - 1)]
+                ]
+                keep = nonempty & ~first_is_ws
+                # Lines starting with whitespace are rare, check them one by one
+                for i in np.flatnonzero(nonempty & first_is_ws):
+                    if chunk[starts[i] : ends[i]].strip(_JSONL_WHITESPACE):
+                        keep[i] = True
+                parts.append((starts[keep] + base).astype(np.uint64))
+            if eof:
+                break
+            consumed = int(ends[-1]) + 1 if len(ends) else 0
+            tail = chunk[consumed:]
+            base += consumed
+
+    if not parts:
+        return np.empty(0, dtype=np.uint64)
+    return np.concatenate(parts)
+
+
+def _jsonl_compression(file) -> Optional[str]:
+    """Return the compression implied by the suffix of ``file``, if any."""
+
+    return _JSONL_COMPRESSIONS.get(Path(file).suffix.lower())
+
+
+def _zstandard():
+    if not is_zstandard_available():
+        raise ImportError(
+            "Reading or writing .zst files requires `pip install zstandard`."
+        )
+    import zstandard
+
+    return zstandard
+
+
+def _compress_block(data: bytes, compression: str) -> bytes:
+    if compression == "gzip":
+        return gzip.compress(data)
+    return _zstandard().ZstdCompressor().compress(data)
+
+
+def _decompressobj(compression: str):
+    if compression == "gzip":
+        return zlib.decompressobj(wbits=31)
+    return _zstandard().ZstdDecompressor().decompressobj()
+
+
+def _decompress_blocks(data: bytes, compression: str) -> bytes:
+    """Decompress one or more concatenated gzip members or zstd frames."""
+
+    out = []
+    while data:
+        decompressor = _decompressobj(compression)
+        out.append(decompressor.decompress(data))
+        if not decompressor.eof:
+            raise EOFError("Compressed stream ended before the end-of-stream marker")
+        data = decompressor.unused_data
+    return b"".join(out)
+
+
+def _decompress_pieces(decompressor, data: bytes, compression: str) -> Iterator[bytes]:
+    """Feed ``data`` to ``decompressor`` and yield the output in bounded pieces.
+
+    zlib can stop at ``max_length`` output bytes and keep the rest of the input;
+    zstd returns the output of the whole input at once.
+    """
+
+    if compression != "gzip":
+        yield decompressor.decompress(data)
+        return
+    while True:
+        out = decompressor.decompress(data, _DECOMPRESS_MAX_LENGTH)
+        yield out
+        data = decompressor.unconsumed_tail
+        # A full piece may leave output buffered inside zlib
+        if decompressor.eof or not (data or len(out) == _DECOMPRESS_MAX_LENGTH):
+            return
+
+
+def _iter_decompressed(
+    file,
+    compression: str,
+    chunk_size: int = 1 << 16,
+    start: int = 0,
+    end: Optional[int] = None,
+) -> Iterator[Tuple[int, bytes, bool]]:
+    """Stream a compressed file made of gzip members or zstd frames.
+
+    Yields ``(offset, data, member_end)`` for every decompressed chunk: the
+    compressed offset of the member the chunk belongs to, the chunk itself and
+    whether the member ends there, in which case ``data`` is empty. Only one
+    chunk is held in memory at a time, however large the members are.
+
+    ``start`` and ``end`` restrict the stream to the members inside that range
+    of compressed bytes; both must be member boundaries.
+    """
+
+    remaining = float("inf") if end is None else end - start
+    with open(file, "rb") as fp:
+        fp.seek(start)
+        offset = start  # file offset of the current member
+        consumed = 0  # compressed bytes fed to the current decompressor
+        decompressor = _decompressobj(compression)
+        pending = b""
+        while True:
+            data = pending or fp.read(int(min(chunk_size, remaining)))
+            remaining -= 0 if pending else len(data)
+            pending = b""
+            if not data:
+                break
+            consumed += len(data)
+            for out in _decompress_pieces(decompressor, data, compression):
+                if out:
+                    yield offset, out, False
+            if decompressor.eof:
+                pending = decompressor.unused_data
+                yield offset, b"", True
+                offset += consumed - len(pending)
+                consumed = 0
+                decompressor = _decompressobj(compression)
+        if consumed:
+            raise EOFError("Compressed stream ended before the end-of-stream marker")
+
+
+def _split_jsonl_lines(data: bytes) -> List[bytes]:
+    """Split JSONL bytes into stripped non-empty lines."""
+
+    lines = (line.strip(_JSONL_WHITESPACE) for line in data.split(b"\n"))
+    return [line for line in lines if line]
+
+
+def _iter_compressed_lines(
+    file, compression: str, start: int = 0, end: Optional[int] = None
+) -> Iterator[Tuple[Optional[int], List[bytes]]]:
+    """Stream the non-empty lines of a compressed JSONL file, chunk by chunk.
+
+    Yields ``(block_start, lines)``. ``block_start`` is the compressed offset of
+    the member holding ``lines`` when that member starts a new line, i.e. when
+    decompression can be restarted there, and ``None`` otherwise. The partial
+    last line of a chunk is carried over to the next one.
+    """
+
+    tail = b""
+    member_start = True
+    for offset, data, member_end in _iter_decompressed(
+        file, compression, start=start, end=end
+    ):
+        block_start = offset if member_start and not tail else None
+        member_start = member_end
+        data, _, tail = (tail + data).rpartition(b"\n")
+        yield block_start, _split_jsonl_lines(data)
+    if tail:
+        yield None, _split_jsonl_lines(tail)
+
+
+def _scan_jsonl_blocks(file, compression: str) -> np.ndarray:
+    """Build the block table of a compressed JSONL file by decompressing it once.
+
+    Every gzip member or zstd frame becomes a block. Members that end in the
+    middle of a line are merged with the following ones, so that each block holds
+    whole lines. Records are counted while streaming, so a file made of a single
+    large member is never held in memory.
+
+    Returns:
+        A ``(num_blocks + 1, 2)`` ``uint64`` array of compressed start offsets and
+        the index of the first record of each block. The last row holds the file
+        size and the total number of records.
+    """
+
+    rows = []
+    num_records = 0
+    for block_start, lines in _iter_compressed_lines(file, compression):
+        if block_start is not None:
+            rows.append((block_start, num_records))
+        num_records += len(lines)
+    rows.append((os.path.getsize(file), num_records))
+    return np.array(rows, dtype=np.uint64)
+
+
+def _scan_jsonl_index(file) -> np.ndarray:
+    """Build the index of ``file`` in memory: line offsets, or a block table if compressed."""
+
+    compression = _jsonl_compression(file)
+    if compression is None:
+        return _scan_jsonl_offsets(file)
+    return _scan_jsonl_blocks(file, compression)
+
+
+def _jsonl_index_path(file) -> Path:
+    return Path(str(file) + _JSONL_INDEX_SUFFIX)
+
+
+def _write_jsonl_index(file, index_path, array: np.ndarray):
+    """Atomically write an index array with a header describing the current ``file``."""
+
+    stat = os.stat(file)
+    magic = _JSONL_INDEX_MAGIC if array.ndim == 1 else _JSONL_BLOCK_INDEX_MAGIC
+    header = _JSONL_INDEX_HEADER.pack(magic, stat.st_size, stat.st_mtime_ns, len(array))
+    tmp_path = str(index_path) + ".tmp"
+    with open(tmp_path, "wb") as fp:
+        fp.write(header)
+        fp.write(array.astype("<u8").tobytes())
+    os.replace(tmp_path, index_path)
+
+
+def _load_jsonl_index(file, index_path) -> Optional[np.ndarray]:
+    """Memory-map a sidecar index if it matches the current source file."""
+
+    try:
+        stat = os.stat(file)
+        with open(index_path, "rb") as fp:
+            header = fp.read(_JSONL_INDEX_HEADER.size)
+    except OSError:
+        return None
+    if len(header) != _JSONL_INDEX_HEADER.size:
+        return None
+    magic, size, mtime_ns, count = _JSONL_INDEX_HEADER.unpack(header)
+    if _jsonl_compression(file) is None:
+        expected_magic, shape = _JSONL_INDEX_MAGIC, (count,)
+    else:
+        expected_magic, shape = _JSONL_BLOCK_INDEX_MAGIC, (count, 2)
+    if magic != expected_magic or size != stat.st_size or mtime_ns != stat.st_mtime_ns:
+        return None
+    if os.path.getsize(index_path) < _JSONL_INDEX_HEADER.size + 8 * int(np.prod(shape)):
+        return None
+    if count == 0:
+        return np.empty(shape, dtype=np.uint64)
+    return np.memmap(
+        index_path,
+        dtype="<u8",
+        mode="r",
+        offset=_JSONL_INDEX_HEADER.size,
+        shape=shape,
+    )
+
+
+def build_jsonl_index(
+    file, index_path: Optional[PathLike] = None, force: bool = False
+) -> Path:
+    """Build the on-disk offset index used by :func:`iter_jsonl`.
+
+    The index is a small header followed by one little-endian ``uint64`` start
+    offset per non-empty line. The header records the size and modification time
+    of ``file``, so a stale index is detected and rebuilt automatically. Building
+    is guarded by a file lock and finished with an atomic rename, so concurrent
+    processes build it at most once and readers never see a partial index.
+
+    For compressed files (``.gz``, ``.zst``) the index is a block table instead:
+    the compressed offset and first record of every independently compressed
+    block. :func:`save_jsonl` writes it together with the data; building it for
+    other compressed files decompresses the file once.
+
+    Args:
+        file: Source JSONL file path.
+        index_path: Where to write the index. Defaults to ``file + ".idx"``.
+        force: Rebuild the index even if an up-to-date one exists.
+
+    Returns:
+        Path to the index file.
+    """
+
+    index_path = Path(index_path) if index_path is not None else _jsonl_index_path(file)
+    with FileLock(str(index_path) + ".lock"):
+        if not force and _load_jsonl_index(file, index_path) is not None:
+            return index_path
+        _write_jsonl_index(file, index_path, _scan_jsonl_index(file))
+    return index_path
+
+
+def _resolve_shard(
+    rank: Optional[int], world_size: Optional[int], distributed: bool = False
+) -> Optional[Tuple[int, int]]:
+    """Return ``(rank, world_size)`` for rank-sharded reading, or ``None``.
+
+    Sharding is enabled by ``distributed=True`` or when either value is given;
+    missing values default to the ``RANK`` / ``WORLD_SIZE`` of the current (e.g.
+    ``torchrun``) process, see :mod:`dl_utils.distributed.basic`.
+    """
+
+    if not distributed and rank is None and world_size is None:
+        return None
+    if rank is None or world_size is None:
+        from ..distributed.basic import get_global_rank, get_world_size
+
+        rank = get_global_rank() if rank is None else rank
+        world_size = get_world_size() if world_size is None else world_size
+    if world_size < 1 or not 0 <= rank < world_size:
+        raise ValueError(f"Invalid rank {rank} for world_size {world_size}")
+    return rank, world_size
+
+
+def _line_start(fp, pos: int) -> int:
+    """Return the offset of the first line starting at or after ``pos``."""
+
+    if pos == 0:
+        return 0
+    fp.seek(pos - 1)
+    fp.readline()
+    return fp.tell()
+
+
+def _append_jsonl_index(file, index_path, entries: np.ndarray):
+    """Append entries to a valid sidecar index in place and refresh its header.
+
+    Entries are written past the current ones first and the header is rewritten
+    last, so a concurrent reader sees either the old or the new index.
+    """
+
+    entries = np.asarray(entries, dtype="<u8")
+    width = 1 if entries.ndim == 1 else entries.shape[1]
+    with open(index_path, "r+b") as fp:
+        magic, _, _, count = _JSONL_INDEX_HEADER.unpack(
+            fp.read(_JSONL_INDEX_HEADER.size)
+        )
+        fp.seek(_JSONL_INDEX_HEADER.size + 8 * width * count)
+        fp.write(entries.tobytes())
+        fp.truncate()
+        stat = os.stat(file)
+        fp.seek(0)
+        fp.write(
+            _JSONL_INDEX_HEADER.pack(
+                magic, stat.st_size, stat.st_mtime_ns, count + len(entries)
+            )
+        )
+
+
+class JsonlWriter:
+    """Long-lived JSONL writer that appends records in batches.
+
+    Records are encoded on :meth:`write` and buffered; every ``buffer_size``
+    bytes the buffer is appended to the file at once while holding a file lock
+    (``file + ".lock"``), so several processes can append to the same file and
+    the lines of one batch stay contiguous.
+
+    An up-to-date offset index next to the file (see :func:`build_jsonl_index`)
+    is extended in place on every flush, so :func:`iter_jsonl` random access
+    keeps working without rescanning the file. Compressed files (``.gz``,
+    ``.zst``) are appended as new compressed blocks and always get a block
+    index, like with :func:`save_jsonl`.
+
+    Args:
+        file: Destination JSONL file path.
+        append: Append to an existing file. With ``False`` the file is truncated
+            when the writer is created.
+        json_backend: JSON library used for encoding, see
+            :func:`~dl_utils.data.json_codec.set_json_backend`.
+        block_size: Uncompressed size of one block for compressed files.
+        buffer_size: Number of encoded bytes buffered before they are flushed.
+        **kwargs: Extra keyword arguments forwarded to :func:`json.dumps`.
+
+    Examples:
+        Emit results as they are produced::
+
+            with JsonlWriter("results.jsonl") as writer:
+                for item in items:
+                    writer.write(process(item))
+    """
+
+    def __init__(
+        self,
+        file: PathLike,
+        append: bool = True,
+        json_backend: Optional[str] = None,
+        block_size: int = 1 << 18,
+        buffer_size: int = 1 << 20,
+        **kwargs,
+    ):
+        self.file = Path(file)
+        if self.file.suffix.lower() == ".json":
+            raise ValueError("JsonlWriter only writes JSONL, not JSON arrays.")
+        self.block_size = block_size
+        self.buffer_size = buffer_size
+        self.num_records = 0
+
+        self._dumps = get_json_codec(json_backend).dumps_bytes
+        self._kwargs = kwargs
+        self._compression = _jsonl_compression(self.file)
+        self._index_path = _jsonl_index_path(self.file)
+        self._lines: List[bytes] = []
+        self._buffer_bytes = 0
+        self._closed = False
+
+        self.file.parent.mkdir(parents=True, exist_ok=True)
+        if not append:
+            with self._lock():
+                open(self.file, "wb").close()
+                if self._compression is not None:
+                    empty = np.zeros((1, 2), dtype=np.uint64)
+                    _write_jsonl_index(self.file, self._index_path, empty)
+                elif self._index_path.exists():
+                    empty = np.empty(0, dtype=np.uint64)
+                    _write_jsonl_index(self.file, self._index_path, empty)
+
+    @contextmanager
+    def _lock(self):
+        # The index lock is also taken by build_jsonl_index
+        with FileLock(str(self.file) + ".lock"), FileLock(
+            str(self._index_path) + ".lock"
+        ):
+            yield
+
+    def write(self, item):
+        """Encode one record and flush the buffer once it is large enough."""
+
+        if self._closed:
+            raise RuntimeError("JsonlWriter is closed")
+        line = self._dumps(item, **self._kwargs)
+        if b"\n" in line:
+            raise ValueError(
+                "JSONL line contains newline. Avoid pretty JSON (e.g., indent=2). "
+                f"Line index: {self.num_records}."
+            )
+        self._lines.append(line)
+        self._buffer_bytes += len(line) + 1
+        self.num_records += 1
+        if self._buffer_bytes >= self.buffer_size:
+            self.flush()
+
+    def write_many(self, data: Iterable[Any]):
+        """Write every record of an iterable."""
+
+        for item in data:
+            self.write(item)
+
+    def flush(self):
+        """Append the buffered records to the file and update its index."""
+
+        if not self._lines:
+            return
+        lines, self._lines, self._buffer_bytes = self._lines, [], 0
+        with self._lock():
+            index = None
+            if self.file.exists():
+                index = _load_jsonl_index(self.file, self._index_path)
+            if self._compression is None:
+                entries = self._append_lines(lines)
+            else:
+                first_record = int(index[-1, 1]) if index is not None else 0
+                entries = self._append_blocks(lines, first_record)
+            if index is not None:
+                # The first new row repeats the old end-of-file row
+                del index
+                if self._compression is not None:
+                    entries = entries[1:]
+                _append_jsonl_index(self.file, self._index_path, entries)
+            elif self._compression is not None and int(entries[0, 0]) == 0:
+                _write_jsonl_index(self.file, self._index_path, entries)
+
+    def _append_lines(self, lines: List[bytes]) -> np.ndarray:
+        with open(self.file, "ab+") as fp:
+            offset = fp.seek(0, os.SEEK_END)
+            prefix = b""
+            if offset > 0:
+                # Terminate a last line left without a newline
+                fp.seek(offset - 1)
+                if fp.read(1) != b"\n":
+                    prefix = b"\n"
+            fp.write(prefix + b"\n".join(lines) + b"\n")
+        lengths = np.fromiter((len(line) + 1 for line in lines), np.uint64, len(lines))
+        starts = np.empty(len(lines), dtype=np.uint64)
+        starts[0] = offset + len(prefix)
+        np.cumsum(lengths[:-1], out=starts[1:])
+        starts[1:] += starts[0]
+        return starts
+
+    def _append_blocks(self, lines: List[bytes], first_record: int) -> np.ndarray:
+        with open(self.file, "ab") as fp:
+            offset = fp.seek(0, os.SEEK_END)
+            writer = _JsonlBlockWriter(
+                fp, self._compression, self.block_size, offset, first_record
+            )
+            for line in lines:
+                writer.write(line)
+            return writer.close()
+
+    def close(self):
+        """Flush the remaining records."""
+
+        if not self._closed:
+            self.flush()
+            self._closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# Marker returned by a record decoder for lines rejected by ``where``
+_SKIP = object()
+
+# Printable ASCII that every JSON encoder writes verbatim inside strings
+_JSONL_VERBATIM = re.compile(r"[ !#-.0-\[\]-~]*")
+
+
+def _json_equal(a, b) -> bool:
+    # Unlike ``==``, booleans never equal the numbers 0 and 1
+    if isinstance(a, bool) or isinstance(b, bool):
+        return type(a) is type(b) and a == b
+    return a == b
+
+
+class _RecordFilter:
+    """Selection (``where``) and projection (``fields``) applied by JSONL views.
+
+    A dict ``where`` is compiled into regular expressions matching the raw
+    ``"key": value`` bytes, so that most non-matching lines are skipped without
+    being decoded. The pre-filter is only used for string, boolean and ``null``
+    values whose key and value are written verbatim by every JSON encoder, and
+    it can only reject lines; matches are verified on the decoded record.
+    Numbers are not pre-filtered, since an integer condition also matches
+    floats such as ``1.0`` or ``1e0``.
+    """
+
+    def __init__(self, where=None, fields: Optional[Sequence[str]] = None):
+        self.fields = None if fields is None else list(fields)
+        self.conditions = {}
+        self.predicate = None
+        self.patterns = []
+        if where is None:
+            pass
+        elif isinstance(where, dict):
+            self.conditions = dict(where)
+            for key, value in self.conditions.items():
+                pattern = self._condition_pattern(key, value)
+                if pattern is not None:
+                    self.patterns.append(pattern)
+        elif isinstance(where, (str, bytes, re.Pattern)):
+            flags = 0
+            if isinstance(where, re.Pattern):
+                # Bytes patterns reject re.UNICODE, which str patterns carry
+                flags = where.flags & ~re.UNICODE
+                where = where.pattern
+            if isinstance(where, str):
+                where = where.encode("utf-8")
+            self.patterns.append(re.compile(where, flags))
+        elif callable(where):
+            self.predicate = where
+        else:
+            raise TypeError(
+                "where must be a dict, a regular expression or a callable, "
+                f"got {type(where).__name__}"
+            )
+
+    @property
+    def selects(self) -> bool:
+        return bool(self.conditions or self.predicate or self.patterns)
+
+    @staticmethod
+    def _condition_pattern(key, value):
+        if not isinstance(key, str) or not _JSONL_VERBATIM.fullmatch(key):
+            return None
+        if value is None:
+            raw = b"null"
+        elif isinstance(value, bool):
+            raw = b"true" if value else b"false"
+        elif isinstance(value, str) and _JSONL_VERBATIM.fullmatch(value):
+            raw = b'"' + re.escape(value.encode("ascii")) + b'"'
+        else:
+            return None
+        return re.compile(
+            b'"' + re.escape(key.encode("ascii")) + rb'"\s*:\s*' + raw + rb"(?![\w.])"
+        )
+
+    def decoder(self, loads: Callable[[bytes], Any]) -> Callable[[bytes], Any]:
+        """Wrap ``loads`` into a function returning the selected record or ``_SKIP``."""
+
+        if not self.selects and self.fields is None:
+            return loads
+        patterns = [pattern.search for pattern in self.patterns]
+        conditions = list(self.conditions.items())
+        predicate = self.predicate
+        fields = self.fields
+
+        def _decode(line: bytes):
+            for search in patterns:
+                if search(line) is None:
+                    return _SKIP
+            record = loads(line)
+            if conditions and not (
+                isinstance(record, dict)
+                and all(
+                    key in record and _json_equal(record[key], value)
+                    for key, value in conditions
+                )
+            ):
+                return _SKIP
+            if predicate is not None and not predicate(record):
+                return _SKIP
+            if fields is not None and isinstance(record, dict):
+                record = {key: record[key] for key in fields if key in record}
+            return record
+
+        return _decode
+
+
+class _JsonlIterable:
+    """Iterable view over a JSONL file returned by :func:`iter_jsonl`."""
+
+    def __init__(
+        self,
+        file_path,
+        max_samples: Optional[int] = None,
+        index: Union[bool, PathLike] = False,
+        mmap: bool = False,
+        json_backend: Optional[str] = None,
+        rank: Optional[int] = None,
+        world_size: Optional[int] = None,
+        distributed: bool = False,
+        fields: Optional[Sequence[str]] = None,
+        where=None,
+    ):
+        self.file_path = file_path
+        self._offsets = None
+        self._max_samples = max_samples
+        self._index = index
+        self._mmap = mmap
+        self._json_backend = json_backend
+        self._shard = _resolve_shard(rank, world_size, distributed)
+        self._filter = _RecordFilter(where, fields)
+        self._range = None
+        self._position = None  # progress of the current or last iteration
+        self._resume = None  # position the next iteration starts from
+        self._mm = None
+        self._mm_pid = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Memory maps cannot be pickled; they are reopened lazily in the new process
+        state["_mm"] = None
+        state["_mm_pid"] = None
+        if isinstance(state["_offsets"], np.memmap):
+            state["_offsets"] = None
+        return state
+
+    def _byte_range(self) -> Tuple[int, Optional[int]]:
+        """Return the ``[start, end)`` byte range of the lines owned by this rank."""
+
+        if self._shard is None:
+            return 0, None
+        if self._range is None:
+            rank, world_size = self._shard
+            size = os.path.getsize(self.file_path)
+            with open(self.file_path, "rb") as fp:
+                self._range = tuple(
+                    _line_start(fp, size * k // world_size) for k in (rank, rank + 1)
+                )
+        return self._range
+
+    def _scan_index(self) -> np.ndarray:
+        start, end = self._byte_range()
+        return _scan_jsonl_offsets(self.file_path, start=start, end=end)
+
+    def _restrict_index(self, offsets: np.ndarray) -> np.ndarray:
+        """Keep the entries of a whole-file index that belong to this rank."""
+
+        if self._shard is None:
+            return offsets
+        start, end = self._byte_range()
+        lo, hi = np.searchsorted(offsets, [start, end])
+        return offsets[lo:hi]
+
+    def _ensure_offsets(self):
+        if self._offsets is not None:
+            return
+        if self._index is False or self._index is None:
+            # Reuse an up-to-date sidecar index, but never write one
+            offsets = _load_jsonl_index(
+                self.file_path, _jsonl_index_path(self.file_path)
+            )
+        else:
+            index_path = None if self._index is True else self._index
+            index_path = (
+                Path(index_path)
+                if index_path is not None
+                else _jsonl_index_path(self.file_path)
+            )
+            offsets = _load_jsonl_index(self.file_path, index_path)
+            if offsets is None:
+                try:
+                    build_jsonl_index(self.file_path, index_path)
+                    offsets = _load_jsonl_index(self.file_path, index_path)
+                except OSError as exc:
+                    warnings.warn(
+                        f"Failed to write JSONL index {index_path} ({exc}); "
+                        "using an in-memory index."
                     )
-                fp.write(line)
-                fp.write("\n")
+        if offsets is None:
+            self._offsets = self._scan_index()
+        else:
+            self._offsets = self._restrict_index(offsets)
+
+    def state_dict(self) -> Dict[str, int]:
+        """Return the progress of the current (or last) iteration over the view.
+
+        The state holds the byte offset right after the last record yielded and
+        the number of records yielded so far. Pass it to :meth:`load_state_dict`
+        to resume from that point after a restart.
+        """
+
+        if self._position is None:
+            return {"offset": self._byte_range()[0], "count": 0}
+        offset, count = self._position
+        return {"offset": offset, "count": count}
+
+    def load_state_dict(self, state: Dict[str, int]):
+        """Make the next iteration resume from a state returned by :meth:`state_dict`.
+
+        The file is not replayed: iteration seeks straight to the saved offset.
+        The state only applies to the next call of ``iter()``.
+        """
+
+        start, end = self._byte_range()
+        offset = int(state["offset"])
+        if offset < start or (end is not None and offset > end):
+            raise ValueError(f"Offset {offset} is outside of the range of this view")
+        self._position = (offset, int(state["count"]))
+        self._resume = self._position
+
+    def _loads(self) -> Callable[[bytes], Any]:
+        return self._filter.decoder(get_json_codec(self._json_backend).loads)
+
+    def __iter__(self):
+        loads = self._loads()
+        start, end = self._byte_range()
+        count = 0
+        if self._resume is not None:
+            (start, count), self._resume = self._resume, None
+        self._position = (start, count)
+        with open(self.file_path, "rb") as fp:
+            fp.seek(start)
+            pos = start
+            for line in fp:
+                if end is not None and pos >= end:
+                    break
+                pos += len(line)
+                line = line.strip(_JSONL_WHITESPACE)
+                if not line:
+                    continue
+                if self._max_samples is not None and count >= self._max_samples:
+                    break
+                record = loads(line)
+                if record is _SKIP:
+                    continue
+                count += 1
+                self._position = (pos, count)
+                yield record
+
+    def _num_records(self) -> int:
+        """Number of records exposed by the view, ignoring ``where``."""
+
+        self._ensure_offsets()
+        if self._max_samples is None:
+            return len(self._offsets)
+        return min(len(self._offsets), self._max_samples)
+
+    def __len__(self):
+        if self._filter.selects:
+            raise TypeError(
+                "len() and indexing are not supported on a view with `where`"
+            )
+        return self._num_records()
+
+    def _ensure_mmap(self):
+        # Reopen after fork so that workers do not share the parent's mapping
+        if self._mm is None or self._mm_pid != os.getpid():
+            with open(self.file_path, "rb") as fp:
+                self._mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mm_pid = os.getpid()
+        return self._mm
+
+    def _read_records(self, indices: Iterable[int]) -> List[Any]:
+        offsets = self._offsets
+        loads = self._loads()
+        indices = list(indices)
+        if not indices:
+            # Empty files cannot be mapped
+            return []
+        if self._mmap:
+            mm = self._ensure_mmap()
+            # Lines are passed to the decoder as views over the mapping, not copies
+            buffer = memoryview(mm)
+            records = []
+            for i in indices:
+                start = int(offsets[i])
+                end = mm.find(b"\n", start)
+                records.append(loads(buffer[start : end if end >= 0 else len(mm)]))
+            return records
+
+        with open(self.file_path, "rb") as fp:
+            records = []
+            for i in indices:
+                fp.seek(int(offsets[i]))
+                records.append(loads(fp.readline()))
+            return records
+
+    def _shuffle_blocks(self, block_size: int) -> List[Tuple[int, int]]:
+        """Split the records into ``[start, stop)`` ranges of contiguous records."""
+
+        n = self._num_records()
+        return [(i, min(i + block_size, n)) for i in range(0, n, block_size)]
+
+    def _read_lines(self, start: int, stop: int) -> List[bytes]:
+        """Read the raw lines of records ``[start, stop)`` with a single read."""
+
+        offsets = self._offsets
+        begin = int(offsets[start])
+        if stop < len(offsets):
+            end = int(offsets[stop])
+        else:
+            end = self._byte_range()[1]
+            end = os.path.getsize(self.file_path) if end is None else end
+        if self._mmap:
+            data = self._ensure_mmap()[begin:end]
+        else:
+            with open(self.file_path, "rb") as fp:
+                fp.seek(begin)
+                data = fp.read(end - begin)
+        return _split_jsonl_lines(data)[: stop - start]
+
+    def block_shuffle(
+        self,
+        seed: Optional[int] = None,
+        block_size: int = 1024,
+        buffer_size: int = 16384,
+    ) -> Iterator[Any]:
+        """Iterate over the records in a shuffled order with mostly sequential reads.
+
+        The records are split into blocks of ``block_size`` contiguous records and
+        the blocks are visited in random order, each read with one sequential
+        I/O. Blocks are gathered into a buffer of at least ``buffer_size``
+        records, which is shuffled before its records are decoded and yielded.
+        Sample order is thus close to a full shuffle, while the disk sees large
+        sequential reads instead of one seek per record.
+
+        Compressed files use their own compressed blocks, so ``block_size`` is
+        ignored and each block is decompressed once. A block is held in memory
+        while it is read, which for a single-member file is the whole file.
+
+        Args:
+            seed: Seed of the shuffle. Use a different seed per epoch, e.g.
+                ``seed=base_seed + epoch``.
+            block_size: Number of contiguous records read at once.
+            buffer_size: Minimum number of records shuffled together. Larger
+                buffers mix blocks better but hold more raw lines in memory.
+
+        Returns:
+            An iterator over every record of the view, once each.
+        """
+
+        self._ensure_offsets()
+        loads = self._loads()
+        rng = np.random.default_rng(seed)
+        blocks = self._shuffle_blocks(block_size)
+
+        def _drain(buffer: List[bytes]) -> Iterator[Any]:
+            for j in rng.permutation(len(buffer)):
+                record = loads(buffer[j])
+                if record is not _SKIP:
+                    yield record
+
+        buffer = []
+        for i in rng.permutation(len(blocks)):
+            buffer.extend(self._read_lines(*blocks[i]))
+            if len(buffer) >= buffer_size:
+                yield from _drain(buffer)
+                buffer = []
+        yield from _drain(buffer)
+
+    def __getitem__(self, index):
+        """Get one record by integer index, or a list of records by slice or index array.
+
+        Negative indices count from the end. Batch indexing with a slice, a list of
+        integers or an integer numpy array opens the file (or mapping) once for the
+        whole batch.
+        """
+
+        self._ensure_offsets()
+        effective_len = len(self)
+
+        if isinstance(index, (int, np.integer)) and not isinstance(index, bool):
+            index = int(index)
+            if index < 0:
+                index += effective_len
+            if not 0 <= index < effective_len:
+                raise IndexError("index out of range")
+            return self._read_records([index])[0]
+
+        if isinstance(index, slice):
+            return self._read_records(range(*index.indices(effective_len)))
+
+        if isinstance(index, (list, tuple, np.ndarray)):
+            indices = np.asarray(index)
+            if indices.size == 0:
+                return []
+            if indices.ndim != 1 or indices.dtype.kind not in "iu":
+                raise TypeError("index array must be a 1-D array of integers")
+            indices = np.where(indices < 0, indices + effective_len, indices)
+            if indices.min() < 0 or indices.max() >= effective_len:
+                raise IndexError("index out of range")
+            return self._read_records(indices.tolist())
+
+        raise TypeError("index must be int, slice, or a sequence of ints")
+
+
+class _CompressedJsonlIterable(_JsonlIterable):
+    """View over a ``.jsonl.gz`` / ``.jsonl.zst`` file returned by :func:`iter_jsonl`.
+
+    ``self._offsets`` holds the block table (see :func:`_scan_jsonl_blocks`)
+    instead of line offsets. Random access decompresses only the block holding
+    the record; the most recently decoded block is cached unless it is larger
+    than ``_JSONL_CACHED_BLOCK_BYTES`` compressed bytes.
+    """
+
+    def __init__(self, file_path, *args, **kwargs):
+        super().__init__(file_path, *args, **kwargs)
+        if self._mmap:
+            raise ValueError("mmap=True is not supported for compressed JSONL files")
+        self._compression = _jsonl_compression(file_path)
+        self._block_cache = (None, None)
+        self._warned_large_block = False
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state["_block_cache"] = (None, None)
+        return state
+
+    def _scan_index(self) -> np.ndarray:
+        return self._restrict_index(
+            _scan_jsonl_blocks(self.file_path, self._compression)
+        )
+
+    def _restrict_index(self, table: np.ndarray) -> np.ndarray:
+        """Keep the blocks owned by this rank, split evenly by compressed size.
+
+        Record numbers are shifted so that the first record of the rank is 0.
+        """
 
+        if self._shard is None:
+            return table
+        rank, world_size = self._shard
+        starts = table[:-1, 0].astype(np.int64)
+        size = int(table[-1, 0])
+        first, last = np.searchsorted(
+            starts, [size * rank // world_size, size * (rank + 1) // world_size]
+        )
+        table = np.array(table[first : last + 1], dtype=np.uint64)
+        table[:, 1] -= table[0, 1]
+        return table
+
+    def _byte_range(self) -> Tuple[int, Optional[int]]:
+        if self._shard is None:
+            return 0, None
+        self._ensure_offsets()
+        return int(self._offsets[0, 0]), int(self._offsets[-1, 0])
+
+    def state_dict(self) -> Dict[str, int]:
+        """Return the progress of the current (or last) iteration over the view.
+
+        Compressed data can only be re-entered at the start of a block, so the
+        state holds the compressed offset of the block to restart from, the
+        number of records to ``skip`` in it and the number of records yielded.
+        """
+
+        if self._position is None:
+            return {"offset": self._byte_range()[0], "skip": 0, "count": 0}
+        offset, skip, count = self._position
+        return {"offset": offset, "skip": skip, "count": count}
+
+    def load_state_dict(self, state: Dict[str, int]):
+        start, end = self._byte_range()
+        offset = int(state["offset"])
+        if offset < start or (end is not None and offset > end):
+            raise ValueError(f"Offset {offset} is outside of the range of this view")
+        self._position = (offset, int(state["skip"]), int(state["count"]))
+        self._resume = self._position
+
+    def __iter__(self):
+        loads = self._loads()
+        start, end = self._byte_range()
+        skip = count = 0
+        if self._resume is not None:
+            (start, skip, count), self._resume = self._resume, None
+        # Records yielded (or skipped) since the last block that starts a line
+        restart, since = start, 0
+        self._position = (restart, skip, count)
+
+        def _records(lines):
+            nonlocal skip, since, count
+            for line in lines:
+                since += 1
+                if skip:
+                    skip -= 1
+                    continue
+                if self._max_samples is not None and count >= self._max_samples:
+                    return
+                record = loads(line)
+                if record is _SKIP:
+                    continue
+                count += 1
+                self._position = (restart, since, count)
+                yield record
+
+        for block_start, lines in _iter_compressed_lines(
+            self.file_path, self._compression, start=start, end=end
+        ):
+            if block_start is not None:
+                restart, since = block_start, 0
+            yield from _records(lines)
+            if self._max_samples is not None and count >= self._max_samples:
+                return
 
-def iter_jsonl(file, max_samples: Optional[int] = None):
+    def _num_records(self) -> int:
+        self._ensure_offsets()
+        num_records = int(self._offsets[-1, 1])
+        if self._max_samples is None:
+            return num_records
+        return min(num_records, self._max_samples)
+
+    def _read_block(self, block: int) -> List[bytes]:
+        cached_block, lines = self._block_cache
+        if cached_block == block:
+            return lines
+        start, end = int(self._offsets[block, 0]), int(self._offsets[block + 1, 0])
+        with open(self.file_path, "rb") as fp:
+            fp.seek(start)
+            data = fp.read(end - start)
+        lines = _split_jsonl_lines(_decompress_blocks(data, self._compression))
+        self._block_cache = (block, lines)
+        return lines
+
+    def _block_lines(self, block: int, positions: Sequence[int]) -> List[bytes]:
+        """Return the lines at ``positions``, counted from the start of ``block``.
+
+        Small blocks are decompressed at once and cached. Larger ones, such as
+        the single member of a file written by the ``gzip`` command, are
+        streamed from their start up to the last requested line, keeping only
+        the requested lines.
+        """
+
+        start, end = int(self._offsets[block, 0]), int(self._offsets[block + 1, 0])
+        if end - start <= _JSONL_CACHED_BLOCK_BYTES:
+            lines = self._read_block(block)
+            return [lines[p] for p in positions]
+
+        if not self._warned_large_block:
+            self._warned_large_block = True
+            warnings.warn(
+                f"{self.file_path} has a compressed block of {end - start} bytes; "
+                "random access decompresses it from its start on every access. "
+                "Write the file with `save_jsonl` to get small blocks.",
+                stacklevel=4,
+            )
+        wanted = sorted(set(positions))
+        found = {}
+        base = 0
+        for _, lines in _iter_compressed_lines(
+            self.file_path, self._compression, start=start, end=end
+        ):
+            while len(found) < len(wanted) and wanted[len(found)] < base + len(lines):
+                position = wanted[len(found)]
+                found[position] = lines[position - base]
+            if len(found) == len(wanted):
+                break
+            base += len(lines)
+        return [found[p] for p in positions]
+
+    def _shuffle_blocks(self, block_size: int) -> List[Tuple[int, int]]:
+        n = self._num_records()
+        first_records = self._offsets[:, 1].astype(np.int64)
+        return [
+            (int(start), int(min(stop, n)))
+            for start, stop in zip(first_records[:-1], first_records[1:])
+            if start < min(stop, n)
+        ]
+
+    def _read_lines(self, start: int, stop: int) -> List[bytes]:
+        first_records = self._offsets[:, 1].astype(np.int64)
+        block = int(np.searchsorted(first_records, start, side="right")) - 1
+        first = int(first_records[block])
+        return self._block_lines(block, range(start - first, stop - first))
+
+    def _read_records(self, indices: Iterable[int]) -> List[Any]:
+        loads = self._loads()
+        indices = np.asarray(list(indices), dtype=np.int64)
+        if not len(indices):
+            return []
+        first_records = self._offsets[:, 1].astype(np.int64)
+        blocks = np.searchsorted(first_records, indices, side="right") - 1
+        records = [None] * len(indices)
+        # Visit records block by block so that every block is decompressed once
+        order = np.argsort(blocks, kind="stable")
+        for group in np.split(order, np.flatnonzero(np.diff(blocks[order])) + 1):
+            block = int(blocks[group[0]])
+            positions = (indices[group] - first_records[block]).tolist()
+            for pos, line in zip(group, self._block_lines(block, positions)):
+                records[pos] = loads(line)
+        return records
+
+
+def iter_jsonl(
+    file,
+    max_samples: Optional[int] = None,
+    index: Union[bool, PathLike] = False,
+    mmap: bool = False,
+    json_backend: Optional[str] = None,
+    rank: Optional[int] = None,
+    world_size: Optional[int] = None,
+    distributed: bool = False,
+    fields: Optional[Sequence[str]] = None,
+    where: Union[
+        Dict[str, Any], str, bytes, re.Pattern, Callable[[Any], bool], None
+    ] = None,
+):
     """Create an iterable view over a JSONL file.
 
     Empty lines are skipped. The returned object supports iteration, ``len()``,
-    and non-negative integer indexing. Length and indexing are backed by a lazy
-    offset index built on first use.
+    and indexing. Length and indexing are backed by an offset index built on
+    first use. Indexing accepts negative integers, slices and integer arrays; the
+    latter two return a list of records read in one batch.
+
+    By default the offset index is kept in memory and rebuilt by every new view,
+    unless an up-to-date index already exists next to the file. With
+    ``index=True`` it is persisted next to the file (``file + ".idx"``, see
+    :func:`build_jsonl_index`) and memory-mapped, so it is built once and then
+    shared by every process, e.g. all DataLoader workers and later jobs. The index
+    is rebuilt automatically when the size or modification time of ``file``
+    changes.
+
+    Files ending with ``.gz`` or ``.zst`` are decompressed on the fly. When they
+    were written by :func:`save_jsonl`, ``len()`` and indexing use the block index
+    written alongside them and only decompress the block holding each record.
+    Other files, e.g. written by the ``gzip`` command, usually form one single
+    block: iteration and ``len()`` stream it in bounded memory, but random
+    access decompresses it from the start on every access, with a warning.
+
+    With ``rank`` / ``world_size`` (or ``distributed=True``) the view only covers
+    the lines of one contiguous slice of the file, so every rank reads
+    ``1 / world_size`` of the data instead of reading everything and filtering.
+    Slices are split by bytes and aligned on lines, hence ranks may hold slightly
+    different numbers of records. ``len()``, indexing and ``max_samples`` apply
+    to the rank's own records. Compressed files are split along whole blocks,
+    which needs their block index; without one every rank decompresses the
+    whole file once to build it.
+
+    ``where`` selects records and ``fields`` projects them. With a dict such as
+    ``where={"split": "train"}``, lines are first matched against the raw
+    ``"split": "train"`` bytes and only candidates are decoded, so selective
+    queries skip decoding most of the file. The byte pre-filter applies to
+    string, boolean and ``null`` conditions on plain ASCII keys and values;
+    other conditions, including numbers, are checked on the decoded record only.
+    A compiled ``where`` pattern keeps its flags, such as :data:`re.IGNORECASE`.
+    ``len()`` and indexing are not available when ``where`` is set, since the
+    number of matching records is unknown.
 
     Args:
         file: Source JSONL file path.
         max_samples: Optional maximum number of non-empty JSONL records to expose.
+        index: ``False`` to keep a newly built offset index in memory, ``True`` to
+            use (and build if needed) the sidecar index next to ``file``, or a
+            path to a custom index location.
+        mmap: If ``True``, memory-map the file and decode records straight from
+            the mapped buffer instead of opening, seeking and reading the file for
+            every access. Indexing and slicing hand the decoder views over the
+            mapping without copying the lines; the ``"json"`` and ``"ujson"``
+            backends still copy each line since they only accept ``bytes``.
+            Block shuffling reads whole blocks, which are copied. The mapping is
+            reopened lazily after ``fork``, so the view can be shared with
+            DataLoader workers. Not supported for compressed files.
+        json_backend: JSON library used for decoding, see
+            :func:`~dl_utils.data.json_codec.set_json_backend`. Defaults to the
+            global backend.
+        rank: Index of the slice to read.
+        world_size: Number of slices.
+        distributed: Shard by the rank of the current process. ``rank`` and
+            ``world_size`` default to the ``RANK`` and ``WORLD_SIZE`` set by
+            ``torchrun``.
+        fields: Only keep these top-level keys of every record.
+        where: Record selection. A dict of top-level ``key: value`` equality
+            conditions that must all hold, a regular expression (``str``,
+            ``bytes`` or compiled) searched in the raw line bytes, or a callable
+            applied to the decoded record. ``max_samples`` counts selected
+            records.
 
     Returns:
         An iterable object yielding one decoded JSON object per non-empty line.
+
+    Examples:
+        Random access over a JSONL-backed dataset::
+
+            view = iter_jsonl("train.jsonl", index=True, mmap=True)
+            sample = view[-1]
+            batch = view[[3, 1, 4, 1, 5]]
+
+        Shuffled epochs with sequential block reads, see
+        :meth:`~_JsonlIterable.block_shuffle`::
+
+            for sample in view.block_shuffle(seed=epoch):
+                ...
+
+        Read two fields of the training split only::
+
+            for record in iter_jsonl(
+                "manifest.jsonl", where={"split": "train"}, fields=["id", "path"]
+            ):
+                ...
+
+        Each ``torchrun`` rank reads its own part of the file::
+
+            for sample in iter_jsonl("train.jsonl", distributed=True):
+                ...
     """
 
-    class _JsonlIterable:
-        def __init__(self, file_path, max_samples: Optional[int] = None):
-            self.file_path = file_path
-            self._offsets = None
-            self._max_samples = max_samples
+    view_cls = _JsonlIterable
+    if _jsonl_compression(file) is not None:
+        view_cls = _CompressedJsonlIterable
+    return view_cls(
+        file,
+        max_samples=max_samples,
+        index=index,
+        mmap=mmap,
+        json_backend=json_backend,
+        rank=rank,
+        world_size=world_size,
+        distributed=distributed,
+        fields=fields,
+        where=where,
+    )
 
-        def _ensure_offsets(self):
-            if self._offsets is not None:
-                return
-            offsets = []
-            with open(self.file_path, "r") as fp:
-                while True:
-                    pos = fp.tell()
-                    line = fp.readline()
-                    if not line:
-                        break
-                    if line.strip():
-                        offsets.append(pos)
-            self._offsets = offsets
-
-        def __iter__(self):
-            with open(self.file_path, "r") as fp:
-                count = 0
-                for line in fp:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    if self._max_samples is not None and count >= self._max_samples:
-                        break
-                    count += 1
-                    yield json.loads(line)
-
-        def __len__(self):
-            self._ensure_offsets()
-            if self._max_samples is None:
-                return len(self._offsets)
-            return min(len(self._offsets), self._max_samples)
-
-        def __getitem__(self, index):
-            if not isinstance(index, int):
-                raise TypeError("index must be int")
-            if index < 0:
-                raise IndexError("negative index is not supported")
-            self._ensure_offsets()
-            effective_len = len(self)
-            if index >= effective_len:
-                raise IndexError("index out of range")
 
-            with open(self.file_path, "r") as fp:
-                fp.seek(self._offsets[index])
-                line = fp.readline()
-                return json.loads(line)
+def _jsonl_byte_ranges(
+    file, num_ranges: int, start: int = 0, end: Optional[int] = None
+) -> List[Tuple[int, int]]:
+    """Split ``[start, end)`` of a JSONL file into byte ranges aligned on newlines.
+
+    Every range starts at the beginning of a line, so each line belongs to exactly
+    one range. Fewer ranges are returned if the file is too small to split.
+    """
+
+    end = os.path.getsize(file) if end is None else end
+    boundaries = [start]
+    with open(file, "rb") as fp:
+        for k in range(1, num_ranges):
+            pos = start + (end - start) * k // num_ranges
+            if pos <= boundaries[-1]:
+                continue
+            # Move to the start of the next line. If ``pos`` already starts a line,
+            # the newline right before it is consumed and ``pos`` is kept.
+            fp.seek(pos - 1)
+            fp.readline()
+            pos = fp.tell()
+            if boundaries[-1] < pos < end:
+                boundaries.append(pos)
+    boundaries.append(end)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _parse_jsonl_range(
+    file,
+    start: int,
+    end: int,
+    max_samples: Optional[int] = None,
+    json_backend: Optional[str] = None,
+    compression: Optional[str] = None,
+) -> List[Any]:
+    """Decode the non-empty JSONL lines inside one byte range.
+
+    For compressed files the range must cover whole compressed blocks.
+    """
+
+    with open(file, "rb") as fp:
+        fp.seek(start)
+        data = fp.read(end - start)
+    if compression is not None:
+        data = _decompress_blocks(data, compression)
 
-    return _JsonlIterable(file, max_samples=max_samples)
+    loads = get_json_codec(json_backend).loads
+    lines = _split_jsonl_lines(data)
+    if max_samples is not None:
+        lines = lines[:max_samples]
+    return [loads(line) for line in lines]
 
 
-def load_jsonl(file, max_samples: Optional[int] = None):
+def load_jsonl(
+    file,
+    max_samples: Optional[int] = None,
+    n_jobs: Optional[int] = None,
+    min_range_size: int = 1 << 20,
+    json_backend: Optional[str] = None,
+):
     """Load a JSONL file into a list.
 
+    With ``n_jobs`` set, the file is split into byte ranges aligned on newlines
+    and the ranges are decoded in a process pool. Records are returned in file
+    order either way. Compressed files are split along their blocks, which
+    requires the block index written by :func:`save_jsonl`; without it they are
+    decoded in the current process.
+
     Args:
         file: Source JSONL file path.
         max_samples: Optional maximum number of non-empty JSONL records to load.
+        n_jobs: Number of worker processes used for parallel decoding. ``None``
+            decodes in the current process; negative values follow the joblib
+            convention (``-1`` uses all CPUs).
+        min_range_size: Minimum size in bytes of one byte range in parallel mode.
+            Small files are decoded with fewer workers to avoid pool overhead.
+        json_backend: JSON library used for decoding, see
+            :func:`~dl_utils.data.json_codec.set_json_backend`. Defaults to the
+            global backend.
 
     Returns:
         A list of decoded JSON objects.
     """
 
-    return list(iter_jsonl(file, max_samples=max_samples))
+    if n_jobs is None or n_jobs == 1:
+        return list(
+            iter_jsonl(file, max_samples=max_samples, json_backend=json_backend)
+        )
+
+    if n_jobs < 0:
+        n_jobs = max((os.cpu_count() or 1) + 1 + n_jobs, 1)
+    size = os.path.getsize(file)
+    # Several ranges per worker balance the load when line lengths vary
+    num_ranges = max(min(n_jobs * 4, size // max(min_range_size, 1)), 1)
+    compression = _jsonl_compression(file)
+    if compression is None:
+        ranges = _jsonl_byte_ranges(file, num_ranges)
+    else:
+        blocks = _load_jsonl_index(file, _jsonl_index_path(file))
+        ranges = [(0, size)]
+        if blocks is not None:
+            boundaries = np.unique(
+                blocks[np.linspace(0, len(blocks) - 1, num_ranges + 1).astype(int), 0]
+            ).tolist()
+            ranges = list(zip(boundaries[:-1], boundaries[1:]))
+    if len(ranges) <= 1:
+        return list(
+            iter_jsonl(file, max_samples=max_samples, json_backend=json_backend)
+        )
+
+    n_jobs = min(n_jobs, len(ranges))
+    tasks = [
+        delayed(_parse_jsonl_range)(
+            file, start, end, max_samples, json_backend, compression
+        )
+        for start, end in ranges
+    ]
+    if max_samples is None:
+        chunks = Parallel(n_jobs=n_jobs, backend="loky")(tasks)
+        return [record for chunk in chunks for record in chunk]
+
+    # Decode in waves of ``n_jobs`` ranges and stop once enough records are read
+    records = []
+    with Parallel(n_jobs=n_jobs, backend="loky") as parallel:
+        for i in range(0, len(tasks), n_jobs):
+            for chunk in parallel(tasks[i : i + n_jobs]):
+                records.extend(chunk)
+            if len(records) >= max_samples:
+                break
+    return records[:max_samples]
+
+
+_SHARD_MANIFEST_SUFFIX = ".manifest.json"
+
+
+class ShardedJsonlWriter:
+    """Write JSONL records into numbered shards described by a manifest.
+
+    Records are written to ``part-00000.jsonl``, ``part-00001.jsonl``, ... inside
+    ``out_dir``. A new shard is started once the current one holds
+    ``max_records`` records or ``max_bytes`` bytes. Every time a shard is
+    finished, the manifest ``part.manifest.json`` is atomically rewritten with
+    the file name, record count and size of all finished shards, so the shards
+    completed before a crash remain usable.
+
+    :func:`iter_files` and :func:`load_files` accept the manifest path directly
+    and read the listed shards in order without globbing.
+
+    Compressed shards are written when ``suffix`` ends with ``.gz`` or ``.zst``;
+    see :func:`save_jsonl`. ``max_bytes`` then counts uncompressed bytes.
+
+    Args:
+        out_dir: Output directory, created if needed.
+        max_records: Maximum number of records per shard.
+        max_bytes: Maximum number of bytes per shard. A shard is closed as soon
+            as it reaches this size, so it can exceed it by at most one record.
+        prefix: File name prefix of the shards and the manifest.
+        suffix: File name suffix of the shards.
+        json_backend: JSON library used for encoding, see
+            :func:`~dl_utils.data.json_codec.set_json_backend`.
+        block_size: Uncompressed size of one block for compressed shards.
+        **kwargs: Extra keyword arguments forwarded to :func:`json.dumps`.
+
+    Examples:
+        Write shards of 100k records and read them back::
+
+            with ShardedJsonlWriter("out", max_records=100_000) as writer:
+                for item in items:
+                    writer.write(item)
+
+            records = load_files(
+                "out/part.manifest.json", loader=load_jsonl, flatten=True
+            )
+    """
+
+    def __init__(
+        self,
+        out_dir: PathLike,
+        max_records: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        prefix: str = "part",
+        suffix: str = ".jsonl",
+        json_backend: Optional[str] = None,
+        block_size: int = 1 << 18,
+        **kwargs,
+    ):
+        if max_records is None and max_bytes is None:
+            raise ValueError("At least one of max_records and max_bytes must be set.")
+        self.out_dir = Path(out_dir)
+        self.manifest_path = self.out_dir / f"{prefix}{_SHARD_MANIFEST_SUFFIX}"
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self.suffix = suffix
+        self.block_size = block_size
+        self.shards: List[Dict[str, Any]] = []
+
+        self._dumps = get_json_codec(json_backend).dumps_bytes
+        self._kwargs = kwargs
+        self._compression = _jsonl_compression(suffix)
+        self._fp = None
+        self._block_writer = None
+        self._shard_path = None
+        self._shard_records = 0
+        self._shard_bytes = 0
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def num_records(self) -> int:
+        """Number of records written so far, including the open shard."""
+
+        return sum(s["num_records"] for s in self.shards) + self._shard_records
+
+    def write(self, item):
+        """Write one record, starting a new shard first if needed."""
+
+        line = self._dumps(item, **self._kwargs)
+        if b"\n" in line:
+            raise ValueError(
+                "JSONL line contains newline. Avoid pretty JSON (e.g., indent=2). "
+                f"Line index: {self.num_records}."
+            )
+        if self._fp is None:
+            self._open_shard()
+        if self._block_writer is not None:
+            self._block_writer.write(line)
+        else:
+            self._fp.write(line)
+            self._fp.write(b"\n")
+        self._shard_records += 1
+        self._shard_bytes += len(line) + 1
+
+        if (
+            self.max_records is not None and self._shard_records >= self.max_records
+        ) or (self.max_bytes is not None and self._shard_bytes >= self.max_bytes):
+            self._close_shard()
+
+    def write_many(self, data: Iterable[Any]):
+        """Write every record of an iterable."""
+
+        for item in data:
+            self.write(item)
+
+    def _open_shard(self):
+        name = f"{self.prefix}-{len(self.shards):05d}{self.suffix}"
+        self._shard_path = self.out_dir / name
+        self._fp = open(self._shard_path, "wb")
+        if self._compression is not None:
+            self._block_writer = _JsonlBlockWriter(
+                self._fp, self._compression, self.block_size
+            )
+
+    def _close_shard(self):
+        if self._fp is None:
+            return
+        blocks = None
+        if self._block_writer is not None:
+            blocks = self._block_writer.close()
+        self._fp.close()
+        if blocks is not None:
+            _write_jsonl_index(
+                self._shard_path, _jsonl_index_path(self._shard_path), blocks
+            )
+        self.shards.append(
+            {
+                "file": self._shard_path.name,
+                "num_records": self._shard_records,
+                "num_bytes": os.path.getsize(self._shard_path),
+            }
+        )
+        self._fp = self._block_writer = self._shard_path = None
+        self._shard_records = self._shard_bytes = 0
+        self._write_manifest()
+
+    def _write_manifest(self):
+        manifest = {
+            "num_records": sum(s["num_records"] for s in self.shards),
+            "num_bytes": sum(s["num_bytes"] for s in self.shards),
+            "shards": self.shards,
+        }
+        tmp_path = self.out_dir / f".{self.manifest_path.name}.tmp"
+        save_json(manifest, tmp_path, save_pretty=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def close(self) -> Path:
+        """Finish the open shard and write the final manifest.
+
+        Returns:
+            Path to the manifest.
+        """
+
+        if self._fp is not None:
+            self._close_shard()
+        elif not self.manifest_path.exists():
+            self._write_manifest()
+        return self.manifest_path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def save_jsonl_shards(
+    data: Iterable[Any],
+    out_dir: PathLike,
+    max_records: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    **kwargs,
+) -> Path:
+    """Save an iterable of objects as sharded JSONL files with a manifest.
+
+    This is a shortcut for :class:`ShardedJsonlWriter`.
+
+    Args:
+        data: Iterable of JSON-serializable objects to save.
+        out_dir: Output directory.
+        max_records: Maximum number of records per shard.
+        max_bytes: Maximum number of bytes per shard.
+        **kwargs: Extra keyword arguments passed to :class:`ShardedJsonlWriter`.
+
+    Returns:
+        Path to the manifest.
+    """
+
+    with ShardedJsonlWriter(
+        out_dir, max_records=max_records, max_bytes=max_bytes, **kwargs
+    ) as writer:
+        writer.write_many(data)
+    return writer.manifest_path
+
+
+def load_shard_manifest(file: PathLike) -> List[Path]:
+    """Return the shard paths listed in a manifest written by :class:`ShardedJsonlWriter`.
+
+    Args:
+        file: Manifest path.
+
+    Returns:
+        Shard paths in write order.
+    """
+
+    manifest = load_json(file)
+    return [Path(file).parent / shard["file"] for shard in manifest["shards"]]
+
+
+class AsyncSaver:
+    """Write files in background threads so the calling loop does not wait on disk.
+
+    Writes are queued to a thread pool and return immediately. The queue is
+    bounded by ``max_pending``: once that many writes are in flight, the next
+    call blocks until one of them finishes. Files are written atomically
+    (temporary file plus rename), so readers never see half-written files.
+
+    Errors raised by background writes are collected and re-raised by the next
+    :meth:`flush` or :meth:`close`.
+
+    Objects are serialized in the background, so do not modify them after
+    handing them to the saver.
+
+    Args:
+        max_workers: Number of writer threads.
+        max_pending: Maximum number of queued or running writes.
+
+    Examples:
+        Dump per-sample outputs while the model keeps running::
+
+            with AsyncSaver(max_workers=8) as saver:
+                for batch in loader:
+                    outputs = model(batch)
+                    for key, out in zip(batch["key"], outputs):
+                        saver.save_pickle(out, f"outputs/{key}.pkl")
+    """
+
+    def __init__(self, max_workers: int = 4, max_pending: int = 64):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="AsyncSaver"
+        )
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._errors = []
+        self._closed = False
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """Run ``fn(*args, **kwargs)`` in the background.
+
+        Blocks only if ``max_pending`` writes are already in flight. Use the
+        ``save_*`` methods for atomic writes; ``fn`` is responsible for its own
+        atomicity.
+
+        Returns:
+            The :class:`concurrent.futures.Future` of the write.
+        """
+
+        if self._closed:
+            raise RuntimeError("AsyncSaver is closed")
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future: Future):
+        with self._lock:
+            self._pending.discard(future)
+            if not future.cancelled() and future.exception() is not None:
+                self._errors.append(future.exception())
+        self._slots.release()
+
+    def save_text(self, text: str, file) -> Future:
+        """Queue :func:`save_text`."""
+
+        return self.submit(save_text, text, file, atomic=True)
+
+    def save_bytes(self, data: bytes, file) -> Future:
+        """Queue :func:`save_bytes`."""
+
+        return self.submit(save_bytes, data, file, atomic=True)
+
+    def save_pickle(self, obj, file) -> Future:
+        """Queue :func:`save_pickle`."""
+
+        return self.submit(save_pickle, obj, file, atomic=True)
+
+    def save_json(self, data, file, **kwargs) -> Future:
+        """Queue :func:`save_json`."""
+
+        return self.submit(save_json, data, file, atomic=True, **kwargs)
+
+    def save_jsonl(self, data, file, **kwargs) -> Future:
+        """Queue :func:`save_jsonl`. ``data`` should not be a lazy generator."""
+
+        return self.submit(save_jsonl, data, file, atomic=True, **kwargs)
+
+    def flush(self):
+        """Wait for all queued writes.
+
+        Raises:
+            Exception: The first error raised by a write since the last flush.
+        """
+
+        with self._lock:
+            pending = list(self._pending)
+        wait(pending)
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            if len(errors) > 1:
+                warnings.warn(
+                    f"{len(errors)} background writes failed; raising the first error."
+                )
+            raise errors[0]
+
+    def close(self):
+        """Flush queued writes and stop the writer threads."""
+
+        if self._closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self._closed = True
+            self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
 
 def _resolve_files(
     files_or_dir: Union[PathLike, Iterable[PathLike]],
     pattern: Optional[str] = None,
     sort: bool = True,
+    cache_listing: bool = False,
 ) -> List[Path]:
     """Resolve file inputs into a concrete list of paths.
 
     Args:
         files_or_dir: A directory, a single file path, or an iterable containing
-            file and/or directory paths.
+            file and/or directory paths. Shard manifests (``*.manifest.json``,
+            see :class:`ShardedJsonlWriter`) are expanded to the shards they list.
         pattern: Glob pattern used when expanding directories. Required if any
             input path is a directory; ignored for explicit file paths.
         sort: Whether files found from directory expansion should be sorted.
+        cache_listing: Reuse the directory listing of a previous call while the
+            directories are unchanged, see :func:`~dl_utils.fs.list_files.glob_files`.
 
     Returns:
         A list of resolved file paths. Explicit file-list order is preserved,
@@ -322,14 +2395,18 @@ def _resolve_files(
     """
 
     def _expand_path(path: Path) -> List[Path]:
+        if path.name.endswith(_SHARD_MANIFEST_SUFFIX) and path.is_file():
+            return load_shard_manifest(path)
         if path.is_dir():
             if pattern is None:
                 raise ValueError(
                     "pattern must be provided when files_or_dir contains a directory. "
                     "For example: pattern='*.json' or pattern='**/*.json'."
                 )
-            paths = path.glob(pattern)
-            files = [p for p in paths if p.is_file()]
+            files = [
+                Path(p)
+                for p in glob_files(str(path), pattern, sort=False, cache=cache_listing)
+            ]
             return sorted(files) if sort else files
         return [path]
 
@@ -344,12 +2421,134 @@ def _resolve_files(
     return files
 
 
+# Arrays smaller than this are cheaper to pickle than to pass through shared memory
+_SHARED_MEMORY_MIN_BYTES = 1 << 16
+
+
+class _SharedArray:
+    """Handle of a numpy array placed in shared memory by a worker process."""
+
+    __slots__ = ("name", "shape", "dtype")
+
+    def __init__(self, name: str, shape: Tuple[int, ...], dtype: np.dtype):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+
+def _map_arrays(obj, fn):
+    """Apply ``fn`` to numpy arrays in ``obj`` and plain dict/list/tuple containers."""
+
+    if isinstance(obj, (np.ndarray, _SharedArray)):
+        return fn(obj)
+    if type(obj) is dict:
+        return {key: _map_arrays(value, fn) for key, value in obj.items()}
+    if type(obj) in (list, tuple):
+        return type(obj)(_map_arrays(value, fn) for value in obj)
+    return obj
+
+
+def _unlink_shared(name: str):
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+def _create_untracked_shared(size: int) -> shared_memory.SharedMemory:
+    # Ownership passes to the parent, which unlinks the block after copying it;
+    # the worker's resource tracker must not remove it when the worker exits.
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(create=True, size=size, track=False)
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    if os.name == "posix":
+        # POSIX blocks are registered under their "/"-prefixed system name
+        resource_tracker.unregister("/" + shm.name, "shared_memory")
+    return shm
+
+
+def _to_shared(array):
+    if (
+        not isinstance(array, np.ndarray)
+        or array.dtype.hasobject
+        or array.nbytes < _SHARED_MEMORY_MIN_BYTES
+    ):
+        return array
+    shm = _create_untracked_shared(array.nbytes)
+    try:
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+        return _SharedArray(shm.name, array.shape, array.dtype)
+    except BaseException:
+        shm.unlink()
+        raise
+    finally:
+        shm.close()
+
+
+def _from_shared(handle):
+    if not isinstance(handle, _SharedArray):
+        return handle
+    shm = shared_memory.SharedMemory(name=handle.name)
+    try:
+        return np.ndarray(handle.shape, dtype=handle.dtype, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+class _SharedMemoryLoader:
+    """Picklable loader run in worker processes.
+
+    Large numpy arrays in the result are copied into shared memory and only a
+    small handle is pickled back to the parent.
+    """
+
+    def __init__(self, loader: Callable[..., Any], load_kwargs: Dict[str, Any]):
+        self.loader = loader
+        self.load_kwargs = load_kwargs
+
+    def __call__(self, path: PathLike) -> Any:
+        result = self.loader(path, **self.load_kwargs)
+        created = []
+
+        def _share(array):
+            handle = _to_shared(array)
+            if isinstance(handle, _SharedArray):
+                created.append(handle.name)
+            return handle
+
+        try:
+            return _map_arrays(result, _share)
+        except BaseException:
+            for name in created:
+                _unlink_shared(name)
+            raise
+
+
+def _collect_shared(results: Iterable[Any]) -> Iterator[Any]:
+    for result in results:
+        handles = []
+        _map_arrays(result, handles.append)
+        try:
+            result = _map_arrays(result, _from_shared)
+        except BaseException:
+            # Do not leak the blocks of the arrays that were not restored yet
+            for handle in handles:
+                if isinstance(handle, _SharedArray):
+                    _unlink_shared(handle.name)
+            raise
+        yield result
+
+
 def concurrent_file_loader(
     file_paths: Iterable[PathLike],
     loader: Optional[Callable[..., Any]] = None,
     load_kwargs: Optional[Dict[str, Any]] = None,
     concurrency_limit: Optional[int] = None,
     chunk_size: Optional[int] = None,
+    use_processes: bool = False,
     **kwargs,
 ) -> Iterable[Any]:
     """Load many files concurrently.
@@ -359,6 +2558,17 @@ def concurrent_file_loader(
     yielded in the same order as ``file_paths`` when using joblib's default
     ordered generator mode.
 
+    Threads are enough for reading raw bytes, but loaders that decode images or
+    parse JSON hold the GIL. With ``use_processes=True`` the files are loaded by
+    a pool of worker processes (joblib's ``loky`` backend). Large numpy arrays in
+    the results, alone or inside dicts, lists and tuples, are sent back through
+    :mod:`multiprocessing.shared_memory` instead of being pickled through a pipe.
+    ``loader`` must then be picklable, e.g. a module-level function. Process mode
+    keeps at most ``2 * n_jobs`` results in flight and does not go through
+    joblib, so only ``concurrency_limit``/``n_jobs``, ``chunk_size`` (ignored)
+    and ``return_as`` are accepted. Closing the returned generator early waits
+    for the running loads and releases their shared memory.
+
     Args:
         file_paths: File paths to read.
         loader: Function used to load one file path. If ``None``,
@@ -366,6 +2576,7 @@ def concurrent_file_loader(
         load_kwargs: Extra keyword arguments passed to ``loader``.
         concurrency_limit: Alias for joblib ``n_jobs``.
         chunk_size: Alias for joblib ``batch_size``.
+        use_processes: Load in worker processes instead of threads.
         **kwargs: Extra keyword arguments passed to :class:`joblib.Parallel`.
 
     Returns:
@@ -380,6 +2591,29 @@ def concurrent_file_loader(
     if chunk_size is not None:
         kwargs.setdefault("batch_size", chunk_size)
 
+    if use_processes:
+        # joblib does not hand back results that were never consumed, so their
+        # shared memory could not be released when the caller stops early.
+        n_jobs = _resolve_n_jobs(kwargs.pop("n_jobs", None))
+        return_as = kwargs.pop("return_as", "generator")
+        kwargs.pop("batch_size", None)
+        if kwargs:
+            raise ValueError(
+                f"joblib arguments {sorted(kwargs)} are not supported with "
+                "`use_processes=True`."
+            )
+        results = _windowed_file_loader(
+            file_paths,
+            loader=loader,
+            load_kwargs=load_kwargs,
+            n_jobs=n_jobs,
+            ordered=True,
+            max_inflight=2 * n_jobs,
+            max_inflight_bytes=None,
+            use_processes=True,
+        )
+        return list(results) if return_as == "list" else results
+
     kwargs.setdefault("n_jobs", os.cpu_count() or 1)
     kwargs.setdefault("backend", "threading")
     kwargs.setdefault("return_as", "generator")
@@ -390,27 +2624,253 @@ def concurrent_file_loader(
     return Parallel(**kwargs)(delayed(_load_file)(p) for p in file_paths)
 
 
+def _resolve_n_jobs(n_jobs: Optional[int]) -> int:
+    n_jobs = n_jobs or os.cpu_count() or 1
+    if n_jobs < 0:
+        n_jobs = max((os.cpu_count() or 1) + 1 + n_jobs, 1)
+    return n_jobs
+
+
+def _discard_result(future: Future):
+    """Release the shared memory of a result that will never be consumed."""
+
+    if future.cancelled() or future.exception() is not None:
+        return
+    handles = []
+    _map_arrays(future.result(), handles.append)
+    for handle in handles:
+        if isinstance(handle, _SharedArray):
+            _unlink_shared(handle.name)
+
+
+def _file_size(path: PathLike) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _windowed_file_loader(
+    file_paths: Iterable[PathLike],
+    loader: Callable[..., Any],
+    load_kwargs: Dict[str, Any],
+    n_jobs: int,
+    ordered: bool,
+    max_inflight: Optional[int],
+    max_inflight_bytes: Optional[int],
+    use_processes: bool,
+) -> Iterator[Any]:
+    """Load files with a bounded number of outstanding results.
+
+    A result is outstanding from the moment its file is submitted until it has
+    been yielded. The byte budget is estimated from the on-disk file sizes. At
+    least one file is always in flight, so a file larger than the budget is
+    still loaded.
+    """
+
+    if use_processes:
+        executor = get_reusable_executor(max_workers=n_jobs)
+        load_file = _SharedMemoryLoader(loader, load_kwargs)
+    else:
+        executor = ThreadPoolExecutor(max_workers=n_jobs)
+        load_file = functools.partial(loader, **load_kwargs)
+
+    paths = iter(file_paths)
+    next_path = next(paths, None)
+    pending: Dict[Future, int] = {}
+    order = collections.deque()
+    inflight_bytes = 0
+
+    def _fill():
+        nonlocal next_path, inflight_bytes
+        while next_path is not None:
+            size = _file_size(next_path) if max_inflight_bytes is not None else 0
+            if pending:
+                if max_inflight is not None and len(pending) >= max_inflight:
+                    return
+                if (
+                    max_inflight_bytes is not None
+                    and inflight_bytes + size > max_inflight_bytes
+                ):
+                    return
+            future = executor.submit(load_file, next_path)
+            pending[future] = size
+            if ordered:
+                order.append(future)
+            inflight_bytes += size
+            next_path = next(paths, None)
+
+    def _take(future: Future) -> Any:
+        nonlocal inflight_bytes
+        inflight_bytes -= pending.pop(future)
+        result = future.result()
+        if use_processes:
+            result = next(_collect_shared([result]))
+        return result
+
+    try:
+        _fill()
+        while pending:
+            if ordered:
+                future = order.popleft()
+                wait([future])
+                done = [future]
+            else:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                result = _take(future)
+                _fill()
+                yield result
+    finally:
+        running = [future for future in pending if not future.cancel()]
+        if use_processes:
+            # Wait for the loads that already started, so that their shared
+            # memory is released before the caller moves on or exits.
+            wait(running)
+            for future in running:
+                _discard_result(future)
+        else:
+            executor.shutdown(wait=False)
+
+
+class FileIterator:
+    """Checkpointable iterator returned by :func:`iter_files`.
+
+    Files are resolved and loading starts on the first call of ``next()``. The
+    iterator tracks how many files (and, with ``flatten=True``, how many items of
+    the current file) have been consumed, so a preempted job can save
+    :meth:`state_dict` and continue with :meth:`load_state_dict` instead of
+    loading every file again.
+
+    Examples:
+        ::
+
+            it = iter_files(folder, pattern="*.json", loader=load_json)
+            if checkpoint is not None:
+                it.load_state_dict(checkpoint)
+            for item in it:
+                process(item)
+                checkpoint = it.state_dict()
+    """
+
+    def __init__(
+        self,
+        files: Callable[[], List[Path]],
+        load: Callable[[List[Path]], Iterable[Any]],
+        flatten: bool = False,
+        ordered: bool = True,
+    ):
+        self._files = files
+        self._load = load
+        self._flatten = flatten
+        self._ordered = ordered
+        self._file_index = 0
+        self._item_index = 0
+        self._it = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._it is None:
+            self._it = self._generate()
+        return next(self._it)
+
+    def _generate(self) -> Iterator[Any]:
+        files = self._files()
+        skip = self._item_index
+        results = self._load(files[self._file_index :])
+        try:
+            for data in results:
+                if self._flatten and isinstance(data, list):
+                    # Count the item as consumed before handing it out; the file
+                    # is done together with its last item.
+                    for k in range(skip, len(data)):
+                        if k == len(data) - 1:
+                            self._file_index += 1
+                            self._item_index = 0
+                        else:
+                            self._item_index = k + 1
+                        yield data[k]
+                    if len(data) <= skip:
+                        self._file_index += 1
+                        self._item_index = 0
+                else:
+                    self._file_index += 1
+                    yield data
+                skip = 0
+        finally:
+            if hasattr(results, "close"):
+                results.close()
+
+    def state_dict(self) -> Dict[str, int]:
+        """Return the number of consumed files and items of the current file.
+
+        Raises:
+            ValueError: With ``ordered=False``, where files complete out of order.
+        """
+
+        if not self._ordered:
+            raise ValueError("state_dict() is not supported with ordered=False")
+        return {"file_index": self._file_index, "item_index": self._item_index}
+
+    def load_state_dict(self, state: Dict[str, int]):
+        """Resume from a state returned by :meth:`state_dict`.
+
+        Must be called before iteration starts. Files before ``file_index`` are
+        skipped without being loaded. The file list must resolve to the same
+        files as when the state was saved.
+        """
+
+        if self._it is not None:
+            raise RuntimeError("load_state_dict() must be called before iterating")
+        if not self._ordered:
+            raise ValueError("load_state_dict() is not supported with ordered=False")
+        self._file_index = int(state["file_index"])
+        self._item_index = int(state.get("item_index", 0))
+
+    def close(self):
+        """Stop loading and release the workers, like ``generator.close()``."""
+
+        if self._it is not None:
+            self._it.close()
+
+
 def iter_files(
     files_or_dir: Union[PathLike, Iterable[PathLike]],
     *,
     pattern: Optional[str] = None,
     sort: bool = True,
+    cache_listing: bool = False,
     n_jobs: Optional[int] = None,
     flatten: bool = False,
     loader: Optional[Callable[..., Any]] = None,
     load_kwargs: Optional[Dict[str, Any]] = None,
+    use_processes: bool = False,
+    ordered: bool = True,
+    max_inflight: Optional[int] = None,
+    max_inflight_bytes: Optional[int] = None,
+    rank: Optional[int] = None,
+    world_size: Optional[int] = None,
+    distributed: bool = False,
     **parallel_kwargs,
-) -> Iterator[Any]:
+) -> "FileIterator":
     """Iterate over objects loaded from a directory or file list.
 
     ``loader`` is any callable that accepts a file path and returns the loaded
     object, such as :func:`load_json`, :func:`load_text`, :func:`load_pickle`, or
     a custom function. :func:`load_bytes` is used by default.
 
+    The returned :class:`FileIterator` can be checkpointed with
+    :meth:`~FileIterator.state_dict` and resumed after a restart with
+    :meth:`~FileIterator.load_state_dict`, without reloading the files that were
+    already consumed.
+
     Args:
         files_or_dir: A directory, a single file, or an iterable of files and/or
             directories. If all inputs are explicit files, ``pattern`` can be
-            omitted.
+            omitted. A shard manifest (``*.manifest.json``) written by
+            :class:`ShardedJsonlWriter` stands for the shards it lists.
         pattern: Optional glob pattern used when expanding directories. Required
             if ``files_or_dir`` is a directory or contains directories. Common
             examples are ``"*.json"`` for direct JSON children, ``"*.jsonl"`` for
@@ -419,17 +2879,36 @@ def iter_files(
             shard files.
         sort: Whether directory expansion should be sorted. Explicit file lists
             keep caller-provided order.
+        cache_listing: Cache the directory listing and reuse it while the
+            directories are unchanged, see :func:`~dl_utils.fs.list_files.glob_files`.
         n_jobs: Number of parallel reader jobs. Defaults to all CPUs.
         flatten: If ``True`` and a loaded object is a list, yield each list item;
             otherwise yield one object per file.
         loader: Callable used to load one file path. Defaults to
             :func:`load_bytes`.
         load_kwargs: Extra keyword arguments passed to ``loader``.
+        use_processes: Load in worker processes, for CPU-heavy loaders. See
+            :func:`concurrent_file_loader`.
+        ordered: If ``False``, yield results as soon as they complete instead of
+            in file order, so one slow file does not hold back the others.
+        max_inflight: Maximum number of files loaded but not yet consumed.
+            Defaults to ``2 * n_jobs`` when ``ordered=False``.
+        max_inflight_bytes: Maximum total on-disk size of files loaded but not
+            yet consumed. A single larger file is still loaded.
+        rank: Only load every ``world_size``-th file, starting at this index, so
+            that each rank of a distributed job reads its own subset.
+        world_size: Number of ranks the files are split across.
+        distributed: Split the files by the rank of the current process.
+            ``rank`` and ``world_size`` default to the ``RANK`` and
+            ``WORLD_SIZE`` set by ``torchrun``.
         **parallel_kwargs: Extra keyword arguments passed to
-            :class:`joblib.Parallel`.
+            :class:`joblib.Parallel`. Not supported together with
+            ``ordered=False``, an in-flight budget or ``use_processes=True``,
+            which use a plain executor instead of joblib.
 
-    Yields:
-        Loaded objects, or items inside loaded lists when ``flatten=True``.
+    Returns:
+        A :class:`FileIterator` over loaded objects, or items inside loaded lists
+        when ``flatten=True``.
 
     Examples:
         Skip files that fail to load by wrapping the loader with ``try`` /
@@ -449,27 +2928,52 @@ def iter_files(
             )
     """
 
-    files = _resolve_files(
-        files_or_dir,
-        pattern=pattern,
-        sort=sort,
-    )
+    def _files() -> List[Path]:
+        files = _resolve_files(
+            files_or_dir,
+            pattern=pattern,
+            sort=sort,
+            cache_listing=cache_listing,
+        )
+        shard = _resolve_shard(rank, world_size, distributed)
+        if shard is not None:
+            files = files[shard[0] :: shard[1]]
+        return files
+
     loader = loader or load_bytes
     load_kwargs = load_kwargs or {}
 
-    if n_jobs is not None:
-        parallel_kwargs.setdefault("n_jobs", n_jobs)
+    if not ordered or max_inflight is not None or max_inflight_bytes is not None:
+        if parallel_kwargs:
+            raise ValueError(
+                f"joblib arguments {sorted(parallel_kwargs)} are not supported with "
+                "`ordered=False`, `max_inflight` or `max_inflight_bytes`."
+            )
+        n_jobs = _resolve_n_jobs(n_jobs)
+        if max_inflight is None and max_inflight_bytes is None:
+            max_inflight = 2 * n_jobs
+        load = functools.partial(
+            _windowed_file_loader,
+            loader=loader,
+            load_kwargs=load_kwargs,
+            n_jobs=n_jobs,
+            ordered=ordered,
+            max_inflight=max_inflight,
+            max_inflight_bytes=max_inflight_bytes,
+            use_processes=use_processes,
+        )
+    else:
+        if n_jobs is not None:
+            parallel_kwargs.setdefault("n_jobs", n_jobs)
+        load = functools.partial(
+            concurrent_file_loader,
+            loader=loader,
+            load_kwargs=load_kwargs,
+            use_processes=use_processes,
+            **parallel_kwargs,
+        )
 
-    for data in concurrent_file_loader(
-        files,
-        loader=loader,
-        load_kwargs=load_kwargs,
-        **parallel_kwargs,
-    ):
-        if flatten and isinstance(data, list):
-            yield from data
-        else:
-            yield data
+    return FileIterator(_files, load, flatten=flatten, ordered=ordered)
 
 
 def load_files(
@@ -477,10 +2981,12 @@ def load_files(
     *,
     pattern: Optional[str] = None,
     sort: bool = True,
+    cache_listing: bool = False,
     n_jobs: Optional[int] = None,
     flatten: bool = False,
     loader: Optional[Callable[..., Any]] = None,
     load_kwargs: Optional[Dict[str, Any]] = None,
+    use_processes: bool = False,
     **parallel_kwargs,
 ) -> List[Any]:
     """Load many files into memory as a list.
@@ -490,7 +2996,8 @@ def load_files(
     Args:
         files_or_dir: A directory, a single file, or an iterable of files and/or
             directories. If all inputs are explicit files, ``pattern`` can be
-            omitted.
+            omitted. A shard manifest (``*.manifest.json``) written by
+            :class:`ShardedJsonlWriter` stands for the shards it lists.
         pattern: Optional glob pattern used when expanding directories. Required
             if ``files_or_dir`` is a directory or contains directories. Common
             examples are ``"*.json"`` for direct JSON children, ``"*.jsonl"`` for
@@ -499,12 +3006,16 @@ def load_files(
             shard files.
         sort: Whether directory expansion should be sorted. Explicit file lists
             keep caller-provided order.
+        cache_listing: Cache the directory listing and reuse it while the
+            directories are unchanged, see :func:`~dl_utils.fs.list_files.glob_files`.
         n_jobs: Number of parallel reader jobs. Defaults to all CPUs.
         flatten: If ``True`` and a loaded object is a list, append each list item;
             otherwise append one object per file.
         loader: Callable used to load one file path. Defaults to
             :func:`load_bytes`.
         load_kwargs: Extra keyword arguments passed to ``loader``.
+        use_processes: Load in worker processes, for CPU-heavy loaders. See
+            :func:`concurrent_file_loader`.
         **parallel_kwargs: Extra keyword arguments passed to
             :class:`joblib.Parallel`.
 
@@ -517,15 +3028,169 @@ def load_files(
             files_or_dir,
             pattern=pattern,
             sort=sort,
+            cache_listing=cache_listing,
             n_jobs=n_jobs,
             flatten=flatten,
             loader=loader,
             load_kwargs=load_kwargs,
+            use_processes=use_processes,
             **parallel_kwargs,
         )
     )
 
 
+async def aiter_files(
+    files_or_dir: Union[PathLike, Iterable[PathLike]],
+    *,
+    pattern: Optional[str] = None,
+    sort: bool = True,
+    cache_listing: bool = False,
+    n_jobs: Optional[int] = None,
+    flatten: bool = False,
+    loader: Optional[Callable[..., Any]] = None,
+    load_kwargs: Optional[Dict[str, Any]] = None,
+    ordered: bool = True,
+    max_inflight: Optional[int] = None,
+) -> AsyncIterator[Any]:
+    """Asynchronously iterate over objects loaded from a directory or file list.
+
+    This is the ``asyncio`` counterpart of :func:`iter_files`. ``loader`` runs on
+    a private thread pool, so file I/O overlaps with other coroutines of the
+    event loop (e.g. requests throttled by
+    :class:`~dl_utils.inference.qps_control.QPSLimiter`) instead of blocking it.
+    Breaking out of the ``async for`` loop or cancelling the consuming task
+    cancels the loads that have not started yet.
+
+    Args:
+        files_or_dir: A directory, a single file, or an iterable of files and/or
+            directories, see :func:`iter_files`.
+        pattern: Optional glob pattern used when expanding directories.
+        sort: Whether directory expansion should be sorted.
+        cache_listing: Cache the directory listing and reuse it while the
+            directories are unchanged, see :func:`~dl_utils.fs.list_files.glob_files`.
+        n_jobs: Maximum number of files loaded concurrently. Defaults to all
+            CPUs.
+        flatten: If ``True`` and a loaded object is a list, yield each list item;
+            otherwise yield one object per file.
+        loader: Callable used to load one file path. Defaults to
+            :func:`load_bytes`.
+        load_kwargs: Extra keyword arguments passed to ``loader``.
+        ordered: If ``False``, yield results as soon as they complete instead of
+            in file order.
+        max_inflight: Maximum number of files loaded but not yet consumed.
+            Defaults to ``2 * n_jobs``.
+
+    Yields:
+        Loaded objects, or items inside loaded lists when ``flatten=True``.
+
+    Examples:
+        ::
+
+            async def main():
+                async for item in aiter_files(folder, pattern="*.json", loader=load_json):
+                    await limiter.run(request, item)
+    """
+
+    loop = asyncio.get_running_loop()
+    n_jobs = n_jobs or os.cpu_count() or 1
+    if n_jobs < 0:
+        n_jobs = max((os.cpu_count() or 1) + 1 + n_jobs, 1)
+    max_inflight = max(max_inflight or 2 * n_jobs, 1)
+    loader = loader or load_bytes
+    load_kwargs = load_kwargs or {}
+    load_file = functools.partial(loader, **load_kwargs)
+
+    executor = ThreadPoolExecutor(max_workers=n_jobs)
+    pending = collections.deque()
+    try:
+        files = await loop.run_in_executor(
+            executor,
+            functools.partial(
+                _resolve_files, files_or_dir, pattern, sort, cache_listing
+            ),
+        )
+        paths = iter(files)
+
+        def _fill():
+            for path in paths:
+                pending.append(loop.run_in_executor(executor, load_file, path))
+                if len(pending) >= max_inflight:
+                    return
+
+        _fill()
+        while pending:
+            if ordered:
+                future = pending[0]
+                await asyncio.wait([future])
+            else:
+                done, _ = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                future = next(f for f in pending if f in done)
+            pending.remove(future)
+            data = future.result()
+            _fill()
+            if flatten and isinstance(data, list):
+                for item in data:
+                    yield item
+            else:
+                yield data
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def aload_files(
+    files_or_dir: Union[PathLike, Iterable[PathLike]],
+    *,
+    pattern: Optional[str] = None,
+    sort: bool = True,
+    cache_listing: bool = False,
+    n_jobs: Optional[int] = None,
+    flatten: bool = False,
+    loader: Optional[Callable[..., Any]] = None,
+    load_kwargs: Optional[Dict[str, Any]] = None,
+) -> List[Any]:
+    """Asynchronously load many files into memory as a list.
+
+    This is the eager counterpart of :func:`aiter_files`; results keep the file
+    order.
+
+    Args:
+        files_or_dir: A directory, a single file, or an iterable of files and/or
+            directories, see :func:`iter_files`.
+        pattern: Optional glob pattern used when expanding directories.
+        sort: Whether directory expansion should be sorted.
+        cache_listing: Cache the directory listing and reuse it while the
+            directories are unchanged, see :func:`~dl_utils.fs.list_files.glob_files`.
+        n_jobs: Maximum number of files loaded concurrently. Defaults to all
+            CPUs.
+        flatten: If ``True`` and a loaded object is a list, append each list item;
+            otherwise append one object per file.
+        loader: Callable used to load one file path. Defaults to
+            :func:`load_bytes`.
+        load_kwargs: Extra keyword arguments passed to ``loader``.
+
+    Returns:
+        A list of loaded objects, or flattened list items when ``flatten=True``.
+    """
+
+    return [
+        item
+        async for item in aiter_files(
+            files_or_dir,
+            pattern=pattern,
+            sort=sort,
+            cache_listing=cache_listing,
+            n_jobs=n_jobs,
+            flatten=flatten,
+            loader=loader,
+            load_kwargs=load_kwargs,
+        )
+    ]
+
+
 __all__ = [
     "save_text",
     "load_text",
@@ -533,12 +3198,22 @@ __all__ = [
     "load_bytes",
     "save_pickle",
     "load_pickle",
+    "AsyncSaver",
     "save_json",
     "load_json",
+    "iter_json_array",
     "save_jsonl",
+    "JsonlWriter",
+    "build_jsonl_index",
     "iter_jsonl",
     "load_jsonl",
+    "ShardedJsonlWriter",
+    "save_jsonl_shards",
+    "load_shard_manifest",
     "concurrent_file_loader",
+    "FileIterator",
     "iter_files",
     "load_files",
+    "aiter_files",
+    "aload_files",
 ]
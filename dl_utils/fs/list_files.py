@@ -4,9 +4,12 @@
 # @Project : Deep-Learning-Utils
 # @File    : list_files.py
 
+import fnmatch
+import hashlib
+import json
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List, Union
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import Dict, FrozenSet, List, Tuple, Union
 
 
 def list_files(path: str, depth: Union[int, None] = None) -> List[str]:
@@ -62,7 +65,220 @@ def list_files_multithread(directory, n_jobs=16, depth: Union[int, None] = None)
     return results
 
 
+_GLOB_CACHE_VERSION = 1
+
+
+def _closure(parts: Tuple[str, ...], states) -> FrozenSet[int]:
+    """Add the states reachable by matching ``**`` against zero directories."""
+
+    states = set(states)
+    stack = list(states)
+    while stack:
+        state = stack.pop()
+        if state < len(parts) and parts[state] == "**" and state + 1 not in states:
+            states.add(state + 1)
+            stack.append(state + 1)
+    return frozenset(states)
+
+
+def _match(name: str, part: str) -> bool:
+    if part == name:
+        return True
+    return fnmatch.fnmatchcase(name, part)
+
+
+def _scan_dir(
+    directory: str, parts: Tuple[str, ...], states: FrozenSet[int]
+) -> Tuple[List[str], Dict[str, FrozenSet[int]], int]:
+    """Scan one directory for every pattern state that reached it.
+
+    Returns:
+        The matched files, the subdirectories to visit with their states, and the
+        modification time of ``directory``.
+    """
+
+    files = []
+    children: Dict[str, set] = {}
+    try:
+        mtime_ns = os.stat(directory).st_mtime_ns
+        with os.scandir(directory) as it:
+            entries = list(it)
+    except OSError:
+        return files, {}, -1
+
+    last = len(parts) - 1
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+            is_file = not is_dir and entry.is_file()
+            # Like pathlib, "**" does not descend into symlinked directories
+            is_link = is_dir and entry.is_symlink()
+        except OSError:
+            continue
+        for state in states:
+            if state > last:
+                continue
+            part = parts[state]
+            if part == "**":
+                if is_dir and not is_link:
+                    children.setdefault(entry.path, set()).add(state)
+            elif _match(entry.name, part):
+                if state == last:
+                    if is_file:
+                        files.append(entry.path)
+                elif is_dir:
+                    children.setdefault(entry.path, set()).add(state + 1)
+    return (
+        files,
+        {path: _closure(parts, child) for path, child in children.items()},
+        mtime_ns,
+    )
+
+
+def _walk_glob(
+    root: str, parts: Tuple[str, ...], n_jobs: int
+) -> Tuple[List[str], Dict[str, int]]:
+    """Walk the directories matched by ``parts`` in parallel.
+
+    Returns:
+        The matched files and the modification time of every scanned directory.
+    """
+
+    files = []
+    dir_mtimes = {}
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        pending = {executor.submit(_scan_dir, root, parts, _closure(parts, {0})): root}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                directory = pending.pop(future)
+                matched, children, mtime_ns = future.result()
+                files.extend(matched)
+                dir_mtimes[directory] = mtime_ns
+                for child, states in children.items():
+                    pending[executor.submit(_scan_dir, child, parts, states)] = child
+    return files, dir_mtimes
+
+
+def _glob_cache_path(root: str, pattern: str, cache_dir: str) -> str:
+    key = hashlib.sha256(f"{root}\0{pattern}".encode("utf-8")).hexdigest()
+    return os.path.join(os.path.expanduser(cache_dir), "glob", f"{key}.json")
+
+
+def _mtime_ns(path: str) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return -1
+
+
+def _load_glob_cache(cache_path: str, root: str, pattern: str, n_jobs: int):
+    """Return the cached file list if no scanned directory has changed, else ``None``.
+
+    The cache is keyed on the absolute root, but the returned paths start with
+    ``root`` as given.
+    """
+
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (
+        cache.get("version") != _GLOB_CACHE_VERSION
+        or cache.get("root") != os.path.abspath(root)
+        or cache.get("pattern") != pattern
+    ):
+        return None
+
+    dirs = [os.path.join(root, d) if d else root for d in cache["dirs"]]
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        mtimes = list(executor.map(_mtime_ns, dirs))
+    if mtimes != cache["mtimes"]:
+        return None
+    return [os.path.join(root, f) for f in cache["files"]]
+
+
+def _save_glob_cache(cache_path, root, pattern, files, dir_mtimes):
+    cache = {
+        "version": _GLOB_CACHE_VERSION,
+        "root": os.path.abspath(root),
+        "pattern": pattern,
+        "dirs": [os.path.relpath(d, root) if d != root else "" for d in dir_mtimes],
+        "mtimes": list(dir_mtimes.values()),
+        "files": [os.path.relpath(f, root) for f in files],
+    }
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, cache_path)
+
+
+def glob_files(
+    root: str,
+    pattern: str,
+    n_jobs: int = 16,
+    sort: bool = True,
+    cache: bool = False,
+    cache_dir: str = "~/.cache/dl_utils",
+) -> List[str]:
+    """
+    Find the files under ``root`` matching a glob pattern, like ``Path(root).glob``.
+
+    Directories are listed with :func:`os.scandir`, reusing the file type it
+    returns instead of calling ``stat`` on every path, and subtrees are walked in
+    parallel threads, which is much faster on NFS. Only regular files (or
+    symlinks to them) are returned. As with :mod:`pathlib`, ``"**"`` matches
+    any number of directories but does not descend into symlinked ones.
+
+    With ``cache=True`` the result is stored under ``cache_dir`` together with the
+    modification time of every scanned directory. Later calls with the same root
+    and pattern only ``stat`` those directories and return the stored list if
+    none of them changed. Adding, removing or renaming entries changes the
+    modification time of the parent directory, so the cache never misses new
+    files, but it does not notice files whose content changed in place.
+
+    Args:
+        root: Directory to search.
+        pattern: Relative glob pattern, e.g. ``"*.json"`` or ``"**/*.json"``.
+        n_jobs: Number of threads used to list directories.
+        sort: Sort the result by path components, like ``sorted()`` on
+            :class:`pathlib.Path` objects.
+        cache: Whether to reuse and store the listing cache.
+        cache_dir: Cache directory. By default, it is `~/.cache/dl_utils`.
+
+    Returns: A list of matched file paths, each starting with ``root``.
+    """
+    if not pattern or os.path.isabs(pattern):
+        raise ValueError(
+            f"pattern must be a non-empty relative pattern, got {pattern!r}"
+        )
+    parts = tuple(p for p in pattern.replace(os.sep, "/").split("/") if p and p != ".")
+
+    files = None
+    cache_path = (
+        _glob_cache_path(os.path.abspath(root), pattern, cache_dir) if cache else None
+    )
+    if cache:
+        files = _load_glob_cache(cache_path, root, pattern, n_jobs)
+    if files is None:
+        files, dir_mtimes = _walk_glob(root, parts, n_jobs)
+        # "**/**" can reach a file along several state paths
+        files = list(dict.fromkeys(files))
+        if cache:
+            try:
+                _save_glob_cache(cache_path, root, pattern, files, dir_mtimes)
+            except OSError:
+                pass
+
+    if sort:
+        files.sort(key=lambda p: p.split(os.sep))
+    return files
+
+
 __all__ = [
     "list_files",
     "list_files_multithread",
+    "glob_files",
 ]
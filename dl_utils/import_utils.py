@@ -241,6 +241,11 @@ _liger_kernel_available = _is_package_available("liger_kernel")
 _triton_available = _is_package_available("triton")
 _spqr_available = _is_package_available("spqr_quant")
 _rich_available = _is_package_available("rich")
+_orjson_available = _is_package_available("orjson")
+_ujson_available = _is_package_available("ujson")
+_msgspec_available = _is_package_available("msgspec")
+_zstandard_available = _is_package_available("zstandard")
+_msgpack_available = _is_package_available("msgpack")
 _kernels_available = _is_package_available("kernels")
 _matplotlib_available = _is_package_available("matplotlib")
 _mistral_common_available = _is_package_available("mistral_common")
@@ -1497,6 +1502,26 @@ def is_pandas_available():
     return _pandas_available
 
 
+def is_orjson_available():
+    return _orjson_available
+
+
+def is_ujson_available():
+    return _ujson_available
+
+
+def is_msgspec_available():
+    return _msgspec_available
+
+
+def is_zstandard_available():
+    return _zstandard_available
+
+
+def is_msgpack_available():
+    return _msgpack_available
+
+
 def is_sagemaker_dp_enabled():
     # Get the sagemaker specific env variable.
     sagemaker_params = os.getenv("SM_FRAMEWORK_PARAMS", "{}")
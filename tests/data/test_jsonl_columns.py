@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# @Time    : 10/18/26
+# @Author  : Yaojie Shen
+# @Project : Deep-Learning-Utils
+# @File    : test_jsonl_columns.py
+
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from dl_utils import (StringColumn, build_jsonl_columns, load_jsonl_columns,
+                      save_jsonl)
+
+
+def test_load_jsonl_columns_types_and_cache():
+    records = [
+        {"id": f"clip-{i}", "duration": i * 0.5, "frames": i, "ok": i % 2 == 0}
+        for i in range(100)
+    ]
+    records[3]["id"] = "ünïcode"
+    del records[5]["frames"]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "manifest.jsonl"
+        save_jsonl(records, path)
+
+        columns = load_jsonl_columns(path, ["id", "duration", "ok"])
+        assert isinstance(columns["id"], StringColumn)
+        assert len(columns["id"]) == 100
+        assert columns["id"][3] == "ünïcode"
+        assert columns["id"][-1] == "clip-99"
+        assert columns["id"][[0, 2]] == ["clip-0", "clip-2"]
+        assert columns["id"].to_numpy()[10] == "clip-10"
+        assert columns["duration"].dtype == np.float64
+        np.testing.assert_array_equal(columns["duration"], np.arange(100) * 0.5)
+        assert columns["ok"].dtype == np.bool_
+
+        # Adding a field rebuilds the cache with the union of fields
+        frames = load_jsonl_columns(path, ["frames"])["frames"]
+        assert frames.dtype == np.float64 and np.isnan(frames[5])
+        assert frames[6] == 6
+        cache_dir = Path(str(path) + ".columns")
+        meta_mtime = os.stat(cache_dir / "meta.json").st_mtime_ns
+        assert set(load_jsonl_columns(path, ["id", "frames"])) == {"id", "frames"}
+        assert os.stat(cache_dir / "meta.json").st_mtime_ns == meta_mtime
+
+        # The cache is invalidated when the source changes
+        save_jsonl(records[:10], path)
+        assert len(load_jsonl_columns(path, ["id"])["id"]) == 10
+
+
+def test_build_jsonl_columns_rejects_nested_values():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "data.jsonl"
+        save_jsonl([{"a": 1}, {"a": [1, 2]}], path)
+        with pytest.raises(TypeError, match="'a'"):
+            build_jsonl_columns(path, ["a"])
+
+        save_jsonl([{"a": 1}, {"a": "x"}], path)
+        with pytest.raises(TypeError, match="Cannot store"):
+            build_jsonl_columns(path, ["a"])
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+# @Time    : 10/18/26
+# @Author  : Yaojie Shen
+# @Project : Deep-Learning-Utils
+# @File    : test_lmdb.py
+
+import multiprocessing
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from dl_utils import (JsonLmdb, MsgpackLmdb, NdarrayLmdb, PickleLmdb,
+                      ShardedLmdb, build_lmdb, build_lmdb_from_files,
+                      build_lmdb_from_jsonl, save_json, save_jsonl)
+
+
+@pytest.mark.parametrize("cls", [JsonLmdb, PickleLmdb, MsgpackLmdb])
+def test_lmdb_value_codecs_round_trip(cls):
+    if cls is MsgpackLmdb:
+        pytest.importorskip("msgpack")
+    value = {"id": "clip-0", "frames": [1, 2, 3], "ok": True, "score": None}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with cls.open(str(Path(tmpdir) / "db"), "c") as db:
+            db["ünïcode"] = value
+            db.update({"a": 1, "b": "x"})
+            assert db["ünïcode"] == value
+            assert dict(db.items()) == {"ünïcode": value, "a": 1, "b": "x"}
+
+
+def test_ndarray_lmdb_round_trip_and_view():
+    arrays = {
+        "float": np.random.rand(4, 3).astype(np.float32).T,
+        "scalar": np.array(7, dtype=np.int64),
+        "empty": np.zeros((0, 5)),
+        "str": np.array(["ab", "c"]),
+    }
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with NdarrayLmdb.open(str(Path(tmpdir) / "db"), "c") as db:
+            db.update(arrays)
+            for key, expected in arrays.items():
+                loaded = db[key]
+                assert loaded.dtype == expected.dtype
+                np.testing.assert_array_equal(loaded, expected)
+                assert loaded.flags.writeable
+
+            with db.view() as view:
+                array = view["float"]
+                assert not array.flags.writeable
+                assert not array.flags.owndata
+                np.testing.assert_array_equal(array, arrays["float"])
+                assert "str" in view and view.get("missing") is None
+                with pytest.raises(KeyError):
+                    view["missing"]
+
+            with pytest.raises(TypeError, match="dtype object"):
+                db["object"] = np.array([object()])
+
+
+def test_lmdb_put_many_and_get_many():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # A tiny map forces the batches to grow it
+        with JsonLmdb.open(str(Path(tmpdir) / "db"), "c", map_size=2**16) as db:
+            items = ((f"{i:06d}", {"i": i, "text": "x" * 50}) for i in range(3000))
+            assert db.put_many(items, batch_size=500) == 3000
+            assert len(db) == 3000 and db.map_size > 2**16
+
+            # Out-of-order keys, duplicates and overwrite=False
+            assert db.put_many([("000010", 1), ("zzz", 2), ("000010", 3)]) == 2
+            assert db.put_many({"zzz": 4, "new": 5}, overwrite=False) == 1
+            assert db.get_many(["zzz", "000010", "missing", "000002", "new"]) == [
+                2,
+                3,
+                None,
+                {"i": 2, "text": "x" * 50},
+                5,
+            ]
+
+
+def test_build_lmdb_from_jsonl_resumes():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        records = [{"id": f"{i:04d}", "text": "x" * i} for i in range(1000)]
+        save_jsonl(records[:600], base / "data.jsonl")
+
+        kwargs = dict(key="id", batch_size=64, map_size=2**16, progress=False)
+        assert build_lmdb_from_jsonl(base / "data.jsonl", base / "db", **kwargs) == 600
+        # A rerun after more records were added only writes the new ones
+        save_jsonl(records, base / "data.jsonl")
+        assert build_lmdb_from_jsonl(base / "data.jsonl", base / "db", **kwargs) == 400
+        with JsonLmdb.open(str(base / "db")) as db:
+            assert len(db) == 1000 and db["0999"] == records[999]
+
+        # resume=False starts over
+        items = ((r["id"], r["text"]) for r in records[:10])
+        assert build_lmdb(items, base / "db", resume=False, progress=False) == 10
+        with JsonLmdb.open(str(base / "db")) as db:
+            assert len(db) == 10 and db["0009"] == "x" * 9
+
+        # Duplicated keys are handled like put_many
+        items = [("0000", "a"), ("0010", "b"), ("0010", "c")]
+        assert build_lmdb(items, base / "db", progress=False) == 1
+        with JsonLmdb.open(str(base / "db")) as db:
+            assert db["0000"] == "" and db["0010"] == "c"
+        assert build_lmdb(items, base / "db", overwrite=True, progress=False) == 2
+        with JsonLmdb.open(str(base / "db")) as db:
+            assert db["0000"] == "a" and db["0010"] == "c"
+
+
+def test_build_lmdb_from_files():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        for i in range(20):
+            save_json({"i": i}, base / "src" / "json" / f"{i}.json")
+        (base / "src" / "raw.bin").write_bytes(b"\x00\x01")
+
+        n = build_lmdb_from_files(
+            base / "src", base / "db", pattern="**/*", lmdb_cls=PickleLmdb,
+            n_jobs=4, batch_size=8, progress=False,
+        )
+        assert n == 21
+        with PickleLmdb.open(str(base / "db")) as db:
+            assert db["json/7"] == {"i": 7} and db["raw"] == b"\x00\x01"
+        assert build_lmdb_from_files(
+            base / "src", base / "db", pattern="**/*", lmdb_cls=PickleLmdb, progress=False
+        ) == 0
+
+
+def _write_shard(path, rank, keys):
+    with ShardedLmdb.open(path, "c", num_shards=3, shards=[rank]) as store:
+        store.put_many((k, {"k": k}) for k in keys if store.shard_index(k) == rank)
+
+
+def test_sharded_lmdb_parallel_writers():
+    keys = [f"key-{i}" for i in range(300)]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = str(Path(tmpdir) / "store")
+        ctx = multiprocessing.get_context("fork")
+        workers = [ctx.Process(target=_write_shard, args=(path, r, keys)) for r in range(3)]
+        for p in workers:
+            p.start()
+        for p in workers:
+            p.join()
+            assert p.exitcode == 0
+
+        with ShardedLmdb.open(path) as store:
+            assert store.num_shards == 3 and len(store) == 300
+            assert all(len(shard) > 0 for shard in store.shards.values())
+            assert store["key-7"] == {"k": "key-7"}
+            assert store.get_many(["key-9", "nope", "key-1"]) == [
+                {"k": "key-9"},
+                None,
+                {"k": "key-1"},
+            ]
+            assert set(store) == set(keys)
+
+        with ShardedLmdb.open(path, "w", shards=[0]) as store:
+            key = next(k for k in keys if store.shard_index(k) == 1)
+            with pytest.raises(ValueError, match="not open"):
+                store[key] = 1
+            assert key not in store and 7 not in store
+            assert any(k in store for k in keys)
+        with pytest.raises(ValueError, match="3 shards"):
+            ShardedLmdb.open(path, "c", num_shards=4)
+
+
+def test_lmdb_value_cache_invalidated_on_writes():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with JsonLmdb.open(str(Path(tmpdir) / "db"), "c") as db:
+            db.put_many({"a": {"x": 1}, "b": 2, "c": 3})
+            assert db["a"] == {"x": 1}  # Disabled by default
+            assert db.cache_info()["size"] == 0
+
+            db.cache_size = 2
+            for _ in range(3):
+                assert db["a"] == {"x": 1}
+            assert db.get_many(["a", "b", "missing"]) == [{"x": 1}, 2, None]
+            assert db.cache_info() == {"hits": 3, "misses": 3, "maxsize": 2, "size": 2}
+
+            db["a"] = 10
+            db.put_many({"b": 20})
+            assert db["a"] == 10 and db.get_many(["b"]) == [20]
+            del db["a"]
+            assert "a" not in db and db.get("a") is None
+            db.update({"b": 200})
+            assert db["b"] == 200
+
+            # Least recently used keys are evicted first
+            db["c"], db["b"]
+            db["a"] = 1
+            db["a"]
+            assert list(db._cache) == ["b", "a"]
+            db.cache_clear()
+            assert db.cache_info() == {"hits": 0, "misses": 0, "maxsize": 2, "size": 0}
+
+
+def test_lmdb_open_with_cache_size():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = str(Path(tmpdir) / "db")
+        with PickleLmdb.open(path, "c", map_size=2**16, cache_size=8) as db:
+            db.put_many({"a": 1, "b": 2})
+            assert db["a"] == 1 and db["a"] == 1
+            assert db.cache_info() == {"hits": 1, "misses": 1, "maxsize": 8, "size": 1}
+        with PickleLmdb.open(path) as db:
+            assert db.cache_size == 0
+        with ShardedLmdb.open(Path(tmpdir) / "sharded", "c", num_shards=2, cache_size=4) as store:
+            assert all(shard.cache_size == 4 for shard in store.shards.values())
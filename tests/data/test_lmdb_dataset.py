@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# @Time    : 10/18/26
+# @Author  : Yaojie Shen
+# @Project : Deep-Learning-Utils
+# @File    : test_lmdb_dataset.py
+
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from torch.utils.data import DataLoader
+
+from dl_utils import JsonLmdb, LmdbDataset, NdarrayLmdb
+
+
+def _with_pid(value):
+    return value["i"], os.getpid()
+
+
+def test_lmdb_dataset_in_forked_workers():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = str(Path(tmpdir) / "db")
+        with JsonLmdb.open(path, "c") as db:
+            db.put_many((f"{i:04d}", {"i": i}) for i in range(100))
+
+        dataset = LmdbDataset(path, transform=_with_pid)
+        assert len(dataset) == 100
+        # Opened in the parent before forking
+        assert dataset[3] == (3, os.getpid())
+
+        loader = DataLoader(
+            dataset,
+            batch_size=10,
+            num_workers=2,
+            multiprocessing_context="fork",
+            collate_fn=lambda batch: batch,
+        )
+        samples = [sample for batch in loader for sample in batch]
+        assert [i for i, _ in samples] == list(range(100))
+        assert os.getpid() not in {pid for _, pid in samples}
+
+        # Pickling for spawned workers drops the open handles
+        clone = pickle.loads(pickle.dumps(dataset))
+        assert clone._db is None and clone[99][0] == 99
+        dataset.close()
+
+
+def test_lmdb_dataset_with_keys_and_ndarray_values():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = str(Path(tmpdir) / "db")
+        with NdarrayLmdb.open(path, "c") as db:
+            db.put_many({"a": np.arange(3), "b": np.ones((2, 2))})
+
+        dataset = LmdbDataset(path, keys=["b", "a"], lmdb_cls=NdarrayLmdb)
+        np.testing.assert_array_equal(dataset[0], np.ones((2, 2)))
+        np.testing.assert_array_equal(dataset[-1], np.arange(3))
+
+
+def test_lmdb_dataset_value_cache():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = str(Path(tmpdir) / "db")
+        with JsonLmdb.open(path, "c") as db:
+            db.put_many((f"{i:04d}", {"i": i}) for i in range(10))
+
+        dataset = LmdbDataset(path, cache_size=4)
+        assert [dataset[i % 3]["i"] for i in range(6)] == [0, 1, 2, 0, 1, 2]
+        assert dataset._db.cache_info() == {"hits": 3, "misses": 3, "maxsize": 4, "size": 3}
+        assert LmdbDataset(path)._db.cache_size == 0
+        dataset.close()
@@ -4,15 +4,25 @@
 # @Project : Deep-Learning-Utils
 # @File    : test_save_and_load_utils.py
 import json
+import os
+import pickle
+import re
 import tempfile
+import time
 from pathlib import Path
 
+import numpy as np
+import pytest
 from tqdm import tqdm
 
-from dl_utils import (concurrent_file_loader, iter_files, iter_jsonl,
-                      load_bytes, load_files, load_json, load_jsonl,
-                      load_pickle, load_text, save_bytes, save_json,
-                      save_jsonl, save_pickle, save_text)
+from dl_utils import (AsyncSaver, JsonlWriter, ShardedJsonlWriter, aiter_files,
+                      aload_files, available_json_backends, build_jsonl_index,
+                      concurrent_file_loader, get_json_backend, iter_files,
+                      iter_json_array, iter_jsonl, load_bytes, load_files,
+                      load_json, load_jsonl, load_pickle, load_shard_manifest,
+                      load_text, save_bytes, save_json, save_jsonl,
+                      save_jsonl_shards, save_pickle, save_text,
+                      set_json_backend)
 
 
 def test_save_and_load_text():
@@ -241,6 +251,30 @@ def test_save_jsonl_writes_json_array_for_json_suffix():
         ]
 
 
+def test_iter_json_array_streams_elements():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        f = base / "data.json"
+
+        data = [{"i": i, "s": "x" * (i % 7)} for i in range(50)] + [12345, None, []]
+        save_jsonl(data, str(f))
+
+        # Tiny chunks force elements and numbers to span chunk boundaries
+        for chunk_size in (1, 3, 4096):
+            assert list(iter_json_array(f, chunk_size=chunk_size)) == data
+        assert list(iter_json_array(f, max_samples=2)) == data[:2]
+
+        f.write_text(' [ 1 ,\n "a" ]  ')
+        assert list(iter_json_array(f, chunk_size=2)) == [1, "a"]
+
+        f.write_text('{"a": 1}')
+        with pytest.raises(ValueError, match="top-level JSON array"):
+            list(iter_json_array(f))
+        f.write_text("[1 2]")
+        with pytest.raises(ValueError, match="Expected ',' or ']'"):
+            list(iter_json_array(f))
+
+
 def test_load_jsonl_max_samples():
     with tempfile.TemporaryDirectory() as tmpdir:
         base = Path(tmpdir)
@@ -327,3 +361,622 @@ def test_save_and_load_bytes():
         loaded = load_bytes(str(f))
 
         assert loaded == data
+
+
+def test_iter_jsonl_sidecar_index():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        f = base / "data.jsonl"
+        f.write_text('{"a": 1}\n  \n{"a": 2}\n\n{"a": 3}')
+
+        it = iter_jsonl(str(f), index=True)
+        assert len(it) == 3
+        assert it[2] == {"a": 3}
+        index_path = base / "data.jsonl.idx"
+        assert index_path.exists()
+
+        # A fresh view reuses the persisted index
+        assert build_jsonl_index(str(f)) == index_path
+        assert iter_jsonl(str(f), index=True)[1] == {"a": 2}
+
+        # The index is rebuilt when the source changes
+        save_jsonl([{"b": i} for i in range(5)], str(f))
+        it = iter_jsonl(str(f), index=True)
+        assert len(it) == 5
+        assert it[4] == {"b": 4}
+
+
+def test_scan_jsonl_offsets_across_chunks():
+    from dl_utils.data.save_and_load import _scan_jsonl_offsets
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        f = Path(tmpdir) / "data.jsonl"
+        content = b'{"a": 1}\n \t\n\n{"bb": 22}\r\n   {"c": 3}  \n\n'
+        f.write_bytes(content)
+
+        expected = [0, content.index(b'{"bb"'), content.index(b'   {"c"')]
+        for chunk_size in (1, 3, 7, 1 << 20):
+            assert _scan_jsonl_offsets(f, chunk_size=chunk_size).tolist() == expected
+
+
+def test_iter_jsonl_batch_and_negative_indexing():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        f = base / "data.jsonl"
+        data = [{"i": i} for i in range(6)]
+        save_jsonl(data, str(f))
+
+        for use_mmap in (False, True):
+            it = iter_jsonl(str(f), mmap=use_mmap)
+            assert it[-1] == {"i": 5}
+            assert it[1:4] == data[1:4]
+            assert it[::-2] == data[::-2]
+            assert it[[4, 0, -1]] == [data[4], data[0], data[5]]
+            assert it[np.array([2, 2])] == [data[2], data[2]]
+            assert it[[]] == []
+            try:
+                _ = it[[0, 6]]
+                assert False, "Expected IndexError for out-of-range index array"
+            except IndexError:
+                pass
+
+        # Lines are decoded from views over the mapping with every backend
+        for backend in available_json_backends():
+            it = iter_jsonl(str(f), mmap=True, json_backend=backend)
+            assert it[2:5] == data[2:5]
+            assert it[[-1]] == [data[5]]
+
+        it = iter_jsonl(str(f), max_samples=3, mmap=True)
+        assert it[-1] == {"i": 2}
+        assert it[:] == data[:3]
+
+        # Views are picklable, e.g. for DataLoader workers
+        it = iter_jsonl(str(f), index=True, mmap=True)
+        assert it[0] == data[0]
+        assert pickle.loads(pickle.dumps(it))[5] == data[5]
+
+        # Empty files cannot be mapped, but hold no record to read either
+        empty = Path(tmpdir) / "empty.jsonl"
+        empty.write_bytes(b"")
+        it = iter_jsonl(str(empty), mmap=True)
+        assert it[:] == [] and it[[]] == [] and len(it) == 0
+        assert list(it) == [] and list(it.block_shuffle(seed=0)) == []
+
+
+def test_load_jsonl_parallel_keeps_order_and_max_samples():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        f = base / "data.jsonl"
+        data = [{"i": i, "pad": "x" * (i % 7)} for i in range(500)]
+        save_jsonl(data, str(f))
+        with open(f, "a") as fp:
+            fp.write("\n\n")
+
+        assert load_jsonl(str(f), n_jobs=3, min_range_size=64) == data
+        assert load_jsonl(str(f), max_samples=123, n_jobs=3, min_range_size=64) == data[:123]
+        # Small files fall back to single-process decoding
+        assert load_jsonl(str(f), n_jobs=-1) == data
+
+
+def test_json_backends_round_trip():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        data = {"num": 1, "b": b"bytes", "s": "café", 3: [1.5, None], "big": 2**70}
+        expected = {"num": 1, "b": "bytes", "s": "café", "3": [1.5, None], "big": 2**70}
+
+        for backend in available_json_backends():
+            f = base / f"{backend}.json"
+            save_json(data, f, json_backend=backend)
+            assert load_json(f, json_backend=backend) == expected
+            assert load_json(f, json_backend="json") == expected
+
+            f = base / f"{backend}.jsonl"
+            save_jsonl([data, {"i": 2}], f, json_backend=backend)
+            assert load_jsonl(f, json_backend=backend) == [expected, {"i": 2}]
+            assert iter_jsonl(f, json_backend=backend)[-1] == {"i": 2}
+
+
+def test_default_json_backend_keeps_non_finite_floats_and_format():
+    data = {"nan": float("nan"), "inf": float("inf"), "-inf": -float("inf"), "s": "café"}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        save_json(data, base / "data.json")
+        assert (base / "data.json").read_text() == json.dumps(data)
+        save_jsonl([data], base / "data.jsonl")
+        assert (base / "data.jsonl").read_text() == json.dumps(data) + "\n"
+
+        for loaded in (load_json(base / "data.json"), load_jsonl(base / "data.jsonl")[0]):
+            assert np.isnan(loaded["nan"])
+            assert loaded["inf"] == float("inf") and loaded["-inf"] == -float("inf")
+            assert loaded["s"] == "café"
+
+
+def test_set_json_backend():
+    assert get_json_backend() in available_json_backends()
+    previous = get_json_backend()
+    try:
+        set_json_backend("json")
+        assert get_json_backend() == "json"
+        try:
+            set_json_backend("unknown")
+            assert False, "Expected ValueError for an unknown backend"
+        except ValueError:
+            pass
+    finally:
+        set_json_backend(previous)
+
+
+@pytest.mark.parametrize("suffix", [".jsonl.gz", ".jsonl.zst"])
+def test_compressed_jsonl_blocks(suffix):
+    if suffix.endswith(".zst"):
+        pytest.importorskip("zstandard")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        f = base / f"data{suffix}"
+        data = [{"i": i, "text": "x" * (i % 13)} for i in range(300)]
+        save_jsonl(data, f, block_size=256)
+
+        assert (base / f"data{suffix}.idx").exists()
+        it = iter_jsonl(f)
+        assert len(it) == 300
+        assert list(it) == data
+        assert it[0] == data[0]
+        assert it[-1] == data[-1]
+        assert it[[250, 3, 251, 3]] == [data[250], data[3], data[251], data[3]]
+        assert it[100:110] == data[100:110]
+        assert len(iter_jsonl(f, max_samples=5)) == 5
+        assert load_jsonl(f, max_samples=7) == data[:7]
+        assert load_jsonl(f, n_jobs=2, min_range_size=64) == data
+
+        # Without the block index, the table is rebuilt from the compressed stream
+        (base / f"data{suffix}.idx").unlink()
+        it = iter_jsonl(f)
+        assert len(it) == 300
+        assert it[123] == data[123]
+
+
+def test_foreign_gzip_jsonl():
+    import gzip
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        f = Path(tmpdir) / "data.jsonl.gz"
+        # Two gzip members with a line split across them
+        f.write_bytes(gzip.compress(b'{"a": 1}\n\n{"a"') + gzip.compress(b': 2}\n{"a": 3}'))
+
+        it = iter_jsonl(f)
+        assert list(it) == [{"a": 1}, {"a": 2}, {"a": 3}]
+        assert len(it) == 3
+        assert it[1] == {"a": 2}
+        assert it[2] == {"a": 3}
+
+        try:
+            save_jsonl([{"a": 1}], Path(tmpdir) / "data.json.gz")
+            assert False, "Expected ValueError for compressed JSON array output"
+        except ValueError:
+            pass
+
+
+def test_foreign_single_member_gzip_jsonl_is_streamed(monkeypatch):
+    import gzip
+    import tracemalloc
+
+    from dl_utils.data import save_and_load
+
+    data = [{"i": i, "text": "lorem ipsum " * 8} for i in range(100000)]
+    raw = "".join(json.dumps(r) + "\n" for r in data).encode()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # One gzip member for the whole file, as written by the gzip command
+        f = Path(tmpdir) / "data.jsonl.gz"
+        f.write_bytes(gzip.compress(raw))
+
+        # Memory is bounded by the decompressed pieces, not by the file
+        monkeypatch.setattr(save_and_load, "_DECOMPRESS_MAX_LENGTH", 1 << 16)
+        tracemalloc.start()
+        try:
+            head = [r for _, r in zip(range(10), iter_jsonl(f))]
+            assert len(iter_jsonl(f)) == len(data)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert head == data[:10]
+        assert peak < len(raw) // 10
+
+        monkeypatch.setattr(save_and_load, "_JSONL_CACHED_BLOCK_BYTES", 1024)
+        it = iter_jsonl(f)
+        with pytest.warns(UserWarning, match="random access"):
+            assert it[70000] == data[70000]
+        assert it[[99999, 3, 70000]] == [data[99999], data[3], data[70000]]
+        assert it[5:8] == data[5:8]
+        assert it._block_cache == (None, None)
+
+
+def test_sharded_jsonl_writer_and_manifest():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir) / "out"
+        data = [{"i": i} for i in range(25)]
+
+        manifest = save_jsonl_shards(data, base, max_records=10)
+        assert manifest == base / "part.manifest.json"
+        assert sorted(p.name for p in base.glob("part-*.jsonl")) == [
+            "part-00000.jsonl",
+            "part-00001.jsonl",
+            "part-00002.jsonl",
+        ]
+        info = load_json(manifest)
+        assert info["num_records"] == 25
+        assert [s["num_records"] for s in info["shards"]] == [10, 10, 5]
+
+        assert load_shard_manifest(manifest) == [base / f"part-{i:05d}.jsonl" for i in range(3)]
+        assert load_files(manifest, loader=load_jsonl, flatten=True, n_jobs=2) == data
+        assert [len(x) for x in iter_files([manifest], loader=load_jsonl, n_jobs=2)] == [10, 10, 5]
+
+
+def test_sharded_jsonl_writer_rolls_over_by_bytes():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        with ShardedJsonlWriter(base, max_bytes=30, prefix="shard", suffix=".jsonl.gz") as writer:
+            # The manifest lists finished shards while writing
+            writer.write_many({"i": i} for i in range(5))
+            assert load_json(writer.manifest_path)["num_records"] == 4
+
+        info = load_json(base / "shard.manifest.json")
+        assert info["num_records"] == 5
+        assert [s["num_records"] for s in info["shards"]] == [4, 1]
+        assert len(iter_jsonl(base / "shard-00000.jsonl.gz")) == 4
+        assert load_files(base / "shard.manifest.json", loader=load_jsonl, flatten=True) == [
+            {"i": i} for i in range(5)
+        ]
+
+
+def test_async_saver_writes_atomically_and_reports_errors():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+
+        with AsyncSaver(max_workers=2, max_pending=3) as saver:
+            for i in range(20):
+                saver.save_json({"i": i}, base / "json" / f"{i}.json")
+            saver.save_pickle({"k": 1}, base / "obj.pkl")
+            saver.save_bytes(b"raw", base / "raw.bin")
+            saver.save_text("text", base / "a.txt")
+            saver.save_jsonl([{"a": 1}], base / "data.jsonl.gz")
+            saver.flush()
+
+            assert [load_json(base / "json" / f"{i}.json") for i in range(20)] == [
+                {"i": i} for i in range(20)
+            ]
+            assert load_pickle(base / "obj.pkl") == {"k": 1}
+            assert load_bytes(base / "raw.bin") == b"raw"
+            assert load_text(base / "a.txt") == "text"
+            assert list(iter_jsonl(base / "data.jsonl.gz")) == [{"a": 1}]
+            # No temporary files are left behind
+            assert not [p for p in base.rglob("*") if p.name.endswith(".tmp")]
+
+            save_json({"old": True}, base / "keep.json")
+            saver.save_json({"bad": object()}, base / "keep.json")
+            try:
+                saver.flush()
+                assert False, "Expected the background TypeError on flush"
+            except TypeError:
+                pass
+            assert load_json(base / "keep.json") == {"old": True}
+            assert not [p for p in base.rglob("*") if p.name.endswith(".tmp")]
+
+
+def test_save_pickle_out_of_band_is_zero_copy():
+    torch = pytest.importorskip("torch")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "obj.pkl"
+        obj = {
+            "array": np.arange(1000, dtype=np.float32).reshape(10, 100),
+            "strided": np.arange(20)[::2],
+            "tensor": torch.arange(16, dtype=torch.int64),
+            "meta": {"name": "x"},
+        }
+        save_pickle(obj, path, out_of_band=True)
+
+        loaded = load_pickle(path)
+        np.testing.assert_array_equal(loaded["array"], obj["array"])
+        np.testing.assert_array_equal(loaded["strided"], obj["strided"])
+        assert torch.equal(loaded["tensor"], obj["tensor"])
+        assert loaded["meta"] == {"name": "x"}
+        # Buffers are aligned views over a copy-on-write mapping of the file
+        assert loaded["array"].ctypes.data % 64 == 0
+        assert loaded["array"].flags.writeable and not loaded["array"].flags.owndata
+
+        # In-place writes work and never reach the file
+        loaded["tensor"].add_(1)
+        loaded["array"][0] = -1
+        assert torch.equal(loaded["tensor"], obj["tensor"] + 1)
+        reloaded = load_pickle(path)
+        assert torch.equal(reloaded["tensor"], obj["tensor"])
+        np.testing.assert_array_equal(reloaded["array"], obj["array"])
+
+        copied = load_pickle(path, mmap=False)
+        assert copied["array"].flags.writeable
+        np.testing.assert_array_equal(copied["array"], obj["array"])
+
+
+def _load_npy_with_meta(path):
+    array = np.load(path)
+    return {"path": str(path), "arrays": [array, array[:2]]}
+
+
+def test_iter_files_with_processes_uses_shared_memory():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        files = []
+        for i in range(6):
+            path = base / f"{i}.npy"
+            np.save(path, np.full((128, 128), i, dtype=np.float32))
+            files.append(path)
+
+        results = list(
+            iter_files(files, loader=_load_npy_with_meta, n_jobs=2, use_processes=True)
+        )
+
+        assert [r["path"] for r in results] == [str(p) for p in files]
+        for i, result in enumerate(results):
+            big, small = result["arrays"]
+            np.testing.assert_array_equal(big, np.full((128, 128), i, np.float32))
+            np.testing.assert_array_equal(small, np.full((2, 128), i, np.float32))
+            assert big.flags.writeable
+
+
+@pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="requires /dev/shm")
+def test_iter_files_with_processes_releases_shared_memory_on_early_exit():
+    def _segments():
+        return {name for name in os.listdir("/dev/shm") if name.startswith("psm_")}
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        files = []
+        for i in range(8):
+            path = base / f"{i}.npy"
+            np.save(path, np.full((128, 128), i, dtype=np.float32))
+            files.append(path)
+
+        before = _segments()
+        it = iter_files(files, loader=_load_npy_with_meta, n_jobs=2, use_processes=True)
+        for result in it:
+            np.testing.assert_array_equal(
+                result["arrays"][0], np.zeros((128, 128), np.float32)
+            )
+            break
+        it.close()
+
+        assert _segments() - before == set()
+
+
+def _slow_first_loader(path):
+    path = Path(path)
+    if path.name == "0.txt":
+        time.sleep(0.5)
+    return path.read_text()
+
+
+def test_iter_files_unordered_and_inflight_budget():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        files = []
+        for i in range(8):
+            path = base / f"{i}.txt"
+            path.write_text(str(i) * 100)
+            files.append(path)
+
+        unordered = list(
+            iter_files(files, loader=_slow_first_loader, n_jobs=4, ordered=False)
+        )
+        # The slow first file does not hold back the others
+        assert unordered[-1] == "0" * 100
+        assert sorted(unordered) == sorted(p.read_text() for p in files)
+
+        ordered = list(
+            iter_files(files, loader=_slow_first_loader, n_jobs=4, max_inflight=2)
+        )
+        assert ordered == [p.read_text() for p in files]
+
+        # A budget smaller than one file still makes progress
+        assert load_files(files, n_jobs=2, max_inflight_bytes=50) == [
+            p.read_bytes() for p in files
+        ]
+
+        with pytest.raises(ValueError, match="joblib arguments"):
+            list(iter_files(files, ordered=False, backend="threading"))
+
+
+def test_aiter_and_aload_files():
+    import asyncio
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        for i in range(6):
+            save_json([i, i + 100], base / f"{i}.json")
+
+        async def main():
+            items = await aload_files(base, pattern="*.json", loader=load_json, flatten=True)
+            unordered = [
+                x
+                async for x in aiter_files(
+                    base, pattern="*.json", loader=load_json, n_jobs=3, ordered=False
+                )
+            ]
+            # Breaking early cancels the remaining loads
+            async for first in aiter_files(base, pattern="*.json", n_jobs=1):
+                break
+            return items, unordered, first
+
+        items, unordered, first = asyncio.run(main())
+        assert items == [x for i in range(6) for x in (i, i + 100)]
+        assert sorted(unordered) == [[i, i + 100] for i in range(6)]
+        assert first == (base / "0.json").read_bytes()
+
+
+@pytest.mark.parametrize("suffix", [".jsonl", ".jsonl.gz"])
+def test_iter_jsonl_rank_sharding(suffix):
+    data = [{"i": i, "pad": "x" * (i % 13)} for i in range(2000)]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / f"data{suffix}"
+        save_jsonl(data, path, block_size=2048)
+
+        views = [iter_jsonl(path, rank=r, world_size=3) for r in range(3)]
+        assert all(len(v) > 0 for v in views)
+        assert [x for v in views for x in v] == data
+        assert [x for v in views for x in v[:]] == data
+        assert views[1][0] == data[len(views[0])]
+
+        indexed = [iter_jsonl(path, rank=r, world_size=3, index=True) for r in range(3)]
+        assert [len(v) for v in indexed] == [len(v) for v in views]
+
+        with pytest.raises(ValueError):
+            iter_jsonl(path, rank=3, world_size=3)
+
+
+def test_iter_files_rank_sharding(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        for i in range(7):
+            save_json(i, base / f"{i}.json")
+
+        shards = [
+            load_files(base, pattern="*.json", loader=load_json, rank=r, world_size=3)
+            for r in range(3)
+        ]
+        assert shards == [[0, 3, 6], [1, 4], [2, 5]]
+
+        monkeypatch.setenv("RANK", "1")
+        monkeypatch.setenv("WORLD_SIZE", "2")
+        assert list(
+            iter_files(base, pattern="*.json", loader=load_json, distributed=True)
+        ) == [1, 3, 5]
+
+
+@pytest.mark.parametrize("suffix", [".jsonl", ".jsonl.gz"])
+def test_iter_jsonl_state_dict_resumes(suffix):
+    data = [{"i": i, "pad": "x" * (i % 17)} for i in range(500)]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / f"data{suffix}"
+        save_jsonl(data, path, block_size=512)
+
+        for cut in [0, 1, 123, 500]:
+            view = iter_jsonl(path)
+            it = iter(view)
+            head = [next(it) for _ in range(cut)]
+            state = view.state_dict()
+            assert state["count"] == cut
+
+            resumed = iter_jsonl(path)
+            resumed.load_state_dict(state)
+            assert head + list(resumed) == data
+            # The state only applies to the next iteration
+            assert list(resumed) == data
+
+
+def test_iter_files_state_dict_resumes():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        for i in range(5):
+            save_json([i * 10 + k for k in range(3)], base / f"{i}.json")
+        expected = [i * 10 + k for i in range(5) for k in range(3)]
+
+        it = iter_files(base, pattern="*.json", loader=load_json, flatten=True, n_jobs=2)
+        head = [next(it) for _ in range(7)]
+        state = it.state_dict()
+        assert state == {"file_index": 2, "item_index": 1}
+        it.close()
+
+        resumed = iter_files(base, pattern="*.json", loader=load_json, flatten=True)
+        resumed.load_state_dict(state)
+        assert head + list(resumed) == expected
+
+        it = iter_files(base, pattern="*.json", loader=load_json)
+        next(it)
+        assert it.state_dict() == {"file_index": 1, "item_index": 0}
+
+
+@pytest.mark.parametrize("suffix", [".jsonl", ".jsonl.gz"])
+def test_iter_jsonl_block_shuffle(suffix):
+    data = [{"i": i} for i in range(3000)]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / f"data{suffix}"
+        save_jsonl(data, path, block_size=1024)
+        view = iter_jsonl(path, max_samples=2500)
+
+        shuffled = list(view.block_shuffle(seed=0, block_size=64, buffer_size=256))
+        assert sorted(x["i"] for x in shuffled) == list(range(2500))
+        assert shuffled != data[:2500]
+        assert shuffled == list(view.block_shuffle(seed=0, block_size=64, buffer_size=256))
+        assert shuffled != list(view.block_shuffle(seed=1, block_size=64, buffer_size=256))
+
+
+def test_iter_jsonl_where_and_fields():
+    data = [
+        {"id": i, "split": "train" if i % 3 else "val", "flag": i % 2 == 0, "x": None}
+        for i in range(300)
+    ]
+    data[4]["meta"] = {"split": "val"}  # nested key must not match
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "data.jsonl"
+        save_jsonl(data, path)
+        # Other encoders put spaces around separators
+        with open(path, "a") as fp:
+            fp.write(json.dumps({"id": 300, "split": "val", "flag": 1}) + "\n")
+
+        val = list(iter_jsonl(path, where={"split": "val"}, fields=["id"]))
+        assert val == [{"id": i} for i in range(0, 300, 3)] + [{"id": 300}]
+
+        flagged = list(iter_jsonl(path, where={"flag": True}))
+        assert [r["id"] for r in flagged] == list(range(0, 300, 2))
+
+        assert len(list(iter_jsonl(path, where={"x": None, "split": "train"}))) == 200
+        assert [r["id"] for r in iter_jsonl(path, where=rb'"id": ?1\d*,', max_samples=3)] == [
+            1, 10, 11]
+        assert list(iter_jsonl(path, where=lambda r: r["id"] == 7)) == [data[7]]
+        pattern = re.compile(r'"split": ?"VAL"', re.I)
+        # A raw pattern also matches the nested key of record 4
+        assert len(list(iter_jsonl(path, where=pattern))) == 102
+        assert list(iter_jsonl(path, where={"flag": False, "id": 1}, fields=["id"])) == [{"id": 1}]
+
+        view = iter_jsonl(path, where={"split": "val"})
+        with pytest.raises(TypeError):
+            len(view)
+        assert iter_jsonl(path, fields=["split"])[4] == {"split": "train"}
+
+
+@pytest.mark.parametrize("suffix", [".jsonl", ".jsonl.gz"])
+def test_save_jsonl_append_keeps_index_valid(suffix):
+    from dl_utils.data.save_and_load import _load_jsonl_index
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / f"data{suffix}"
+        save_jsonl([{"i": i} for i in range(10)], path)
+        build_jsonl_index(path)
+        index_path = Path(str(path) + ".idx")
+
+        save_jsonl([{"i": i} for i in range(10, 15)], path, append=True)
+        with JsonlWriter(path, buffer_size=64) as writer:
+            for i in range(15, 40):
+                writer.write({"i": i})
+
+        # The index was kept valid, so it is not rebuilt
+        assert _load_jsonl_index(path, index_path) is not None
+        view = iter_jsonl(path, index=True)
+        assert len(view) == 40
+        assert view[[0, 12, 39]] == [{"i": 0}, {"i": 12}, {"i": 39}]
+        assert list(view) == [{"i": i} for i in range(40)]
+
+        with JsonlWriter(path, append=False) as writer:
+            writer.write({"i": -1})
+        assert list(iter_jsonl(path, index=True)) == [{"i": -1}]
+        assert len(iter_jsonl(path)) == 1
+
+
+def test_jsonl_writer_terminates_partial_line():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "data.jsonl"
+        path.write_bytes(b'{"i": 0}')
+        save_jsonl([{"i": 1}], path, append=True)
+        assert load_jsonl(path) == [{"i": 0}, {"i": 1}]
+        with pytest.raises(ValueError):
+            save_jsonl([{"i": 1}], path, append=True, atomic=True)
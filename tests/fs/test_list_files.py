@@ -3,12 +3,15 @@
 # @Author  : Yaojie Shen
 # @Project : Deep-Learning-Utils
 # @File    : test_list_files.py
+import os
+import tempfile
 import time
+from pathlib import Path
 
 from pytest import mark, param, main
 from tqdm import tqdm
 
-from dl_utils import list_files, list_files_multithread
+from dl_utils import glob_files, list_files, list_files_multithread
 
 
 @mark.parametrize(
@@ -34,5 +37,56 @@ def test_list_files(root: str, depth: int):
     print(files)
 
 
+@mark.parametrize("pattern", ["*.json", "**/*.json", "a/*/*.json", "**/b*/**/*.txt", "a/**"])
+def test_glob_files_matches_pathlib(pattern: str):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        root = Path(tmpdir)
+        for rel in ["x.json", "a/y.json", "a/b1/z.json", "a/b1/c/z.txt", "a/b2/w.txt", "d/b3/v.txt", ".h.json"]:
+            (root / rel).parent.mkdir(parents=True, exist_ok=True)
+            (root / rel).write_text("{}")
+        os.symlink(root / "a", root / "link")
+
+        expected = sorted(p for p in root.glob(pattern) if p.is_file())
+        assert [Path(p) for p in glob_files(str(root), pattern, n_jobs=4)] == expected
+
+
+def test_glob_files_cache_is_invalidated_by_directory_changes():
+    with tempfile.TemporaryDirectory() as tmpdir, tempfile.TemporaryDirectory() as cache_dir:
+        root = Path(tmpdir)
+        (root / "a" / "b").mkdir(parents=True)
+        (root / "a" / "b" / "1.json").write_text("{}")
+
+        first = glob_files(str(root), "**/*.json", cache=True, cache_dir=cache_dir)
+        assert first == [str(root / "a" / "b" / "1.json")]
+        assert glob_files(str(root), "**/*.json", cache=True, cache_dir=cache_dir) == first
+
+        time.sleep(0.01)
+        (root / "a" / "b" / "2.json").write_text("{}")
+        assert len(glob_files(str(root), "**/*.json", cache=True, cache_dir=cache_dir)) == 2
+
+
+def test_glob_files_cache_returns_paths_relative_to_given_root():
+    with tempfile.TemporaryDirectory() as tmpdir, tempfile.TemporaryDirectory() as cache_dir:
+        root = Path(tmpdir)
+        (root / "a").mkdir()
+        (root / "a" / "1.json").write_text("{}")
+        (root / "2.json").write_text("{}")
+
+        cwd = os.getcwd()
+        os.chdir(root.parent)
+        try:
+            rel_root = os.path.join(".", root.name)
+            expected = glob_files(rel_root, "**/*.json", cache=False)
+            assert expected == [os.path.join(rel_root, "2.json"), os.path.join(rel_root, "a", "1.json")]
+            # First call fills the cache, the second one reads it
+            for _ in range(2):
+                assert glob_files(rel_root, "**/*.json", cache=True, cache_dir=cache_dir) == expected
+            assert glob_files(str(root), "**/*.json", cache=True, cache_dir=cache_dir) == [
+                str(root / "2.json"), str(root / "a" / "1.json")
+            ]
+        finally:
+            os.chdir(cwd)
+
+
 if __name__ == '__main__':
     main()